@@ -35,15 +35,34 @@ from schemas.unifmu_fmi2_pb2 import (
 )
 
 from model import Model
+from profiling import BackendProfiler
+import session_protocol
 
 
+class ProfilingInterceptor(grpc.ServerInterceptor):
+    """Runs every unary command handler under the backend profiler."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+        behavior = handler.unary_unary
+        return grpc.unary_unary_rpc_method_handler(
+            lambda request, context: self.profiler.call(behavior, request, context),
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
 
 
 class CommandServicer(SendCommandServicer):
-    def __init__(self, fmu):
+    def __init__(self, fmu, profiler=None):
         super().__init__()
         logger.info(f"Created python grpc slave")
         self.fmu = fmu
+        self.profiler = profiler
 
     ##### REAL #####
     def Fmi2SetReal(self, request, context):
@@ -160,6 +179,9 @@ class CommandServicer(SendCommandServicer):
     #### Free Instance ####
     def Fmi2FreeInstance(self, request, context):
         logger.info(f"FreeInstance called on slave")
+        if self.profiler is not None:
+            self.profiler.dump("free_instance")
+            self.profiler.stop()
         server.stop(None)
         return StatusReturn(status=FmiStatus.Ok)
 
@@ -176,6 +198,49 @@ class CommandServicer(SendCommandServicer):
         return StatusReturn(status=status)
 
 
+class SessionServicer:
+    """Serves all commands of an instance over one bidirectional stream, see session_protocol.py.
+
+    Commands are dispatched to the unary CommandServicer methods in the order they arrive.
+    FreeInstance is answered first and the server is only stopped once the host closes
+    its side of the stream, so the last reply is not lost.
+    """
+
+    def __init__(self, servicer, profiler=None):
+        self.servicer = servicer
+        self.profiler = profiler
+
+    def Session(self, request_iterator, context):
+        logger.info(f"Session opened on slave")
+        free_instance = None
+        for tag, request in request_iterator:
+            name = session_protocol.SESSION_COMMANDS[tag][0]
+            if name == "Fmi2FreeInstance":
+                free_instance = request
+                yield tag, StatusReturn(status=FmiStatus.Ok)
+                continue
+            method = getattr(self.servicer, name)
+            if self.profiler is not None:
+                reply = self.profiler.call(method, request, context)
+            else:
+                reply = method(request, context)
+            yield tag, reply
+        logger.info(f"Session closed on slave")
+        if free_instance is not None:
+            self.servicer.Fmi2FreeInstance(free_instance, context)
+
+
+def add_SessionServicer_to_server(servicer, server):
+    handler = grpc.stream_stream_rpc_method_handler(
+        servicer.Session,
+        request_deserializer=session_protocol.decode_command,
+        response_serializer=session_protocol.encode,
+    )
+    server.add_generic_rpc_handlers(
+        (grpc.method_handlers_generic_handler(session_protocol.SESSION_SERVICE, {session_protocol.SESSION_METHOD: handler}),)
+    )
+
+
 if __name__ == "__main__":
 
     parser = ArgumentParser()
@@ -211,8 +276,17 @@ if __name__ == "__main__":
 
     slave = Model(reference_to_attr)
 
-    server = grpc.server(futures.ThreadPoolExecutor())
-    add_SendCommandServicer_to_server(CommandServicer(slave), server)
+    # opt-in profiling of the command handlers, see profiling.py
+    profiler = BackendProfiler.from_environment()
+    interceptors = []
+    if profiler is not None:
+        profiler.start(profile_current_thread=False)
+        interceptors.append(ProfilingInterceptor(profiler))
+
+    server = grpc.server(futures.ThreadPoolExecutor(), interceptors=interceptors)
+    command_servicer = CommandServicer(slave, profiler)
+    add_SendCommandServicer_to_server(command_servicer, server)
+    add_SessionServicer_to_server(SessionServicer(command_servicer, profiler), server)
     port = str(server.add_insecure_port(command_endpoint))
     server.start()
     logger.info(f"Started fmu slave on port: {port}")
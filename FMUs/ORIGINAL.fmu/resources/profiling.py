@@ -0,0 +1,165 @@
+"""Opt-in profiling of the backend command loop.
+
+The backend is started by UniFMU from the extracted FMU, so the profiler is
+configured from the environment or from a ``[profiling]`` table in
+``launch.toml`` (environment variables take precedence):
+
+    UNIFMU_PROFILE              "cprofile" (deterministic) or "sampling"
+    UNIFMU_PROFILE_DIR          directory where snapshots are written
+    UNIFMU_PROFILE_TRACEMALLOC  "1" to record allocation snapshots as well
+    UNIFMU_PROFILE_INTERVAL     sampling period in seconds (sampling mode)
+
+```toml
+[profiling]
+mode = "sampling"
+output_dir = "C:/profiles"
+tracemalloc = true
+interval = 0.005
+```
+
+Snapshots are written on FreeInstance and whenever the process receives
+SIGUSR1 (SIGBREAK on Windows).
+"""
+
+import collections
+import cProfile
+import logging
+import os
+import signal
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+
+logger = logging.getLogger(__file__)
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+
+def _read_launch_config(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    try:
+        import tomllib
+
+        with open(path, "rb") as f:
+            return tomllib.load(f).get("profiling", {})
+    except ImportError:
+        pass
+    try:
+        import toml
+
+        return toml.load(path).get("profiling", {})
+    except ImportError:
+        logger.warning("unable to read [profiling] from launch.toml, neither 'tomllib' nor 'toml' is available")
+        return {}
+
+
+class BackendProfiler:
+    """Wraps cProfile, a stack sampler and tracemalloc behind one start/dump/stop interface."""
+
+    def __init__(self, mode: str, output_dir, trace_malloc: bool = False, interval: float = 0.005) -> None:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"unknown profiling mode '{mode}', expected one of {PROFILE_MODES}")
+        self.mode = mode
+        self.output_dir = Path(output_dir)
+        self.trace_malloc = trace_malloc
+        self.interval = interval
+        self._profile = cProfile.Profile() if mode == "cprofile" else None
+        self._profile_lock = threading.RLock()
+        self._stacks = collections.Counter()
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._n_dumps = 0
+        self._profiling_thread = False
+
+    @classmethod
+    def from_environment(cls, launch_toml=Path("launch.toml")):
+        """Return a profiler configured from the environment/launch.toml, or None if profiling is off."""
+        config = _read_launch_config(Path(launch_toml))
+        mode = os.environ.get("UNIFMU_PROFILE", config.get("mode", "")).strip().lower()
+        if mode in ("", "0", "off", "none", "false"):
+            return None
+        output_dir = os.environ.get("UNIFMU_PROFILE_DIR", config.get("output_dir", "profiles"))
+        trace_malloc = os.environ.get("UNIFMU_PROFILE_TRACEMALLOC", str(config.get("tracemalloc", False)))
+        interval = float(os.environ.get("UNIFMU_PROFILE_INTERVAL", config.get("interval", 0.005)))
+        return cls(mode, output_dir, trace_malloc.strip().lower() in ("1", "true", "yes", "on"), interval)
+
+    # --------- lifecycle --------------
+    def start(self, profile_current_thread: bool = True) -> None:
+        """Start profiling.
+
+        In cprofile mode the calling thread is profiled until stop() when profile_current_thread is set,
+        otherwise only the functions invoked through call() are profiled.
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.trace_malloc:
+            tracemalloc.start(25)
+        if self.mode == "cprofile" and profile_current_thread:
+            self._profiling_thread = True
+            self._profile.enable()
+        elif self.mode == "sampling":
+            self._sampler = threading.Thread(target=self._sample_loop, name="unifmu-profiler", daemon=True)
+            self._sampler.start()
+
+        dump_signal = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+        if dump_signal is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(dump_signal, lambda signum, frame: self.dump("signal"))
+
+        logger.info(f"profiling backend in '{self.mode}' mode, snapshots are written to {self.output_dir.resolve()}")
+
+    def stop(self) -> None:
+        if self.mode == "cprofile":
+            self._profiling_thread = False
+            self._profile.disable()
+        else:
+            self._stop_sampling.set()
+            if self._sampler is not None:
+                self._sampler.join()
+        if self.trace_malloc:
+            tracemalloc.stop()
+
+    def call(self, function, *args, **kwargs):
+        """Invoke function under the deterministic profiler, used for calls dispatched on worker threads."""
+        if self.mode != "cprofile":
+            return function(*args, **kwargs)
+        with self._profile_lock:
+            return self._profile.runcall(function, *args, **kwargs)
+
+    # --------- snapshots --------------
+    def dump(self, reason: str) -> None:
+        """Write the profile collected so far (and an allocation snapshot) to the output directory."""
+        self._n_dumps += 1
+        stem = self.output_dir / f"backend_{os.getpid()}_{self._n_dumps:03d}_{reason}"
+
+        if self.mode == "cprofile":
+            with self._profile_lock:
+                # dump_stats() disables the profiler, resume it when the loop thread is being profiled
+                self._profile.dump_stats(f"{stem}.prof")
+                if self._profiling_thread:
+                    self._profile.enable()
+            logger.info(f"profile written to {stem}.prof")
+        else:
+            stacks = dict(self._stacks)
+            with open(f"{stem}.folded", "w") as f:
+                for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"sampled stacks written to {stem}.folded")
+
+        if self.trace_malloc and tracemalloc.is_tracing():
+            tracemalloc.take_snapshot().dump(f"{stem}.tracemalloc")
+            logger.info(f"allocation snapshot written to {stem}.tracemalloc")
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop_sampling.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                    frame = frame.f_back
+                # collapsed format understood by flamegraph.pl and speedscope
+                self._stacks[";".join(reversed(stack))] += 1
@@ -1,5 +1,7 @@
 import json
 import logging
+import os
+import pickle
 import sys
 import xml.etree.ElementTree as ET
 from argparse import ArgumentParser
@@ -20,6 +22,28 @@ except ImportError:
 
 from fmi2 import Fmi2Status, Fmi2FMU
 from model import Model
+from profiling import BackendProfiler
+
+
+def receive_command(socket, pipelined):
+    """Receive the next command, returning the routing envelope (None for REP sockets) and the command.
+
+    A ROUTER socket receives [identity, b"", payload] from a REQ peer and
+    [identity, b"", sequence_number, payload] from a pipelining DEALER peer.
+    The envelope is echoed back unchanged so both kinds of peers get their reply.
+    """
+    if not pipelined:
+        return None, socket.recv_pyobj()
+    *envelope, payload = socket.recv_multipart()
+    return envelope, pickle.loads(payload)
+
+
+def send_reply(socket, envelope, result):
+    if envelope is None:
+        socket.send_pyobj(result)
+    else:
+        socket.send_multipart(envelope + [pickle.dumps(result, pickle.DEFAULT_PROTOCOL)])
+
 
 if __name__ == "__main__":
 
@@ -46,10 +70,14 @@ if __name__ == "__main__":
         else "tcp://127.0.0.1:0"
     )
 
+    # commands are answered strictly in arrival order; with UNIFMU_ZMQ_PIPELINE=1 a ROUTER socket
+    # lets the host queue several commands without waiting for each reply
+    pipelined = os.environ.get("UNIFMU_ZMQ_PIPELINE", "0").lower() in ("1", "true", "yes")
+
     # initializing message queue
     context = zmq.Context()
     handshake_socket = context.socket(zmq.PUSH)
-    command_socket = context.socket(zmq.REP)
+    command_socket = context.socket(zmq.ROUTER if pipelined else zmq.REP)
     logger.info(f"hanshake endpoint received: {args.handshake_endpoint}")
     handshake_socket.connect(f"{args.handshake_endpoint}")
 
@@ -95,21 +123,29 @@ if __name__ == "__main__":
         16: slave.get_xxx_status,
     }
 
+    # opt-in profiling of the event loop, see profiling.py
+    profiler = BackendProfiler.from_environment()
+    if profiler is not None:
+        profiler.start()
+
     # event loop
     while True:
 
         logger.info(f"slave waiting for command")
 
-        kind, *args = command_socket.recv_pyobj()
+        envelope, (kind, *args) = receive_command(command_socket, pipelined)
 
         logger.info(f"received command of kind {kind} with args: {args}")
 
         if kind in command_to_slave_methods:
             result = command_to_slave_methods[kind](*args)
             logger.info(f"returning value: {result}")
-            command_socket.send_pyobj(result)
+            send_reply(command_socket, envelope, result)
 
         elif kind == 2:
             logger.debug("freeing instance")
-            command_socket.send_pyobj(None)
+            if profiler is not None:
+                profiler.dump("free_instance")
+                profiler.stop()
+            send_reply(command_socket, envelope, None)
             sys.exit(0)
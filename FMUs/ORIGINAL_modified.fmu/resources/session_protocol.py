@@ -0,0 +1,56 @@
+"""Framing of the bidirectional streaming session of the grpc backend.
+
+Besides the unary SendCommand methods, the grpc backend serves one stream-stream method,
+/fmi2_proto.SendCommand/Session, that carries every command of an instance over a single
+HTTP/2 stream. Each message is a tagged union: one tag byte followed by the serialized
+protobuf message of the unary method with the same name. The tag is the index in
+SESSION_COMMANDS, replies carry the tag of the command they answer.
+
+This module is imported by backend_grpc.py and by host-side clients (UniFMU/grpc_session.py),
+so both ends always agree on the tags.
+"""
+
+from schemas import unifmu_fmi2_pb2 as pb2
+
+SESSION_SERVICE = "fmi2_proto.SendCommand"
+SESSION_METHOD = "Session"
+
+# (SendCommand method, request message, reply message), the index is the tag on the wire
+SESSION_COMMANDS = (
+    ("Fmi2SetReal", pb2.SetReal, pb2.StatusReturn),
+    ("Fmi2GetReal", pb2.GetXXX, pb2.GetRealReturn),
+    ("Fmi2SetInteger", pb2.SetInteger, pb2.StatusReturn),
+    ("Fmi2GetInteger", pb2.GetXXX, pb2.GetIntegerReturn),
+    ("Fmi2SetBoolean", pb2.SetBoolean, pb2.StatusReturn),
+    ("Fmi2GetBoolean", pb2.GetXXX, pb2.GetBooleanReturn),
+    ("Fmi2SetString", pb2.SetString, pb2.StatusReturn),
+    ("Fmi2GetString", pb2.GetXXX, pb2.GetStringReturn),
+    ("Fmi2DoStep", pb2.DoStep, pb2.StatusReturn),
+    ("Fmi2SetDebugLogging", pb2.SetDebugLogging, pb2.StatusReturn),
+    ("Fmi2SetupExperiment", pb2.SetupExperiment, pb2.StatusReturn),
+    ("Fmi2EnterInitializationMode", pb2.EnterInitializationMode, pb2.StatusReturn),
+    ("Fmi2ExitInitializationMode", pb2.ExitInitializationMode, pb2.StatusReturn),
+    ("Fmi2CancelStep", pb2.CancelStep, pb2.StatusReturn),
+    ("Fmi2Terminate", pb2.Terminate, pb2.StatusReturn),
+    ("Fmi2Reset", pb2.Reset, pb2.StatusReturn),
+    ("Fmi2FreeInstance", pb2.FreeInstance, pb2.StatusReturn),
+    ("Serialize", pb2.SerializeMessage, pb2.SerializeReturn),
+    ("Deserialize", pb2.DeserializeMessage, pb2.StatusReturn),
+)
+
+SESSION_TAGS = {name: tag for tag, (name, _, _) in enumerate(SESSION_COMMANDS)}
+
+
+def encode(frame) -> bytes:
+    tag, message = frame
+    return bytes((tag,)) + message.SerializeToString()
+
+
+def decode_command(data: bytes):
+    tag = data[0]
+    return tag, SESSION_COMMANDS[tag][1].FromString(data[1:])
+
+
+def decode_reply(data: bytes):
+    tag = data[0]
+    return tag, SESSION_COMMANDS[tag][2].FromString(data[1:])
@@ -1,6 +1,7 @@
 # noinspection PyPep8
 
 from fmpy import read_model_description, extract, fmi_info, dump
+from fmpy.fmi1 import _FMU
 from fmpy.fmi2 import FMU2Slave
 from fmpy.model_description import ModelDescription
 import numpy as np
@@ -13,13 +14,15 @@ from typing import Union, Any, Dict, Sequence, Callable
 from fmpy.simulation import SimulationResult
 
 def export_model_description(model_description: ModelDescription, filename: str):
-    df = pd.DataFrame(columns=["name","causality","reference","start_value","description"])
-    for i,variable in enumerate(model_description.modelVariables):
-        df.loc[i,"name"] = variable.name
-        df.loc[i,"causality"] = variable.causality
-        df.loc[i,"reference"] = variable.valueReference
-        df.loc[i,"start_value"] = variable.start   
-        df.loc[i,"description"] = variable.description   
+    # one pass over the variables, the frame is built from whole columns
+    variables = model_description.modelVariables
+    df = pd.DataFrame({
+        "name": [v.name for v in variables],
+        "causality": [v.causality for v in variables],
+        "reference": [v.valueReference for v in variables],
+        "start_value": [v.start for v in variables],
+        "description": [v.description for v in variables],
+    })
 
     assert filename.lower().endswith((".csv",".xls",".xlsx")),\
     f"Wrong file extension for saving model description, the expected formats are: '.csv' o '.xls' o '.xlsx', but got: '.{filename.rsplit('.')[-1]}'"
@@ -48,20 +51,71 @@ def simulateCS_custom(model_description: ModelDescription,
                validate: bool = True, 
                initialize: bool = True, 
                terminate: bool = True, 
-               set_stop_time: bool = True) -> SimulationResult:
+               set_stop_time: bool = True,
+               recorder=None,
+               input_schedule=None,
+               skip_unchanged_steps: bool = False,
+               adaptive: bool = False,
+               min_step: float = None,
+               max_step: float = None,
+               adaptive_rtol: float = 1e-3,
+               adaptive_atol: float = 1e-6) -> SimulationResult:
+    """Co-simulation of an instantiated FMU, the loop of fmpy.simulation.simulateCS on a caller-owned instance.
+
+    recorder replaces the default FMPy Recorder, e.g. a BoundedRecorder that decimates or
+    spills to a result sink; it must be bound to the same fmu. It samples after every step,
+    thinned out by its own decimation policy, so output_interval cannot be combined with it.
+
+    input_schedule (an InputSchedule of UniFMU/input_schedule.py) replaces input_signals:
+    it is bound to fmu and sets all its signals with one setReal() per step. input_signals
+    go through FMPy's Input, which calls the C API of FMPy's own FMU classes, so an FMU that
+    is not one of them (e.g. inprocess_fmu.InProcessFMU2Slave) needs input_schedule.
+
+    skip_unchanged_steps=True does not call doStep() for steps whose Real inputs equal
+    those of the last executed step, the recorder holds the previous values instead. This
+    is only valid for FMUs whose outputs are an algebraic function of their inputs, which
+    UniFMU FMUs declare with a VendorAnnotation (see inprocess_fmu.declares_step_skipping).
+    The number of steps and skipped steps is returned in result.step_statistics.
+
+    adaptive=True varies the communication step between min_step and max_step (default
+    step_size / 100 and step_size * 100), see adaptive_step_loop(). The accepted and
+    rejected step counts are returned in result.step_statistics.
+    """
 
     if set_input_derivatives and not model_description.coSimulation.canInterpolateInputs:
         raise Exception("Parameter set_input_derivatives is True but the FMU cannot interpolate inputs.")
 
+    if recorder is not None and output_interval is not None:
+        raise Exception("output_interval is ignored by a custom recorder, use its decimation "
+                        "(e.g. BoundedRecorder(decimation='every', k=...)) instead.")
+
     if output_interval is None:
         output_interval = auto_interval(stop_time - start_time)
 
+    if input_signals is not None and input_schedule is None and not isinstance(fmu, _FMU):
+        raise Exception(f"input_signals need an FMPy FMU instance, {type(fmu).__name__} is not one. "
+                        "Pass the inputs as input_schedule=InputSchedule(...) (UniFMU/input_schedule.py) instead.")
+
+    if skip_unchanged_steps and model_description.fmiVersion != '2.0':
+        raise Exception("Step skipping is only implemented for FMI 2.0.")
+
+    if adaptive:
+        if model_description.fmiVersion != '2.0':
+            raise Exception("Adaptive step control is only implemented for FMI 2.0.")
+        if not model_description.coSimulation.canGetAndSetFMUstate:
+            raise Exception("Parameter adaptive is True but the FMU cannot get and set its state.")
+        if not model_description.coSimulation.canHandleVariableCommunicationStepSize:
+            raise Exception("Parameter adaptive is True but the FMU cannot handle a variable communication step size.")
+
     sim_start = current_time()
 
     is_fmi1 = model_description.fmiVersion == '1.0'
     is_fmi2 = model_description.fmiVersion == '2.0'
 
-    input = Input(fmu=fmu, modelDescription=model_description, signals=input_signals, set_input_derivatives=set_input_derivatives)
+    if input_schedule is not None:
+        input = input_schedule if input_schedule.fmu is fmu else input_schedule.bind(fmu, model_description)
+    else:
+        input = Input(fmu=fmu, modelDescription=model_description, signals=input_signals, set_input_derivatives=set_input_derivatives)
 
     time = start_time
 
@@ -102,15 +156,36 @@ def simulateCS_custom(model_description: ModelDescription,
         raise Exception("The start values for the following variables could not be set: " +
                         ', '.join(start_values.keys()))
 
-    recorder = Recorder(fmu=fmu, modelDescription=model_description, variableNames=output, interval=output_interval)
+    if recorder is None:
+        recorder = Recorder(fmu=fmu, modelDescription=model_description, variableNames=output, interval=output_interval)
+
+    if adaptive:
+        statistics = adaptive_step_loop(model_description, fmu, input, recorder, time, stop_time, step_size,
+                                        min_step=step_size / 100 if min_step is None else min_step,
+                                        max_step=step_size * 100 if max_step is None else max_step,
+                                        rtol=adaptive_rtol, atol=adaptive_atol, timeout=timeout,
+                                        step_finished=step_finished)
+        if terminate:
+            fmu.terminate()
+        result = recorder.result()
+        result.step_statistics = statistics
+        return result
 
     n_steps = time / step_size
 
     terminate_simulation = False
 
+    input_vrs = [v.valueReference for v in model_description.modelVariables if v.causality == 'input' and v.type == 'Real']
+    stepped_inputs = None  # Real inputs of the last executed doStep()
+    held = False
+    n_taken = n_skipped = 0
+
     # simulation loop
     while True:
-        recorder.sample(time)
+        if held:
+            hold_sample(recorder, time)
+        else:
+            recorder.sample(time)
 
         if timeout is not None and (current_time() - sim_start) > timeout:
             break
@@ -118,7 +193,18 @@ def simulateCS_custom(model_description: ModelDescription,
         if terminate_simulation or time >= stop_time:
             break
 
-        input.apply(time)
+        if not skip_unchanged_steps:
+            input.apply(time)
+        elif input_schedule is not None:
+            inputs, _ = input.apply_if_changed(time)
+        elif input_signals is None:
+            inputs = ()  # nothing changes the inputs during the run
+        else:
+            input.apply(time)
+            inputs = fmu.getReal(input_vrs)
+
+        if skip_unchanged_steps:
+            held = stepped_inputs is not None and np.array_equal(inputs, stepped_inputs)
 
         if is_fmi1:
 
@@ -133,12 +219,20 @@ def simulateCS_custom(model_description: ModelDescription,
         elif is_fmi2:
 
             try:
-                if time + step_size <= stop_time:
+                if held:
+                    n_skipped += 1
+                elif time + step_size <= stop_time:
                     fmu.doStep(currentCommunicationPoint=time, communicationStepSize=step_size)
+                else:
+                    fmu.doStep(currentCommunicationPoint=time, communicationStepSize=stop_time - time)
+                n_taken += 1
+                if skip_unchanged_steps:
+                    stepped_inputs = inputs
+
+                if time + step_size <= stop_time:
                     n_steps += 1
                     time = n_steps * step_size
                 else:
-                    fmu.doStep(currentCommunicationPoint=time, communicationStepSize=stop_time - time)
                     time = stop_time
             except FMICallException as e:
                 if e.status == fmi2Discard:
@@ -195,7 +289,635 @@ def simulateCS_custom(model_description: ModelDescription,
     if terminate:
         fmu.terminate()
 
-    return recorder.result()
+    result = recorder.result()
+    if skip_unchanged_steps:
+        result.step_statistics = {'steps': n_taken, 'skipped': n_skipped}
+    return result
+
+
+def hold_sample(recorder, time):
+    """Record the previous sample again at time, without reading the FMU."""
+    if hasattr(recorder, 'hold'):
+        recorder.hold(time)
+    else:
+        recorder.rows.append((time,) + recorder.rows[-1][1:])
+
+
+def adaptive_step_loop(model_description: ModelDescription, fmu, input: Input, recorder, start_time: float,
+                       stop_time: float, step_size: float, min_step: float, max_step: float,
+                       rtol: float = 1e-3, atol: float = 1e-6, timeout: float = None,
+                       step_finished: Callable[[float, Recorder], bool] = None) -> Dict[str, Any]:
+    """Simulation loop with step doubling: every step of size h is also taken as two steps of h/2.
+
+    The difference of the Real outputs after both, scaled by atol + rtol * |y|, estimates the
+    local error. A step with an error above 1 is rolled back with setFMUstate and retried
+    with a smaller h; an accepted step keeps the more accurate half-step result and h
+    grows or shrinks with the error, always within [min_step, max_step]. A step that is
+    still too inaccurate at min_step is accepted anyway.
+
+    An accepted step costs three doStep() calls, so this pays off when the outputs are
+    smooth enough for steps well above three times the fixed step size. Returns the step
+    statistics.
+    """
+    error_vrs = [v.valueReference for v in model_description.modelVariables
+                 if v.causality == 'output' and v.type == 'Real']
+
+    def error_norm(y_full, y_half):
+        if not error_vrs:
+            return 0.0
+        y_full, y_half = np.asarray(y_full), np.asarray(y_half)
+        return float(np.max(np.abs(y_full - y_half) / (atol + rtol * np.abs(y_half))))
+
+    statistics = {'accepted': 0, 'rejected': 0, 'min_step_accepted': 0, 'smallest_step': np.inf, 'largest_step': 0.0}
+    sim_start = current_time()
+    time = start_time
+    h = min(max(step_size, min_step), max_step)
+    recorder.sample(time)
+
+    while time < stop_time:
+
+        if timeout is not None and (current_time() - sim_start) > timeout:
+            break
+
+        # the last step ends exactly on stop_time, also when it is shorter than min_step
+        h_step = min(h, stop_time - time)
+        state = fmu.getFMUstate()
+        try:
+            input.apply(time)
+            fmu.doStep(currentCommunicationPoint=time, communicationStepSize=h_step)
+            y_full = fmu.getReal(error_vrs) if error_vrs else []
+
+            fmu.setFMUstate(state)
+            input.apply(time)
+            fmu.doStep(currentCommunicationPoint=time, communicationStepSize=h_step / 2)
+            input.apply(time + h_step / 2)
+            fmu.doStep(currentCommunicationPoint=time + h_step / 2, communicationStepSize=h_step / 2)
+            y_half = fmu.getReal(error_vrs) if error_vrs else []
+
+            error = error_norm(y_full, y_half)
+            accepted = error <= 1.0 or h_step <= min_step
+            if not accepted:
+                fmu.setFMUstate(state)
+        finally:
+            fmu.freeFMUstate(state)
+
+        # the error of step doubling shrinks with at least h^2, the exponent is kept conservative
+        factor = 0.9 * error ** -0.5 if error > 0 else 5.0
+        h = min(max(h_step * min(max(factor, 0.2), 5.0), min_step), max_step)
+
+        if not accepted:
+            statistics['rejected'] += 1
+            continue
+
+        statistics['accepted'] += 1
+        statistics['min_step_accepted'] += error > 1.0
+        statistics['smallest_step'] = min(statistics['smallest_step'], h_step)
+        statistics['largest_step'] = max(statistics['largest_step'], h_step)
+        time = stop_time if stop_time - (time + h_step) < 1e-12 * max(1.0, abs(stop_time)) else time + h_step
+        recorder.sample(time)
+
+        if step_finished is not None and not step_finished(time, recorder):
+            break
+
+    return statistics
+
+
+class BoundedRecorder:
+    """Drop-in replacement for FMPy's Recorder with preallocated buffers and decimation.
+
+    FMPy's Recorder keeps one tuple per sample for the whole run. This recorder writes the
+    samples into a preallocated float64 block of capacity rows and thins them out with
+    one of the decimation policies:
+
+        None        every sample
+        "every"     every k-th sample
+        "minmax"    per window of k samples, one row with the minimum of every variable at
+                    the time of the window's first sample and one with the maximum at the
+                    time of its last sample (an envelope, the extremes of different
+                    variables may occur at different times)
+        "deadband"  a sample whenever a variable moved more than tolerance (a scalar or
+                    one value per variable) away from its last recorded value
+
+    Samples passed with force=True (events, FMU-terminated) and the last sample of the run
+    are always kept. When the block is full it is handed to sink (anything with a
+    write(block) method such as the sinks of UniFMU/result_sinks.py, whose columns are
+    ["time"] + variable names) and reused, so memory stays bounded; without a sink the
+    block grows. result() returns a SimulationResult of the rows still held in memory,
+    with a sink the complete run is in the sink.
+
+    Only scalar variables are supported.
+    """
+
+    POLICIES = (None, "every", "minmax", "deadband")
+
+    def __init__(self, fmu, modelDescription, variableNames=None, capacity: int = 65536,
+                 decimation: str = None, k: int = 1, tolerance=0.0, sink=None):
+        if decimation not in self.POLICIES:
+            raise Exception(f"Unknown decimation policy '{decimation}', expected one of {self.POLICIES}.")
+        if modelDescription.fmiVersion not in ('1.0', '2.0'):
+            raise Exception("BoundedRecorder supports FMI 1.0 and 2.0 only.")
+
+        self.fmu = fmu
+        self.modelDescription = modelDescription
+        self.decimation = decimation
+        self.k = max(int(k), 1)
+        self.sink = sink
+
+        if variableNames is None:
+            variableNames = [v.name for v in modelDescription.modelVariables if v.causality == 'output']
+
+        # one getter call per type, like Recorder; Enumerations are read as Integers
+        self.getters = []
+        self.cols = [('time', np.float64)]
+        dtypes = {'Real': np.float64, 'Integer': np.int32, 'Enumeration': np.int32, 'Boolean': np.bool_}
+        for type in ('Real', 'Integer', 'Boolean'):
+            variables = [v for v in modelDescription.modelVariables
+                         if v.name in variableNames and v.name != 'time'
+                         and (v.type == type or (type == 'Integer' and v.type == 'Enumeration'))]
+            if variables:
+                self.getters.append((getattr(fmu, 'get' + type), [v.valueReference for v in variables]))
+                self.cols += [(v.name, dtypes[v.type]) for v in variables]
+        self.columns = [name for name, _ in self.cols]
+
+        n = len(self.cols)
+        self.buffer = np.empty((capacity, n))
+        self.n_rows = 0              # rows in buffer
+        self.n_spilled = 0           # rows handed to the sink
+        self._unspilled = 0          # first row of buffer that is not in the sink yet
+        self.n_samples = 0           # calls to sample()
+        self.tolerance = np.broadcast_to(np.asarray(tolerance, dtype=np.float64), (n - 1,))
+
+        self._values = np.empty(n)   # the current sample, [time, variables...]
+        self._recorded = False       # whether the current sample is in the buffer
+        self._reference = None       # deadband: last recorded values
+        self._window = 0             # minmax: samples in the open window
+        self._low = np.empty(n)
+        self._high = np.empty(n)
+
+    def _read(self, time):
+        values = self._values
+        values[0] = time
+        i = 1
+        for getter, vrs in self.getters:
+            values[i:i + len(vrs)] = getter(vrs)
+            i += len(vrs)
+        return values
+
+    def _append(self, row):
+        if self.n_rows == len(self.buffer):
+            if self.sink is not None:
+                self._spill()
+                self.n_rows = self._unspilled = 0
+            else:
+                self.buffer = np.concatenate([self.buffer, np.empty_like(self.buffer)])
+        self.buffer[self.n_rows] = row
+        self.n_rows += 1
+
+    def _spill(self):
+        if self.n_rows > self._unspilled:
+            self.sink.write(self.buffer[self._unspilled:self.n_rows])
+            self.n_spilled += self.n_rows - self._unspilled
+            self._unspilled = self.n_rows
+
+    def _close_window(self):
+        if self._window:
+            self._append(self._low)
+            if self._window > 1:
+                self._append(self._high)
+            self._window = 0
+
+    def sample(self, time, force=False):
+        """ Record the variables """
+        self._record(self._read(time), force)
+
+    def hold(self, time):
+        """Record the values of the previous sample again at time (for skipped steps)."""
+        self._values[0] = time
+        self._record(self._values, False)
+
+    def _record(self, values, force):
+        self.n_samples += 1
+        policy = self.decimation
+
+        if force or policy is None:
+            keep = True
+        elif policy == "every":
+            keep = (self.n_samples - 1) % self.k == 0
+        elif policy == "deadband":
+            keep = self._reference is None or bool(np.any(np.abs(values[1:] - self._reference) > self.tolerance))
+        else:
+            if self._window == 0:
+                self._low[:] = values
+                self._high[:] = values
+            else:
+                np.fmin(self._low[1:], values[1:], out=self._low[1:])
+                np.fmax(self._high[1:], values[1:], out=self._high[1:])
+                self._high[0] = values[0]
+            self._window += 1
+            if self._window == self.k:
+                self._close_window()
+            # the sample is part of a row once its window is closed
+            self._recorded = self._window == 0
+            return
+
+        if keep:
+            if policy == "minmax":
+                self._close_window()
+            self._append(values)
+            self._reference = values[1:].copy()
+        self._recorded = keep
+
+    def finish(self):
+        """Keep the last sample and the open minmax window, called by result()."""
+        if self.decimation == "minmax":
+            self._close_window()
+        elif self.n_samples and not self._recorded:
+            self._append(self._values)
+        self._recorded = True
+
+    def result(self):
+        """ Return a structured NumPy array with the rows held in memory """
+        self.finish()
+        if self.sink is not None:
+            self._spill()
+        rows = self.buffer[:self.n_rows]
+        arr = np.empty(self.n_rows, dtype=np.dtype(self.cols))
+        for j, name in enumerate(self.columns):
+            arr[name] = rows[:, j]
+        result = arr.view(SimulationResult)
+        result.modelDescription = self.modelDescription
+        return result
+
+    @property
+    def lastSampleTime(self):
+        """ Return the last sample time """
+        if self.n_samples:
+            return self._values[0]
+        raise Exception("No samples available")
+
+
+def snapshot_fmu_state(fmu) -> bytes:
+    """Serialized copy of the current FMU state, it can be restored on any instance of the same FMU."""
+    state = fmu.getFMUstate()
+    try:
+        return bytes(fmu.serializeFMUstate(state))
+    finally:
+        fmu.freeFMUstate(state)
+
+
+def restore_fmu_state(fmu, snapshot: bytes):
+    state = fmu.deSerializeFMUstate(snapshot)
+    try:
+        fmu.setFMUstate(state)
+    finally:
+        fmu.freeFMUstate(state)
+
+
+def settable_during_simulation(variable):
+    return variable.causality == 'input' or variable.variability == 'tunable'
+
+
+class BranchResult:
+    """Result of one branch of simulate_branches().
+
+    The rows before branch_time are not copied into the branch: prefix is the SimulationResult
+    shared by all branches and result holds the rows from branch_time on.
+    """
+
+    def __init__(self, name: str, prefix: SimulationResult, branch_time: float, changes: Dict[str, Any], result: SimulationResult):
+        self.name = name
+        self.prefix = prefix
+        self.branch_time = branch_time
+        self.changes = changes
+        self.result = result
+
+    def full(self) -> SimulationResult:
+        """Prefix and branch as one contiguous result (this copies the prefix)."""
+        before = self.prefix[self.prefix['time'] < self.branch_time]
+        full = np.concatenate([before, self.result]).view(SimulationResult)
+        full.modelDescription = self.result.modelDescription
+        return full
+
+
+def simulate_branches(model_description: ModelDescription,
+                      fmus: Sequence,
+                      branch_time: float,
+                      branches: Dict[str, Dict[str, Any]],
+                      start_time: float = 0.0,
+                      stop_time: float = None,
+                      step_size: float = None,
+                      start_values: Dict[str, Any] = {},
+                      input_signals: np.ndarray = None,
+                      branch_input_signals: Dict[str, np.ndarray] = {},
+                      output: Sequence[str] = None,
+                      output_interval: float = None,
+                      terminate: bool = True,
+                      **kwargs) -> Dict[str, BranchResult]:
+    """What-if simulations that share their history up to branch_time.
+
+    The prefix [start_time, branch_time] is simulated once on fmus[0] and its state is
+    snapshotted. Every branch restores the snapshot, applies its changes (a dict of
+    variable name -> value, only inputs and tunable variables can be changed after
+    initialization) and runs to stop_time with simulateCS_custom(initialize=False).
+
+    fmus are instantiated instances of the FMU; fmus[0] must not be initialized yet, the
+    others must be freshly instantiated too and are initialized once before their first
+    branch. With several instances and an FMU that can serialize its state, branches run
+    in parallel threads, one per instance, which pays off when the FMU calls release the
+    GIL (FMU2Slave, e.g. UniFMU backends in separate processes). Otherwise they run one
+    after the other on fmus[0]. Extra keyword arguments are passed to simulateCS_custom().
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from queue import SimpleQueue
+
+    if not model_description.coSimulation.canGetAndSetFMUstate:
+        raise Exception("simulate_branches() needs an FMU with canGetAndSetFMUstate.")
+
+    if not start_time <= branch_time <= stop_time:
+        raise Exception(f"branch_time must lie between start_time and stop_time, but got {branch_time}.")
+
+    if output_interval is None:
+        # one interval for the prefix and all branches so they are sampled on the same grid
+        output_interval = auto_interval(stop_time - start_time)
+
+    prefix = simulateCS_custom(model_description, fmus[0], start_time=start_time, stop_time=branch_time,
+                               step_size=step_size, start_values=start_values, input_signals=input_signals,
+                               output=output, output_interval=output_interval, terminate=False,
+                               set_stop_time=False, **kwargs)
+
+    serializable = model_description.coSimulation.canSerializeFMUstate
+    if serializable:
+        snapshot = snapshot_fmu_state(fmus[0])
+        instances = list(fmus)
+    else:
+        # without serialization the state can only be restored on the instance that created it
+        state = fmus[0].getFMUstate()
+        instances = [fmus[0]]
+
+    free_instances = SimpleQueue()
+    for fmu in instances:
+        free_instances.put(fmu)
+    initialized = {id(fmus[0])}
+
+    def run_branch(name, changes):
+        fmu = free_instances.get()
+        try:
+            if id(fmu) not in initialized:
+                fmu.setupExperiment(startTime=branch_time)
+                fmu.enterInitializationMode()
+                fmu.exitInitializationMode()
+                initialized.add(id(fmu))
+
+            if serializable:
+                restore_fmu_state(fmu, snapshot)
+            else:
+                fmu.setFMUstate(state)
+
+            remaining = apply_start_values(fmu, model_description, changes, settable=settable_during_simulation)
+            if remaining:
+                raise Exception(f"Branch '{name}' changes variables that cannot be set during the simulation: " +
+                                ', '.join(remaining.keys()))
+
+            result = simulateCS_custom(model_description, fmu, start_time=branch_time, stop_time=stop_time,
+                                       step_size=step_size, input_signals=branch_input_signals.get(name, input_signals),
+                                       output=output, output_interval=output_interval, initialize=False,
+                                       terminate=False, validate=False, **kwargs)
+            return BranchResult(name, prefix, branch_time, changes, result)
+        finally:
+            free_instances.put(fmu)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+            futures = {name: executor.submit(run_branch, name, changes) for name, changes in branches.items()}
+            results = {name: future.result() for name, future in futures.items()}
+    finally:
+        if not serializable:
+            fmus[0].freeFMUstate(state)
+
+    if terminate:
+        for fmu in instances:
+            if id(fmu) in initialized:
+                fmu.terminate()
+
+    return results
+
+
+def parse_connections(connections) -> list:
+    """Normalize a connection graph to a list of (source fmu, output, target fmu, input) tuples.
+
+    connections is a list of "fmu.output" -> "fmu.input" pairs, given as a dict
+    {"regenerator.T_out": "aircond.T_in"} (one target per output), a list of pairs, or a
+    list of {"from": ..., "to": ...} dicts as read from JSON.
+    """
+    if isinstance(connections, dict):
+        pairs = list(connections.items())
+    else:
+        pairs = [(c['from'], c['to']) if isinstance(c, dict) else tuple(c) for c in connections]
+    edges = []
+    for source, target in pairs:
+        try:
+            source_fmu, output = source.split('.', 1)
+            target_fmu, input = target.split('.', 1)
+        except ValueError:
+            raise Exception(f"Connections must be given as 'fmu.variable', but got '{source}' -> '{target}'.")
+        edges.append((source_fmu, output, target_fmu, input))
+    return edges
+
+
+def gauss_seidel_order(names: Sequence[str], edges: Sequence[tuple]) -> list:
+    """FMU names sorted so that every FMU steps after the FMUs it takes inputs from.
+
+    FMUs on an algebraic loop keep the order of names among each other, the loop is
+    broken at the first of them (it reads the values of the previous communication point).
+    """
+    upstream = {name: {e[0] for e in edges if e[2] == name and e[0] != name} for name in names}
+    order = []
+    while len(order) < len(names):
+        ready = [name for name in names if name not in order and upstream[name] <= set(order)]
+        order.append(ready[0] if ready else next(name for name in names if name not in order))
+    return order
+
+
+class CoSimulationResult:
+    """Results of simulate_cosim(): one SimulationResult and one timing row per FMU."""
+
+    def __init__(self, results: Dict[str, SimulationResult], timing: pd.DataFrame, method: str, order: Sequence[str]):
+        self.results = results
+        self.timing = timing
+        self.method = method
+        self.order = list(order)
+
+    def __getitem__(self, name) -> SimulationResult:
+        return self.results[name]
+
+
+def simulate_cosim(fmus: Dict[str, tuple],
+                   connections,
+                   start_time: float = 0.0,
+                   stop_time: float = None,
+                   step_size: float = None,
+                   method: str = 'jacobi',
+                   start_values: Dict[str, Dict[str, Any]] = {},
+                   relative_tolerance: float = None,
+                   output: Dict[str, Sequence[str]] = {},
+                   output_interval: float = None,
+                   step_finished: Callable[[float, Dict[str, Recorder]], bool] = None,
+                   parallel: bool = True,
+                   terminate: bool = True) -> CoSimulationResult:
+    """Co-simulation of several FMU 2.0 instances coupled by a connection graph.
+
+    fmus maps a name to (model_description, instantiated fmu), connections is a graph of
+    Real outputs to Real inputs as accepted by parse_connections(). At every communication
+    point the coupled values are exchanged in one pass: one getReal() per source FMU into a
+    single array, scattered with an index array, one setReal() per target FMU.
+
+    method="jacobi" steps all FMUs from the same exchanged values, in parallel threads when
+    parallel is True (this pays off when the FMU calls release the GIL, e.g. UniFMU
+    backends). method="gauss-seidel" steps the FMUs one after the other in dependency
+    order (gauss_seidel_order()) and passes on the outputs of each FMU before the next one
+    steps, which is more accurate for chains at the cost of parallelism.
+
+    Every FMU is initialized like in simulateCS_custom() with its start_values[name] and
+    recorded with a Recorder of the variables output[name]. step_finished(time, recorders)
+    is called after every communication point; returning False stops the simulation. The
+    time spent in doStep(), in the get/set calls of the exchange and in recording is
+    returned per FMU in result.timing.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if method not in ('jacobi', 'gauss-seidel'):
+        raise Exception(f"Unknown co-simulation method '{method}', expected 'jacobi' or 'gauss-seidel'.")
+
+    names = list(fmus)
+    for name, (model_description, fmu) in fmus.items():
+        if model_description.fmiVersion != '2.0':
+            raise Exception(f"simulate_cosim() supports FMI 2.0 only, '{name}' is FMI {model_description.fmiVersion}.")
+
+    if output_interval is None:
+        output_interval = auto_interval(stop_time - start_time)
+
+    edges = parse_connections(connections)
+    variables = {name: {v.name: v for v in md.modelVariables} for name, (md, _) in fmus.items()}
+    for source_fmu, output_name, target_fmu, input_name in edges:
+        for fmu_name, variable_name, causality in ((source_fmu, output_name, 'output'), (target_fmu, input_name, 'input')):
+            if fmu_name not in fmus:
+                raise Exception(f"Connection refers to the unknown FMU '{fmu_name}'.")
+            variable = variables[fmu_name].get(variable_name)
+            if variable is None:
+                raise Exception(f"'{fmu_name}' has no variable '{variable_name}'.")
+            if variable.causality != causality or variable.type != 'Real':
+                raise Exception(f"'{fmu_name}.{variable_name}' must be a Real {causality} to be connected.")
+
+    # the exchange: every distinct connected output once in `values`, gathered per source FMU
+    sources = list(dict.fromkeys((e[0], e[1]) for e in edges))
+    source_index = {source: i for i, source in enumerate(sources)}
+    gather = {name: ([variables[name][o].valueReference for f, o in sources if f == name],
+                     np.array([i for i, (f, _) in enumerate(sources) if f == name], dtype=np.int64))
+              for name in names}
+    scatter = {name: ([variables[name][e[3]].valueReference for e in edges if e[2] == name],
+                      np.array([source_index[(e[0], e[1])] for e in edges if e[2] == name], dtype=np.int64))
+               for name in names}
+    values = np.zeros(len(sources))
+
+    timing = {name: dict(steps=0, doStep=0.0, get=0.0, set=0.0, record=0.0) for name in names}
+
+    def read_outputs(name):
+        vrs, slots = gather[name]
+        if vrs:
+            t0 = current_time()
+            values[slots] = fmus[name][1].getReal(vrs)
+            timing[name]['get'] += current_time() - t0
+
+    def write_inputs(name):
+        vrs, slots = scatter[name]
+        if vrs:
+            t0 = current_time()
+            fmus[name][1].setReal(vrs, values[slots].tolist())
+            timing[name]['set'] += current_time() - t0
+
+    def do_step(name, time, h):
+        t0 = current_time()
+        fmus[name][1].doStep(currentCommunicationPoint=time, communicationStepSize=h)
+        timing[name]['doStep'] += current_time() - t0
+        timing[name]['steps'] += 1
+
+    def record(time):
+        for name in names:
+            t0 = current_time()
+            recorders[name].sample(time)
+            timing[name]['record'] += current_time() - t0
+
+    for name, (model_description, fmu) in fmus.items():
+        fmu.setupExperiment(tolerance=relative_tolerance, startTime=start_time, stopTime=stop_time)
+        remaining = apply_start_values(fmu, model_description, dict(start_values.get(name, {})), settable=settable_in_instantiated)
+        fmu.enterInitializationMode()
+        remaining = apply_start_values(fmu, model_description, remaining, settable=settable_in_initialization_mode)
+        fmu.exitInitializationMode()
+        if remaining:
+            raise Exception(f"The start values for the following variables of '{name}' could not be set: " +
+                            ', '.join(remaining.keys()))
+
+    recorders = {name: Recorder(fmu=fmu, modelDescription=md, variableNames=output.get(name), interval=output_interval)
+                 for name, (md, fmu) in fmus.items()}
+    order = gauss_seidel_order(names, edges) if method == 'gauss-seidel' else names
+
+    # consistent inputs at start_time, in dependency order so that chains settle in one pass
+    for name in gauss_seidel_order(names, edges):
+        write_inputs(name)
+        read_outputs(name)
+    for name in names:
+        write_inputs(name)
+
+    sim_start = current_time()
+    exchange_time = 0.0
+    n_steps = 0
+    time = start_time
+    executor = ThreadPoolExecutor(max_workers=len(names)) if parallel and method == 'jacobi' and len(names) > 1 else None
+    try:
+        while True:
+            record(time)
+            if time >= stop_time:
+                break
+            h = min(step_size, stop_time - time)
+
+            if method == 'jacobi':
+                if executor is not None:
+                    for future in [executor.submit(do_step, name, time, h) for name in names]:
+                        future.result()
+                else:
+                    for name in names:
+                        do_step(name, time, h)
+                t0 = current_time()
+                for name in names:
+                    read_outputs(name)
+                for name in names:
+                    write_inputs(name)
+                exchange_time += current_time() - t0
+            else:
+                for name in order:
+                    write_inputs(name)
+                    do_step(name, time, h)
+                    read_outputs(name)
+
+            n_steps += 1
+            time = start_time + n_steps * step_size if time + step_size < stop_time else stop_time
+
+            if step_finished is not None and not step_finished(time, recorders):
+                record(time)
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if terminate:
+        for _, fmu in fmus.values():
+            fmu.terminate()
+
+    timing = pd.DataFrame.from_dict(timing, orient='index').rename_axis('fmu')
+    timing['exchange'] = timing['get'] + timing['set']
+    timing.attrs.update(method=method, wall=current_time() - sim_start, master_exchange=exchange_time)
+    return CoSimulationResult({name: recorder.result() for name, recorder in recorders.items()}, timing, method, order)
+
 
 if __name__ == '__main__':
     pass
\ No newline at end of file
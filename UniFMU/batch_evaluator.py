@@ -0,0 +1,191 @@
+"""Evaluate the FMU's outputs for many input draws at once.
+
+Studies such as Monte Carlo runs only need the outputs of the model for a large number of
+input combinations, not time series. Two evaluators share one interface,
+evaluator({name: array}) -> {output: array}, where the names are Real inputs or parameters
+(e.g. rho_air) and unsampled variables keep their start values:
+
+    VectorizedEvaluator  calls compute_balances_simplified from the FMU's own model.py on whole
+                         NumPy columns, millions of draws per second
+    FMUPoolEvaluator     sets the inputs of pooled FMU instances draw by draw, for FMUs whose
+                         model is not a vectorizable Python function
+
+make_evaluator() picks the vectorized one whenever the FMU's model function accepts arrays
+and gives the same values as the element-wise call.
+"""
+import inspect
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from fmu_cache import open_cached_fmu
+from instance_pool import FMUInstancePool
+from inprocess_fmu import is_unifmu_python_fmu, load_model_module, declares_step_skipping
+from variable_index import load_variable_index
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_NAMES = ["mass_balance", "energy_balance", "mdot_air_in", "mdot_air_out", "Q_in", "Q_out"]
+MODEL_FUNCTION = "compute_balances_simplified"
+
+
+def _columns(samples: dict, names, defaults) -> tuple:
+    """Number of draws and one float64 column per name, unsampled names take their default."""
+    n = len(next(iter(samples.values()))) if samples else 1
+    unknown = [name for name in samples if name not in names]
+    if unknown:
+        raise ValueError(f"Sampled variables are no inputs of the model: {unknown}")
+    return n, [np.asarray(samples[name], dtype=np.float64) if name in samples else np.full(n, defaults[name])
+               for name in names]
+
+
+class VectorizedEvaluator:
+    """A model function f(inputs) -> outputs applied to columns instead of scalars.
+
+    function receives the inputs as a list of arrays in FMU declaration order and the
+    parameters as keyword arguments, and returns the outputs as a list in the order of
+    output_names, or as a dict.
+    """
+
+    def __init__(self, function, input_names, output_names=OUTPUT_NAMES, defaults=None, parameter_names=()):
+        self.function = function
+        self.input_names = list(input_names)
+        self.output_names = list(output_names)
+        self.defaults = defaults or {}
+        self.parameter_names = list(parameter_names)
+
+    def __call__(self, samples: dict) -> dict:
+        parameters = {name: np.asarray(samples[name], dtype=np.float64) if name in samples else self.defaults[name]
+                      for name in self.parameter_names}
+        n, columns = _columns({name: values for name, values in samples.items() if name not in parameters},
+                              self.input_names, self.defaults)
+        results = self.function(columns, **parameters)
+        if not isinstance(results, dict):
+            results = dict(zip(self.output_names, results))
+        return {name: np.broadcast_to(np.asarray(results[name], dtype=np.float64), (n,)) for name in self.output_names}
+
+    def close(self):
+        pass
+
+
+class FMUPoolEvaluator:
+    """Evaluate draws on pooled FMU instances, one thread per instance.
+
+    FMUs that declare their outputs algebraic (see inprocess_fmu.declares_step_skipping)
+    stay initialized: every draw is a setReal, a doStep and a getReal. Other FMUs are
+    reset and initialized with the draw as start values, one checkout per draw. So are all
+    FMUs when parameters are sampled, they cannot change after the initialization.
+    """
+
+    def __init__(self, model_description, unzipdir, output_names=OUTPUT_NAMES, instances=1, in_process=False):
+        self.pool = FMUInstancePool(model_description, unzipdir, max_instances=instances, in_process=in_process,
+                                    instance_name="evaluator")
+        self.variables = self.pool.variables
+        self.input_names, self.input_vrs = self.variables.select("input", "Real")
+        self.parameter_names = self.variables.select("parameter", "Real")[0]
+        self.output_names = list(output_names)
+        self.output_vrs = [self.variables.vrs[name] for name in self.output_names]
+        self.defaults = self.pool.default_start_values
+        self.instances = instances
+        self.algebraic = declares_step_skipping(unzipdir)
+        self.provides_derivatives = bool(getattr(model_description.coSimulation, "providesDirectionalDerivative", False))
+
+    def _evaluate(self, names, columns, rows, out):
+        if self.algebraic and len(names) == len(self.input_names):
+            with self.pool.checkout() as fmu:
+                for t, j in enumerate(rows.tolist()):
+                    fmu.setReal(self.input_vrs, columns[:, j].tolist())
+                    fmu.doStep(currentCommunicationPoint=float(t), communicationStepSize=1.0)
+                    out[:, j] = fmu.getReal(self.output_vrs)
+        else:
+            for j in rows.tolist():
+                with self.pool.checkout(dict(zip(names, columns[:, j].tolist()))) as fmu:
+                    fmu.doStep(currentCommunicationPoint=0.0, communicationStepSize=1.0)
+                    out[:, j] = fmu.getReal(self.output_vrs)
+
+    def __call__(self, samples: dict) -> dict:
+        names = self.input_names + [name for name in self.parameter_names if name in samples]
+        n, columns = _columns(samples, names, self.defaults)
+        columns = np.vstack(columns)
+        out = np.empty((len(self.output_names), n))
+        chunks = np.array_split(np.arange(n), self.instances)
+        with ThreadPoolExecutor(self.instances) as executor:
+            for future in [executor.submit(self._evaluate, names, columns, rows, out) for rows in chunks if len(rows)]:
+                future.result()
+        return dict(zip(self.output_names, out))
+
+    def jacobian(self, point: dict, known) -> np.ndarray:
+        """(outputs, known) matrix of the output derivatives at point, from fmi2GetDirectionalDerivative."""
+        if not self.provides_derivatives:
+            raise RuntimeError("The FMU does not provide directional derivatives")
+        known_vrs = [self.variables.vrs[name] for name in known]
+        with self.pool.checkout(point) as fmu:
+            fmu.doStep(currentCommunicationPoint=0.0, communicationStepSize=1.0)
+            columns = [fmu.getDirectionalDerivative(self.output_vrs, known_vrs, seed.tolist()) for seed in np.eye(len(known))]
+        return np.array(columns).T
+
+    def close(self):
+        self.pool.close()
+
+
+def vectorized_evaluator(unzipdir, output_names=OUTPUT_NAMES, n_check=16):
+    """VectorizedEvaluator of the model function in the FMU's model.py, or None if there is none that vectorizes."""
+    if not is_unifmu_python_fmu(unzipdir):
+        return None
+    function = getattr(load_model_module(Path(unzipdir) / "resources"), MODEL_FUNCTION, None)
+    if function is None:
+        return None
+
+    variables = load_variable_index(unzipdir)
+    input_names = variables.select("input", "Real")[0]
+    parameter_names = variables.select("parameter", "Real")[0]
+    missing = [name for name in parameter_names if name not in inspect.signature(function).parameters]
+    if missing:
+        logger.info(f"{MODEL_FUNCTION} does not take the parameters {missing}, evaluating on FMU instances")
+        return None
+    evaluator = VectorizedEvaluator(function, input_names, output_names,
+                                    variables.start_values(("input", "parameter"), "Real"), parameter_names)
+
+    # a function with branches or math.* calls fails or differs on arrays, compare with scalar calls
+    rng = np.random.default_rng(0)
+    samples = {name: evaluator.defaults.get(name, 1.0) * rng.uniform(0.5, 1.5, n_check) for name in input_names}
+    try:
+        vectorized = evaluator(samples)
+        for j in range(n_check):
+            scalar = function([float(samples[name][j]) for name in input_names],
+                              **{name: evaluator.defaults[name] for name in parameter_names})
+            scalar = scalar if isinstance(scalar, dict) else dict(zip(output_names, scalar))
+            if not all(np.isclose(vectorized[name][j], scalar[name]) for name in output_names):
+                raise ValueError(f"draw {j} differs from the element-wise result")
+    except Exception as e:
+        logger.info(f"{MODEL_FUNCTION} does not vectorize ({e}), evaluating on FMU instances")
+        return None
+    return evaluator
+
+
+def make_evaluator(fmu_path, mode="auto", instances=1, in_process=False, output_names=OUTPUT_NAMES, surrogate=None):
+    """Evaluator for the FMU: mode "vectorized", "fmu", "auto" (vectorized when possible) or "surrogate".
+
+    "surrogate" loads the polynomial surrogate trained by surrogate.py from the file
+    surrogate (default next to the FMU) instead of evaluating the model exactly.
+    """
+    if mode == "surrogate":
+        from surrogate import load_surrogate, surrogate_path
+
+        path = Path(surrogate or surrogate_path(fmu_path))
+        if not path.is_file():
+            raise FileNotFoundError(f"No surrogate at {path}, train one with: python UniFMU/surrogate.py train --fmu {fmu_path}")
+        logger.info(f"Evaluating the surrogate {path}")
+        return load_surrogate(path, fmu_path)
+
+    model_description, unzipdir = open_cached_fmu(fmu_path)
+    if mode in ("auto", "vectorized"):
+        evaluator = vectorized_evaluator(unzipdir, output_names)
+        if evaluator is not None:
+            logger.info(f"Evaluating {MODEL_FUNCTION} of the FMU vectorized")
+            return evaluator
+        if mode == "vectorized":
+            raise ValueError(f"The FMU has no vectorizable {MODEL_FUNCTION}")
+    logger.info(f"Evaluating on {instances} FMU instance(s)")
+    return FMUPoolEvaluator(model_description, unzipdir, output_names, instances=instances, in_process=in_process)
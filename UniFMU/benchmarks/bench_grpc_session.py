@@ -0,0 +1,69 @@
+"""Compare the unary and the session (bidirectional stream) transports of the grpc backend.
+
+Each step issues SetReal, DoStep and GetReal, i.e. the calls simulate_fmu.py makes.
+
+    python UniFMU/benchmarks/bench_grpc_session.py --steps 100000
+"""
+import sys
+import time
+import shutil
+import logging
+import argparse
+import subprocess
+from pathlib import Path
+from fmpy import read_model_description, extract
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from grpc_session import GrpcBackendProcess
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def run(unzipdir, vrs, n_steps, transport):
+    backend = GrpcBackendProcess(unzipdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).start()
+    client = backend.session() if transport == "session" else backend.unary()
+    try:
+        input_vrs = [vrs["temp_1"], vrs["vfr_5"]]
+        output_vrs = [vrs["mass_balance"], vrs["energy_balance"]]
+
+        client.setup_experiment(0.0)
+        client.enter_initialization_mode()
+        client.exit_initialization_mode()
+
+        t0 = time.perf_counter()
+        for i in range(n_steps):
+            client.set_real(input_vrs, [20.0 + i % 10, 0.1])
+            client.do_step(float(i), 1.0)
+            outputs = client.get_real(output_vrs)
+        elapsed = time.perf_counter() - t0
+
+        client.terminate()
+    finally:
+        client.close()
+        backend.close()
+
+    return elapsed, outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fmu", type=Path, default=Path("FMUs/ORIGINAL_modified_auto.fmu"))
+    parser.add_argument("--steps", type=int, default=100_000)
+    args = parser.parse_args()
+
+    model_description = read_model_description(args.fmu)
+    vrs = {v.name: v.valueReference for v in model_description.modelVariables}
+    unzipdir = extract(args.fmu) if args.fmu.is_file() else args.fmu
+
+    try:
+        results = {}
+        for transport in ("unary", "session"):
+            elapsed, outputs = run(unzipdir, vrs, args.steps, transport)
+            results[transport] = elapsed
+            print(f"{transport:8s}: {args.steps} steps in {elapsed:8.2f} s  "
+                  f"{args.steps / elapsed:8.0f} steps/s  {3 * args.steps / elapsed:8.0f} calls/s  last outputs {outputs}")
+        print(f"session speed-up: {results['unary'] / results['session']:.2f}x")
+    finally:
+        if args.fmu.is_file():
+            shutil.rmtree(unzipdir, ignore_errors=True)
@@ -0,0 +1,82 @@
+"""Time and PDF size of simulate_fmu.plot_results: every sample (before) vs downsampled, parallel rendering (after).
+
+Synthetic traces with the shape of the FMU result (18 inputs, 6 outputs) are used, so no
+simulation is needed and the row count can be chosen freely.
+
+    python UniFMU/benchmarks/bench_plot_results.py --rows 1000000
+"""
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import simulate_fmu
+
+
+def legacy_plot(df, input_names, output_names, pdf_path):
+    """The plotting simulate_fmu.py used before downsampling: every sample, figures one after the other."""
+    time_values = df["time"]
+    with PdfPages(pdf_path) as pdf:
+        for title, names, color in (("Input Variables", input_names, None), ("Output Variables", output_names, "tab:blue")):
+            fig, axs = plt.subplots(len(names), 1, figsize=(10, 2 * len(names)), sharex=True)
+            for ax, name in zip(axs, names):
+                ax.plot(time_values, df[name], label=name, color=color)
+                ax.set_ylabel(name)
+                ax.grid(True)
+            axs[-1].set_xlabel("Time [s]")
+            fig.suptitle(title)
+            fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+            pdf.savefig(fig)
+            plt.close(fig)
+
+
+def synthetic_results(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_rows, dtype=np.float64)
+    input_names = [f"input_{i}" for i in range(18)]
+    output_names = ["mass_balance", "energy_balance", "mdot_air_in", "mdot_air_out", "Q_in", "Q_out"]
+    columns = {"time": t}
+    for i, name in enumerate(input_names + output_names):
+        # slow oscillation, noise and a few isolated spikes that downsampling must keep
+        y = np.sin(t / (n_rows / (3 + i))) + 0.05 * rng.standard_normal(n_rows)
+        y[rng.integers(0, n_rows, 3)] += 5.0
+        columns[name] = y
+    return pd.DataFrame(columns), input_names, output_names
+
+
+def run(label, plot, pdf_path):
+    t0 = time.perf_counter()
+    plot(pdf_path)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:6s}: {elapsed:7.2f} s  {pdf_path.stat().st_size / 2**20:8.2f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--max-points", type=int, default=simulate_fmu.PLOT_MAX_POINTS)
+    parser.add_argument("--method", choices=["lttb", "minmax"], default=simulate_fmu.PLOT_DOWNSAMPLING)
+    parser.add_argument("--workers", type=int, default=simulate_fmu.PLOT_WORKERS)
+    parser.add_argument("--rasterize", action="store_true")
+    args = parser.parse_args()
+
+    df, input_names, output_names = synthetic_results(args.rows)
+    simulate_fmu.PLOT_MAX_POINTS = args.max_points
+    simulate_fmu.PLOT_DOWNSAMPLING = args.method
+    simulate_fmu.PLOT_WORKERS = args.workers
+    simulate_fmu.PLOT_RASTERIZE = args.rasterize
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before, after = Path(tmp) / "before.pdf", Path(tmp) / "after.pdf"
+        simulate_fmu.PLOT_PDF = after
+        print(f"{args.rows} rows, 24 traces")
+        run("before", lambda path: legacy_plot(df, input_names, output_names, path), before)
+        run("after", lambda path: simulate_fmu.plot_results(df, input_names, output_names), after)
@@ -0,0 +1,92 @@
+"""Time and memory of the simulate_fmu.py loop: per-step dict rows (before) vs preallocated array (after).
+
+The FMU runs in-process by default so the numbers show the host-side cost of the loop
+rather than the backend round trips; pass --rpc to go through the UniFMU binary.
+
+    python UniFMU/benchmarks/bench_simulate_fmu.py --steps 1000000
+"""
+import sys
+import time
+import shutil
+import argparse
+import tracemalloc
+from pathlib import Path
+import pandas as pd
+from fmpy import read_model_description, extract
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from inprocess_fmu import open_fmu_slave
+from simulate_fmu import simulate_loop
+
+
+def legacy_loop(fmu, vrs, input_names, output_names, start_time, stop_time, step_size):
+    """The loop simulate_fmu.py used before the result array was preallocated."""
+    results = []
+    sim_time = start_time
+    while sim_time <= stop_time:
+        input_vals = fmu.getReal([vrs[name] for name in input_names])
+        fmu.doStep(currentCommunicationPoint=sim_time, communicationStepSize=step_size)
+        output_vals = fmu.getReal([vrs[name] for name in output_names])
+
+        row = {"time": sim_time}
+        row.update(dict(zip(input_names, input_vals)))
+        row.update(dict(zip(output_names, output_vals)))
+        results.append(row)
+
+        sim_time += step_size
+    return pd.DataFrame(results)
+
+
+def preallocated_loop(fmu, vrs, input_names, output_names, start_time, stop_time, step_size):
+    data = simulate_loop(fmu, [vrs[n] for n in input_names], [vrs[n] for n in output_names],
+                         start_time, stop_time, step_size)
+    return pd.DataFrame(data, columns=["time"] + input_names + output_names, copy=False)
+
+
+def measure(loop, model_description, unzipdir, n_steps, in_process, trace_memory):
+    vrs = {v.name: v.valueReference for v in model_description.modelVariables}
+    input_names = [v.name for v in model_description.modelVariables if v.causality == "input" and v.type == "Real"]
+    output_names = ["mass_balance", "energy_balance", "mdot_air_in", "mdot_air_out", "Q_in", "Q_out"]
+
+    fmu = open_fmu_slave(model_description, unzipdir, in_process=in_process)
+    fmu.instantiate()
+    fmu.setupExperiment(startTime=0.0)
+    fmu.enterInitializationMode()
+    fmu.exitInitializationMode()
+
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    df = loop(fmu, vrs, input_names, output_names, 0.0, float(n_steps - 1), 1.0)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    tracemalloc.stop()
+
+    fmu.terminate()
+    fmu.freeInstance()
+    return elapsed, peak, df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fmu", type=Path, default=Path("FMUs/ORIGINAL_modified_auto.fmu"))
+    parser.add_argument("--steps", type=int, default=1_000_000)
+    parser.add_argument("--rpc", action="store_true", help="use FMU2Slave instead of the in-process adapter")
+    args = parser.parse_args()
+
+    model_description = read_model_description(args.fmu)
+    unzipdir = extract(args.fmu) if args.fmu.is_file() else args.fmu
+
+    try:
+        frames = {}
+        for name, loop in (("before", legacy_loop), ("after", preallocated_loop)):
+            # timing and memory are measured in separate runs, tracemalloc slows down allocation-heavy code
+            elapsed, _, frames[name] = measure(loop, model_description, unzipdir, args.steps, not args.rpc, False)
+            _, peak, _ = measure(loop, model_description, unzipdir, args.steps, not args.rpc, True)
+            print(f"{name:6s}: {args.steps} steps in {elapsed:7.2f} s  peak traced memory {peak / 2**20:8.1f} MiB")
+
+        same = frames["before"].drop(columns="time").equals(frames["after"].drop(columns="time"))
+        print(f"identical inputs/outputs: {same}")
+    finally:
+        if args.fmu.is_file():
+            shutil.rmtree(unzipdir, ignore_errors=True)
@@ -0,0 +1,75 @@
+"""Time of simulateCS_custom with and without skip_unchanged_steps, and a check that the results are bit-identical.
+
+The inputs are a piecewise constant schedule (a new value every --hold steps), so most
+steps of an algebraic FMU can be skipped. Every decimation policy of BoundedRecorder is
+run both ways, since skipped steps are recorded through BoundedRecorder.hold().
+
+    python UniFMU/benchmarks/bench_step_skipping.py --steps 100000 --hold 60
+"""
+import sys
+import time
+import shutil
+import argparse
+from pathlib import Path
+import numpy as np
+from fmpy import read_model_description, extract
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "FMPy_custom"))
+from inprocess_fmu import open_fmu_slave
+from input_schedule import InputSchedule
+from simulation_custom import simulateCS_custom, BoundedRecorder
+
+POLICIES = ((None, {}), ("every", {"k": 3}), ("minmax", {"k": 3}), ("deadband", {"tolerance": 1e-3}))
+
+
+def piecewise_schedule(model_description, n_steps, hold, seed=0):
+    """Inputs that jump to a new random value (within ±10 % of their start value) every hold steps."""
+    inputs = [v for v in model_description.modelVariables if v.causality == "input" and v.type == "Real"]
+    rng = np.random.default_rng(seed)
+    times = np.arange(0.0, n_steps, hold, dtype=np.float64)
+    start = np.array([float(v.start) for v in inputs])
+    values = start * rng.uniform(0.9, 1.1, (len(times), len(inputs)))
+    return InputSchedule(times, values, [v.name for v in inputs], interpolation="hold")
+
+
+def run(model_description, unzipdir, schedule, n_steps, skip, decimation, options):
+    fmu = open_fmu_slave(model_description, unzipdir, in_process=True)
+    fmu.instantiate()
+    recorder = BoundedRecorder(fmu, model_description, decimation=decimation, **options)
+    t0 = time.perf_counter()
+    result = simulateCS_custom(model_description, fmu, start_time=0.0, stop_time=float(n_steps - 1), step_size=1.0,
+                               recorder=recorder, input_schedule=schedule, skip_unchanged_steps=skip)
+    elapsed = time.perf_counter() - t0
+    fmu.freeInstance()
+    return elapsed, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fmu", type=Path, default=Path("FMUs/ORIGINAL_modified_auto.fmu"))
+    parser.add_argument("--steps", type=int, default=100_000)
+    parser.add_argument("--hold", type=int, default=60, help="steps between input changes")
+    args = parser.parse_args()
+
+    model_description = read_model_description(args.fmu)
+    unzipdir = extract(args.fmu) if args.fmu.is_file() else args.fmu
+
+    try:
+        all_same = True
+        for decimation, options in POLICIES:
+            schedule = piecewise_schedule(model_description, args.steps, args.hold)
+            t_full, full = run(model_description, unzipdir, schedule, args.steps, False, decimation, options)
+            schedule = piecewise_schedule(model_description, args.steps, args.hold)
+            t_skip, skipped = run(model_description, unzipdir, schedule, args.steps, True, decimation, options)
+
+            same = full.dtype == skipped.dtype and np.array_equal(full.view(np.uint8), skipped.view(np.uint8))
+            all_same &= same
+            stats = skipped.step_statistics
+            print(f"{str(decimation):8s}: {len(full):7d} rows  without skipping {t_full:6.2f} s  "
+                  f"with skipping {t_skip:6.2f} s ({stats['skipped']} of {stats['steps']} steps skipped)  "
+                  f"bit-identical: {same}")
+        print(f"{'✅' if all_same else '❌'} bit-identical with and without skipping: {all_same}")
+    finally:
+        if args.fmu.is_file():
+            shutil.rmtree(unzipdir, ignore_errors=True)
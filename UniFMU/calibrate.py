@@ -0,0 +1,189 @@
+"""Calibration of the model parameters (rho_air, Cp_air) against measured plant data.
+
+The measured file has the shape of results/simulation_inputs_outputs.csv: one row per
+sample with the Real inputs of the FMU and the measured outputs. The parameters are fitted
+by least squares on the residuals of the target outputs (mdot_air_in, mdot_air_out, Q_in,
+Q_out by default), each divided by the spread of its measurements so that kg/s and W
+weigh alike. All rows are evaluated at once by batch_evaluator.py, so a year of 1-minute
+data (525 600 rows) is fitted in seconds.
+
+The solver is scipy's least_squares if scipy is installed, otherwise a Levenberg-Marquardt
+iteration with forward-difference Jacobians. The fitted values are written to
+FMUs/calibrated_parameters.json, which update_and_packege_fmu.py uses as the start
+values of the FMU parameters the next time the FMU is generated:
+
+    python UniFMU/calibrate.py measured.csv
+    python UniFMU/update_and_packege_fmu.py
+"""
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from batch_evaluator import make_evaluator
+from result_sinks import read_results
+from simulate_fmu import FMU_PATH
+
+try:
+    from scipy.optimize import least_squares
+except ImportError:
+    least_squares = None
+
+logger = logging.getLogger(__name__)
+
+# === CALIBRATION ===
+PARAMETERS = ("rho_air", "Cp_air")
+TARGETS = ("mdot_air_in", "mdot_air_out", "Q_in", "Q_out")
+CALIBRATION_FILE = Path("FMUs/calibrated_parameters.json")
+
+
+def load_measurements(path, columns) -> pd.DataFrame:
+    """The given columns (those present) of a measured CSV or of a stored result, rows with gaps dropped."""
+    path = Path(path)
+    if path.suffix == ".csv":
+        data = pd.read_csv(path, usecols=lambda name: name in columns, dtype=np.float64)
+    else:
+        data = read_results(path)
+        data = data[[name for name in columns if name in data]]
+    n = len(data)
+    data = data.dropna()
+    if len(data) < n:
+        logger.warning(f"Dropped {n - len(data)} of {n} rows with missing values")
+    return data
+
+
+def _levenberg_marquardt(residuals, x0, max_iter=100, xtol=1e-10, step=1e-7):
+    """Minimize sum(residuals(x)^2) with forward-difference Jacobians; returns (x, r, J, iterations)."""
+    x = np.asarray(x0, dtype=np.float64)
+    r = residuals(x)
+    damping = 1e-3
+    jacobian = None
+    for iteration in range(1, max_iter + 1):
+        h = step * np.maximum(np.abs(x), 1.0)
+        jacobian = np.column_stack([(residuals(x + h[j] * e) - r) / h[j] for j, e in enumerate(np.eye(len(x)))])
+        jtj, jtr = jacobian.T @ jacobian, jacobian.T @ r
+        while True:
+            dx = np.linalg.solve(jtj + damping * np.diag(np.diag(jtj) + 1e-12), -jtr)
+            r_new = residuals(x + dx)
+            if r_new @ r_new < r @ r:
+                x, r = x + dx, r_new
+                damping = max(damping / 10, 1e-12)
+                break
+            damping *= 10
+            if damping > 1e12:
+                return x, r, jacobian, iteration
+        if np.all(np.abs(dx) <= xtol * (np.abs(x) + xtol)):
+            break
+    return x, r, jacobian, iteration
+
+
+def calibrate(evaluator, data: pd.DataFrame, parameters=PARAMETERS, targets=None, initial=None, max_iter=100) -> dict:
+    """Fit parameters so that the model outputs match the measured targets; returns a report dict.
+
+    The parameters are solved for relative to their initial values (the FMU start values
+    unless given), so quantities of different magnitude are equally well conditioned.
+    """
+    parameters = list(parameters)
+    targets = [name for name in (targets or TARGETS) if name in data]
+    if not targets:
+        raise ValueError(f"The measurements contain none of the target outputs {list(TARGETS)}")
+    missing = [name for name in evaluator.input_names if name not in data]
+    if missing:
+        logger.warning(f"Inputs not measured, held at their start values: {missing}")
+
+    n = len(data)
+    samples = {name: data[name].to_numpy(dtype=np.float64) for name in evaluator.input_names if name in data}
+    measured = {name: data[name].to_numpy(dtype=np.float64) for name in targets}
+    # spread of each target, so that the residuals of different units are comparable
+    scale = {name: float(np.std(values)) or float(np.mean(np.abs(values))) or 1.0 for name, values in measured.items()}
+    p0 = np.array([(initial or {}).get(name, evaluator.defaults[name]) for name in parameters], dtype=np.float64)
+    evaluations = [0]
+
+    def outputs(theta):
+        evaluations[0] += 1
+        return evaluator({**samples, **{name: np.full(n, value) for name, value in zip(parameters, p0 * theta)}})
+
+    def residuals(theta):
+        y = outputs(theta)
+        return np.concatenate([(y[name] - measured[name]) / scale[name] for name in targets])
+
+    def rmse(theta):
+        y = outputs(theta)
+        return {name: float(np.sqrt(np.mean((y[name] - measured[name]) ** 2))) for name in targets}
+
+    rmse_before = rmse(np.ones(len(parameters)))
+    t0 = time.perf_counter()
+    if least_squares is not None:
+        result = least_squares(residuals, np.ones(len(parameters)), method="trf", max_nfev=max_iter * (len(parameters) + 1))
+        theta, r, jacobian, solver = result.x, result.fun, result.jac, f"scipy least_squares ({result.message})"
+    else:
+        theta, r, jacobian, iterations = _levenberg_marquardt(residuals, np.ones(len(parameters)), max_iter)
+        solver = f"Levenberg-Marquardt ({iterations} iterations)"
+    elapsed = time.perf_counter() - t0
+
+    # linearized covariance of the estimates; strongly correlated parameters are not identifiable separately
+    dof = max(len(r) - len(parameters), 1)
+    try:
+        covariance = np.linalg.inv(jacobian.T @ jacobian) * (r @ r) / dof
+    except np.linalg.LinAlgError:
+        covariance = np.full((len(parameters), len(parameters)), np.nan)
+        logger.warning("The parameters are not identifiable from these targets (singular Jacobian)")
+    std_error = np.sqrt(np.abs(np.diag(covariance))) * np.abs(p0)
+    correlation = covariance / np.sqrt(np.outer(np.diag(covariance), np.diag(covariance)))
+    if len(parameters) > 1 and np.nanmax(np.abs(correlation - np.eye(len(parameters)))) > 0.99:
+        logger.warning(f"Fitted parameters are almost fully correlated, consider more targets:\n{correlation.round(3)}")
+
+    fitted = p0 * theta
+    logger.info(f"Fitted {parameters} on {n} rows x {len(targets)} targets in {elapsed:.2f} s "
+                f"({evaluations[0]} batch evaluations, {solver})")
+    return {
+        "parameters": dict(zip(parameters, fitted.tolist())),
+        "std_error": dict(zip(parameters, std_error.tolist())),
+        "initial": dict(zip(parameters, p0.tolist())),
+        "correlation": correlation.tolist(),
+        "targets": targets,
+        "rmse_before": rmse_before,
+        "rmse_after": rmse(theta),
+        "rows": n,
+        "solver": solver,
+        "seconds": elapsed,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Fit the FMU parameters to measured plant data")
+    parser.add_argument("measurements", type=Path, help="CSV (or stored result) with the inputs and the measured outputs")
+    parser.add_argument("--fmu", type=Path, default=FMU_PATH)
+    parser.add_argument("--parameter", action="append", help=f"parameter to fit (default {', '.join(PARAMETERS)})")
+    parser.add_argument("--target", action="append", help=f"measured output to match (default those of {', '.join(TARGETS)})")
+    parser.add_argument("--max-iter", type=int, default=100)
+    parser.add_argument("--mode", choices=["auto", "vectorized", "fmu"], default="auto")
+    parser.add_argument("--in-process", action="store_true", help="run UniFMU Python FMUs in this process")
+    parser.add_argument("--out", type=Path, default=CALIBRATION_FILE, help="where the fitted parameters are written")
+    parser.add_argument("--no-write", action="store_true", help="only report the fit")
+    args = parser.parse_args()
+
+    evaluator = make_evaluator(args.fmu.resolve(), args.mode, in_process=args.in_process)
+    try:
+        parameters = args.parameter or list(PARAMETERS)
+        unknown = [name for name in parameters if name not in evaluator.parameter_names]
+        if unknown:
+            raise SystemExit(f"❌ {unknown} are no parameters of {args.fmu}, regenerate it with update_and_packege_fmu.py")
+        targets = args.target or list(TARGETS)
+        data = load_measurements(args.measurements, set(evaluator.input_names) | set(targets))
+        report = calibrate(evaluator, data, parameters, targets, max_iter=args.max_iter)
+    finally:
+        evaluator.close()
+
+    for name, value in report["parameters"].items():
+        print(f"📐 {name} = {value:.6g} ± {report['std_error'][name]:.2g} (was {report['initial'][name]:.6g})")
+    for name in report["targets"]:
+        print(f"   RMSE {name}: {report['rmse_before'][name]:.4g} -> {report['rmse_after'][name]:.4g}")
+    if not args.no_write:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps({**report, "measurements": str(args.measurements)}, indent=2))
+        print(f"✅ Fitted parameters saved to: {args.out}, run update_and_packege_fmu.py to build them into the FMU")
@@ -0,0 +1,87 @@
+"""Shape-preserving downsampling of long time series for plotting.
+
+A plot is at most a few thousand pixels wide, so drawing 10^6 samples per trace only costs
+time and file size. Both methods keep the first and the last sample:
+
+    lttb    Largest-Triangle-Three-Buckets, picks per bucket the sample that forms the largest
+            triangle with its neighbours, so peaks and the visual shape are preserved
+    minmax  keeps the minimum and the maximum of every bucket, the envelope is exact
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """Indices of the n_out samples selected by Largest-Triangle-Three-Buckets."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # the first and last samples are always kept, the others are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    # NaN-free averages of every bucket in one pass; the last sample is the bucket after the last one
+    starts = np.append(edges[:-1], n - 1)
+    nan_y = np.isnan(y)
+    n_valid = np.add.reduceat(~nan_y, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_x = np.add.reduceat(np.where(nan_y, 0.0, x), starts) / n_valid
+        avg_y = np.add.reduceat(np.where(nan_y, 0.0, y), starts) / n_valid
+    # buckets where a NaN could win the argmax take the slower, NaN-safe path
+    has_nan = np.add.reduceat(nan_y, starts) > 0
+    has_nan[:-1] |= n_valid[1:] == 0
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        xa, ya = x[a], y[a]
+        area = np.abs((xa - avg_x[i + 1]) * (y[lo:hi] - ya) - (xa - x[lo:hi]) * (avg_y[i + 1] - ya))
+        if has_nan[i] or nan_y[a]:
+            area = np.nan_to_num(area, nan=-1.0)
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def minmax_indices(y, n_out: int) -> np.ndarray:
+    """Sorted indices of the minimum and maximum of n_out // 2 buckets (plus both ends)."""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    n_buckets = n_out // 2
+    if n <= n_out or n_buckets < 1:
+        return np.arange(n)
+
+    # NaN never wins, an all-NaN bucket just contributes its first sample
+    low = np.where(np.isnan(y), np.inf, y)
+    high = np.where(np.isnan(y), -np.inf, y)
+
+    size = n // n_buckets
+    m = size * n_buckets
+    offsets = np.arange(n_buckets) * size
+    picks = [
+        offsets + low[:m].reshape(n_buckets, size).argmin(axis=1),
+        offsets + high[:m].reshape(n_buckets, size).argmax(axis=1),
+        [0, n - 1],
+    ]
+    if m < n:
+        picks.append([m + low[m:].argmin(), m + high[m:].argmax()])
+    return np.unique(np.concatenate(picks).astype(np.int64))
+
+
+def downsample(x, y, max_points: int = 2000, method: str = "lttb"):
+    """Return (x, y) reduced to about max_points samples; max_points=None keeps every sample."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if max_points is None or len(x) <= max_points:
+        return x, y
+    if method == "lttb":
+        idx = lttb_indices(x, y, max_points)
+    elif method == "minmax":
+        idx = minmax_indices(y, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}', expected 'lttb' or 'minmax'")
+    return x[idx], y[idx]
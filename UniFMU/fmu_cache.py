@@ -0,0 +1,304 @@
+"""Content-addressed cache of extracted FMUs.
+
+An FMU is extracted once to <cache>/<sha256 of the .fmu file>/ and every later run with the
+same file content reuses that directory, whatever the file is called or where it lives.
+The parsed model description is pickled next to it, so a cache hit costs one pass of
+hashing and neither an unzip nor any XML parsing.
+
+Several processes may use the cache at once: extraction happens in a private temporary
+directory that is renamed into place under a per-entry lock, so an entry either does not
+exist or is complete. When the cache grows beyond its size limit the least recently used
+entries are removed, except those a running process has opened: every process holds a
+shared lock on the entries it uses until it exits (or calls release()), however long it
+runs. On Windows there are no shared locks and only the grace period protects an entry.
+
+    python UniFMU/fmu_cache.py info
+    python UniFMU/fmu_cache.py clear
+"""
+import os
+import time
+import shutil
+import pickle
+import hashlib
+import logging
+import argparse
+import contextlib
+from pathlib import Path
+import fmpy
+from fmpy import read_model_description, extract
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("UNIFMU_CACHE_DIR", Path.home() / ".cache" / "unifmu" / "fmus"))
+MAX_CACHE_BYTES = int(float(os.getenv("UNIFMU_CACHE_MAX_MB", 2048)) * 2**20)
+EVICTION_GRACE = 300.0  # seconds; entries used more recently than this are never evicted
+
+# the pickle depends on the FMPy classes, so the file name carries the FMPy version
+MODEL_DESCRIPTION_FILE = f".model_description-fmpy{fmpy.__version__}.pickle"
+
+_hashes = {}
+_model_descriptions = {}
+_pins = {}  # digest -> open use file of the entry, holding a shared lock
+
+
+def _open_locked(path, operation):
+    """Open path and flock() it with operation (POSIX).
+
+    evict() unlinks the lock files of an entry it removes while holding their locks, so a
+    process that was waiting may end up holding a file that no longer exists; it then
+    locks the file now at path instead.
+    """
+    import fcntl
+    while True:
+        f = open(path, "a+b")
+        try:
+            fcntl.flock(f, operation)
+        except BlockingIOError:
+            f.close()
+            raise
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Exclusive lock held on path for the duration of the with block (works across processes)."""
+    if os.name != "nt":
+        import fcntl
+        f = _open_locked(path, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            f.close()  # closing the file drops the lock
+        return
+
+    import msvcrt
+    with open(path, "a+b") as f:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _use_file(cache_dir, digest) -> Path:
+    return Path(cache_dir) / f".{digest}.use"
+
+
+def _pin(cache_dir, digest):
+    """Hold a shared lock on the use file of an entry, evict() skips entries locked this way."""
+    if digest in _pins:
+        return
+    if os.name == "nt":
+        _pins[digest] = open(_use_file(cache_dir, digest), "a+b")
+    else:
+        import fcntl
+        _pins[digest] = _open_locked(_use_file(cache_dir, digest), fcntl.LOCK_SH)
+
+
+def release(digest):
+    """Let evict() remove the entry again once no other process uses it."""
+    f = _pins.pop(digest, None)
+    if f is not None:
+        f.close()  # closing the file drops the lock
+
+
+def _unused(cache_dir, digest):
+    """Open use file with an exclusive lock if no process holds the entry, else None."""
+    if os.name == "nt":
+        return open(_use_file(cache_dir, digest), "a+b")
+    import fcntl
+    try:
+        return _open_locked(_use_file(cache_dir, digest), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return None
+
+
+def fmu_hash(fmu_path) -> str:
+    """SHA-256 of the .fmu file, memoized per path, size and modification time."""
+    fmu_path = Path(fmu_path).resolve()
+    stat = fmu_path.stat()
+    key = (fmu_path, stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        digest = hashlib.sha256()
+        with open(fmu_path, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+
+def _entries(cache_dir):
+    return [p for p in Path(cache_dir).iterdir() if p.is_dir() and not p.name.startswith(".")]
+
+
+def _dir_size(path) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def extract_cached(fmu_path, cache_dir=None, max_bytes=None) -> Path:
+    """Directory with the extracted content of fmu_path, extracting it only on a cache miss.
+
+    A directory (an already extracted FMU) is returned as is. The cached directory is shared
+    by every run of the same FMU: the extracted files must not be modified, only caches
+    derived from them may be added next to them (the pickled model description,
+    variable_index.py's .variable_index.npy, the __pycache__ of in-process models).
+    """
+    fmu_path = Path(fmu_path)
+    if fmu_path.is_dir():
+        return fmu_path
+
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    digest = fmu_hash(fmu_path)
+    entry = cache_dir / digest
+
+    while True:
+        if entry.is_dir():
+            logger.info(f"FMU cache hit: {fmu_path.name} -> {entry}")
+        else:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            with _file_lock(cache_dir / f".{digest}.lock"):
+                # another process may have finished the extraction while we waited for the lock
+                if not entry.is_dir():
+                    t0 = time.perf_counter()
+                    tmp = cache_dir / f".{digest}.{os.getpid()}.tmp"
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    extract(str(fmu_path), str(tmp))
+                    os.rename(tmp, entry)
+                    logger.info(f"FMU cache miss: extracted {fmu_path.name} to {entry} in {time.perf_counter() - t0:.2f} s")
+            # outside the entry lock, eviction takes the locks of other entries
+            evict(cache_dir, max_bytes, keep=(digest,))
+
+        # the entry stays locked as in use until this process exits or releases it
+        _pin(cache_dir, digest)
+        if entry.is_dir():
+            break
+        release(digest)  # evicted between the check and the lock, extract it again
+
+    # the modification time of the entry is its last use, for the LRU eviction
+    os.utime(entry)
+    return entry
+
+
+def _model_description_of_entry(digest, entry):
+    if digest in _model_descriptions:
+        return _model_descriptions[digest]
+
+    pickled = entry / MODEL_DESCRIPTION_FILE
+    model_description = None
+    if pickled.is_file():
+        try:
+            with open(pickled, "rb") as f:
+                model_description = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cached model description {pickled}: {e}")
+
+    if model_description is None:
+        model_description = read_model_description(str(entry / "modelDescription.xml"))
+        tmp = entry / f"{MODEL_DESCRIPTION_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(model_description, f)
+        os.replace(tmp, pickled)
+
+    _model_descriptions[digest] = model_description
+    return model_description
+
+
+def read_model_description_cached(fmu_path, cache_dir=None):
+    """Model description of fmu_path, parsed once per FMU content and kept in memory and on disk."""
+    return open_cached_fmu(fmu_path, cache_dir)[0]
+
+
+def open_cached_fmu(fmu_path, cache_dir=None):
+    """(model_description, unzipdir) of fmu_path from the cache, the replacement for read_model_description() + extract()."""
+    fmu_path = Path(fmu_path)
+    if fmu_path.is_dir():
+        return read_model_description(str(fmu_path)), fmu_path
+
+    digest = fmu_hash(fmu_path)
+    unzipdir = extract_cached(fmu_path, cache_dir)
+    return _model_description_of_entry(digest, unzipdir), unzipdir
+
+
+def evict(cache_dir=None, max_bytes=None, keep=(), grace=EVICTION_GRACE, label="FMU cache"):
+    """Remove least recently used entries until the cache is no larger than max_bytes.
+
+    Entries in keep, used less than grace seconds ago or locked as in use by a process are left alone.
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    if not cache_dir.is_dir():
+        return
+
+    entries = sorted(_entries(cache_dir), key=lambda p: p.stat().st_mtime)
+    sizes = {entry: _dir_size(entry) for entry in entries}
+    total = sum(sizes.values())
+    now = time.time()
+
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        if entry.name in keep or now - entry.stat().st_mtime < grace:
+            continue
+        lock_path = cache_dir / f".{entry.name}.lock"
+        with _file_lock(lock_path):
+            if not entry.is_dir():
+                continue  # evicted by another process meanwhile
+            use = _unused(cache_dir, entry.name)
+            if use is None:
+                logger.debug(f"{label}: {entry.name} is in use, not evicted")
+                continue
+            try:
+                # rename first so no process ever sees a half-deleted entry
+                trash = cache_dir / f".{entry.name}.{os.getpid()}.trash"
+                os.rename(entry, trash)
+                shutil.rmtree(trash, ignore_errors=True)
+                # removed while still locked, waiting processes notice it (see _open_locked);
+                # Windows cannot delete open files, there they stay behind
+                for path in (_use_file(cache_dir, entry.name), lock_path):
+                    with contextlib.suppress(OSError):
+                        path.unlink()
+            finally:
+                use.close()
+        total -= sizes[entry]
+        logger.info(f"{label}: evicted {entry.name} ({sizes[entry] / 2**20:.1f} MiB)")
+
+
+def list_entries(cache_dir=None):
+    """[(entry, bytes, last use)] of the cache, most recently used first."""
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    if not cache_dir.is_dir():
+        return []
+    entries = [(entry, _dir_size(entry), entry.stat().st_mtime) for entry in _entries(cache_dir)]
+    return sorted(entries, key=lambda e: e[2], reverse=True)
+
+
+def clear(cache_dir=None):
+    """Remove every entry of the cache that no process is using."""
+    evict(cache_dir, max_bytes=0, grace=0.0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Inspect or clean the cache of extracted FMUs")
+    parser.add_argument("command", choices=["info", "clear", "prune"])
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "clear":
+        clear(args.cache_dir)
+    elif args.command == "prune":
+        evict(args.cache_dir)
+
+    entries = list_entries(args.cache_dir)
+    total = sum(size for _, size, _ in entries)
+    print(f"📦 {args.cache_dir}: {len(entries)} FMUs, {total / 2**20:.1f} MiB (limit {MAX_CACHE_BYTES / 2**20:.0f} MiB)")
+    for entry, size, mtime in entries:
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime))
+        print(f"   {entry.name[:16]}  {size / 2**20:8.1f} MiB  last used {last_used}")
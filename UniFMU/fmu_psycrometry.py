@@ -1,6 +1,6 @@
 import pandas as pd
 
-def compute_balances_simplified(inputs):
+def compute_balances_simplified(inputs, rho_air=1.2, Cp_air=1010):
     """
     Simplified mass and energy balance calculator for an air-based drying process.
 
@@ -10,6 +10,8 @@ def compute_balances_simplified(inputs):
        temp_1, hum_rel_1, temp_3, hum_rel_3, temp_4, vfr_5,
        temp_6, hum_rel_6, temp_7, vfr_8,
        temp_9, hum_rel_9, temp_10, temp_11, vfr_13]
+    - rho_air: [kg/m³] density of dry air
+    - Cp_air: [J/kg·K] specific heat of dry air
 
     Returns:
     - Dictionary with mass flow rates, energy terms and balances
@@ -21,9 +23,7 @@ def compute_balances_simplified(inputs):
      temp_6, hum_rel_6, temp_7, vfr_8,
      temp_9, hum_rel_9, temp_10, temp_11, vfr_13) = inputs
 
-    # Physical constants
-    rho_air = 1.2      # [kg/m³] density of dry air
-    Cp_air = 1010      # [J/kg·K] specific heat of dry air
+    # Physical constants (rho_air and Cp_air are calibrated parameters, see calibrate.py)
     dH_evap = 2.45e6   # [J/kg] latent heat of vaporization (not used here, but available)
 
     # Mass flow rate of air at each key point
@@ -0,0 +1,187 @@
+import sys
+import queue
+import logging
+import threading
+import subprocess
+from pathlib import Path
+from concurrent import futures
+
+import grpc
+
+logger = logging.getLogger(__name__)
+
+FMI2_WARNING = 1
+
+
+def _import_schemas(resources_dir):
+    """Import the generated grpc schemas and the session framing shipped in the FMU's resources/."""
+    resources_dir = str(Path(resources_dir).resolve())
+    if resources_dir not in sys.path:
+        sys.path.insert(0, resources_dir)
+    from schemas import unifmu_fmi2_pb2, unifmu_fmi2_pb2_grpc
+    import session_protocol
+
+    return unifmu_fmi2_pb2, unifmu_fmi2_pb2_grpc, session_protocol
+
+
+class GrpcBackendProcess:
+    """Launches resources/backend_grpc.py of an extracted UniFMU FMU and performs the handshake.
+
+    This is what the UniFMU binary does when the FMU is instantiated; doing it from Python
+    gives the host access to the session transport that the binary does not use.
+    """
+
+    def __init__(self, unzipdir, python: str = sys.executable, timeout: float = 30.0, **popen_kwargs):
+        self.resources_dir = Path(unzipdir) / "resources"
+        self.python = python
+        self.timeout = timeout
+        self.popen_kwargs = popen_kwargs
+        self.pb2, self.pb2_grpc, self.protocol = _import_schemas(self.resources_dir)
+        self.process = None
+        self.channel = None
+
+    def start(self):
+        endpoint = queue.Queue()
+        pb2, pb2_grpc = self.pb2, self.pb2_grpc
+
+        class Handshaker(pb2_grpc.HandshakerServicer):
+            def PerformHandshake(self, request, context):
+                endpoint.put(f"{request.ip_address}:{request.port}")
+                return pb2.Void()
+
+        handshake_server = grpc.server(futures.ThreadPoolExecutor(max_workers=1))
+        pb2_grpc.add_HandshakerServicer_to_server(Handshaker(), handshake_server)
+        port = handshake_server.add_insecure_port("127.0.0.1:0")
+        handshake_server.start()
+
+        try:
+            self.process = subprocess.Popen(
+                [self.python, "backend_grpc.py", "--handshake-endpoint", f"127.0.0.1:{port}"],
+                cwd=self.resources_dir,
+                **self.popen_kwargs,
+            )
+            command_endpoint = endpoint.get(timeout=self.timeout)
+        except queue.Empty:
+            self.process.kill()
+            raise TimeoutError("the backend did not perform the handshake in time")
+        finally:
+            # grace period so the backend receives the reply to its PerformHandshake
+            handshake_server.stop(grace=1.0)
+
+        self.channel = grpc.insecure_channel(command_endpoint)
+        logger.info(f"Connected to grpc backend at {command_endpoint}")
+        return self
+
+    def unary(self):
+        return UnaryCommandClient(self)
+
+    def session(self):
+        return SessionCommandClient(self)
+
+    def close(self):
+        if self.process is not None:
+            self.process.wait(timeout=self.timeout)
+            self.process = None
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+
+class _CommandClient:
+    """FMI helpers shared by both transports; subclasses implement _call(method, request)."""
+
+    def __init__(self, backend: GrpcBackendProcess):
+        self.pb2 = backend.pb2
+
+    def _status(self, method, request):
+        reply = self._call(method, request)
+        if reply.status > FMI2_WARNING:
+            raise RuntimeError(f"{method} failed with status {reply.status}")
+        return reply
+
+    def setup_experiment(self, start_time=0.0, stop_time=None, tolerance=None):
+        request = self.pb2.SetupExperiment(
+            start_time=start_time,
+            stop_time=stop_time or 0.0,
+            tolerance=tolerance or 0.0,
+            has_stop_time=stop_time is not None,
+            has_tolerance=tolerance is not None,
+        )
+        return self._status("Fmi2SetupExperiment", request).status
+
+    def enter_initialization_mode(self):
+        return self._status("Fmi2EnterInitializationMode", self.pb2.EnterInitializationMode()).status
+
+    def exit_initialization_mode(self):
+        return self._status("Fmi2ExitInitializationMode", self.pb2.ExitInitializationMode()).status
+
+    def set_real(self, vrs, values):
+        return self._status("Fmi2SetReal", self.pb2.SetReal(references=vrs, values=values)).status
+
+    def get_real(self, vrs):
+        return list(self._status("Fmi2GetReal", self.pb2.GetXXX(references=vrs)).values)
+
+    def do_step(self, current_time, step_size, no_step_prior=False):
+        request = self.pb2.DoStep(current_time=current_time, step_size=step_size, no_step_prior=no_step_prior)
+        return self._status("Fmi2DoStep", request).status
+
+    def terminate(self):
+        return self._status("Fmi2Terminate", self.pb2.Terminate()).status
+
+    def free_instance(self):
+        return self._status("Fmi2FreeInstance", self.pb2.FreeInstance()).status
+
+
+class UnaryCommandClient(_CommandClient):
+    """One unary RPC per FMI call, the protocol used by the UniFMU binary."""
+
+    def __init__(self, backend: GrpcBackendProcess):
+        super().__init__(backend)
+        self.stub = backend.pb2_grpc.SendCommandStub(backend.channel)
+
+    def _call(self, method, request):
+        return getattr(self.stub, method)(request)
+
+    def close(self):
+        try:
+            self.free_instance()
+        except grpc.RpcError:
+            pass  # the backend stops its server while answering FreeInstance
+
+
+class SessionCommandClient(_CommandClient):
+    """All FMI calls of the instance travel over one long-lived bidirectional stream."""
+
+    _END = object()
+
+    def __init__(self, backend: GrpcBackendProcess):
+        super().__init__(backend)
+        protocol = backend.protocol
+        self.tags = protocol.SESSION_TAGS
+        self._requests = queue.SimpleQueue()
+        session = backend.channel.stream_stream(
+            f"/{protocol.SESSION_SERVICE}/{protocol.SESSION_METHOD}",
+            request_serializer=protocol.encode,
+            response_deserializer=protocol.decode_reply,
+        )
+        self._replies = session(iter(self._requests.get, self._END))
+        self._lock = threading.Lock()
+
+    def _call(self, method, request):
+        tag = self.tags[method]
+        with self._lock:
+            self._requests.put((tag, request))
+            reply_tag, reply = next(self._replies)
+        if reply_tag != tag:
+            raise RuntimeError(f"session out of sync: sent {method} but received a reply for tag {reply_tag}")
+        return reply
+
+    def close(self):
+        self.free_instance()
+        # closing our side of the stream lets the backend shut down after the FreeInstance reply
+        self._requests.put(self._END)
+        try:
+            for _ in self._replies:
+                pass
+        except grpc.RpcError:
+            pass  # the backend stops its server once the stream is closed
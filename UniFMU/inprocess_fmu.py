@@ -0,0 +1,222 @@
+import sys
+import logging
+import importlib.util
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from fmpy.fmi2 import FMU2Slave
+from fmpy.simulation import FMICallException
+
+logger = logging.getLogger(__name__)
+
+FMI2_WARNING = 1
+
+_model_modules = {}
+
+
+def is_unifmu_python_fmu(unzipdir) -> bool:
+    """True if the extracted FMU is a UniFMU FMU whose model is implemented in Python (resources/model.py)."""
+    resources = Path(unzipdir) / "resources"
+    return all((resources / name).is_file() for name in ("model.py", "fmi2.py", "launch.toml"))
+
+
+def declares_step_skipping(unzipdir) -> bool:
+    """True if modelDescription.xml declares the outputs an algebraic function of the inputs.
+
+    <VendorAnnotations><Tool name="unifmu"><StepSkipping algebraic="true" /></Tool></VendorAnnotations>
+    tells the host that a step with unchanged inputs cannot change the outputs, so it may be skipped.
+    """
+    tree = ET.parse(Path(unzipdir) / "modelDescription.xml")
+    element = tree.find("VendorAnnotations/Tool[@name='unifmu']/StepSkipping")
+    return element is not None and element.get("algebraic", "false").lower() == "true"
+
+
+def load_model_module(resources_dir):
+    """Import resources/model.py of an extracted UniFMU FMU under a private module name.
+
+    model.py imports its base class with `from fmi2 import ...`, exactly as it does when the
+    backend runs from inside resources/, so resources/ is put first on sys.path while importing
+    and any unrelated `fmi2` module is restored afterwards.
+    """
+    resources_dir = Path(resources_dir).resolve()
+    if resources_dir in _model_modules:
+        return _model_modules[resources_dir]
+
+    previous_fmi2 = sys.modules.pop("fmi2", None)
+    sys.path.insert(0, str(resources_dir))
+    try:
+        module_name = f"_unifmu_model_{len(_model_modules)}"
+        spec = importlib.util.spec_from_file_location(module_name, resources_dir / "model.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(resources_dir))
+        sys.modules.pop("fmi2", None)
+        if previous_fmi2 is not None:
+            sys.modules["fmi2"] = previous_fmi2
+
+    _model_modules[resources_dir] = module
+    return module
+
+
+class InProcessFMU2Slave:
+    """Drop-in replacement for fmpy.fmi2.FMU2Slave that runs a UniFMU Python model in this process.
+
+    The Model class is imported from the extracted resources/ and called the same way the
+    UniFMU backends call it, so values match the RPC path bit for bit while every FMI call
+    costs a Python method call instead of a round trip to the backend process.
+
+    Only the FMU2Slave methods are provided, not the fmi2* C functions, so FMPy's Input
+    (input_signals of simulateCS_custom) cannot drive it; use an InputSchedule instead.
+    """
+
+    def __init__(self, guid=None, unzipDirectory=None, modelIdentifier=None, instanceName=None, **kwargs):
+        self.guid = guid
+        self.unzipDirectory = str(unzipDirectory)
+        self.modelIdentifier = modelIdentifier
+        self.instanceName = instanceName if instanceName is not None else modelIdentifier
+        self.model_module = load_model_module(Path(self.unzipDirectory) / "resources")
+        self.slave = None
+
+    def _check(self, function, status):
+        # same contract as FMPy: anything worse than a warning raises
+        if status > FMI2_WARNING:
+            raise FMICallException(function, status)
+        return status
+
+    # --------- lifecycle --------------
+    def instantiate(self, visible=False, callbacks=None, loggingOn=False):
+        reference_to_attr = {}
+        with open(Path(self.unzipDirectory) / "modelDescription.xml") as f:
+            for v in ET.parse(f).find("ModelVariables"):
+                reference_to_attr[int(v.attrib["valueReference"])] = v.attrib["name"]
+
+        backend_logger = logging.getLogger("Python FMI backend")
+        n_handlers = len(backend_logger.handlers)
+        self.slave = self.model_module.Model(reference_to_attr)
+        # Fmi2FMU.__init__ adds a stream handler per instance, keep only one when many live in one process
+        if n_handlers > 0:
+            del backend_logger.handlers[n_handlers:]
+
+    def setDebugLogging(self, loggingOn, categories):
+        return self._check("fmi2SetDebugLogging", self.slave.set_debug_logging(categories, loggingOn))
+
+    def setupExperiment(self, tolerance=None, startTime=0.0, stopTime=None):
+        return self._check("fmi2SetupExperiment", self.slave.setup_experiment(startTime, stopTime, tolerance))
+
+    def enterInitializationMode(self):
+        return self._check("fmi2EnterInitializationMode", self.slave.enter_initialization_mode())
+
+    def exitInitializationMode(self):
+        return self._check("fmi2ExitInitializationMode", self.slave.exit_initialization_mode())
+
+    def terminate(self):
+        return self._check("fmi2Terminate", self.slave.terminate())
+
+    def reset(self):
+        return self._check("fmi2Reset", self.slave.reset())
+
+    def freeInstance(self):
+        self.slave = None
+
+    def freeLibrary(self):
+        pass
+
+    # --------- getters and setters --------------
+    def _get(self, function, vr, convert):
+        status, values = self.slave.get_xxx(list(vr))
+        self._check(function, status)
+        return [convert(v) for v in values]
+
+    def _set(self, function, vr, value, convert):
+        return self._check(function, self.slave.set_xxx(list(vr), [convert(v) for v in value]))
+
+    def getReal(self, vr):
+        return self._get("fmi2GetReal", vr, float)
+
+    def getInteger(self, vr):
+        return self._get("fmi2GetInteger", vr, int)
+
+    def getBoolean(self, vr):
+        return self._get("fmi2GetBoolean", vr, bool)
+
+    def getString(self, vr):
+        # FMPy returns the raw fmi2String values, i.e. bytes
+        return self._get("fmi2GetString", vr, lambda s: s.encode("utf-8") if isinstance(s, str) else s)
+
+    def setReal(self, vr, value):
+        return self._set("fmi2SetReal", vr, value, float)
+
+    def setInteger(self, vr, value):
+        return self._set("fmi2SetInteger", vr, value, int)
+
+    def setBoolean(self, vr, value):
+        return self._set("fmi2SetBoolean", vr, value, bool)
+
+    def setString(self, vr, value):
+        return self._set("fmi2SetString", vr, value, str)
+
+    # --------- co-sim --------------
+    def doStep(self, currentCommunicationPoint, communicationStepSize, noSetFMUStatePriorToCurrentPoint=1):
+        status = self.slave.do_step(currentCommunicationPoint, communicationStepSize, bool(noSetFMUStatePriorToCurrentPoint))
+        return self._check("fmi2DoStep", status)
+
+    def cancelStep(self):
+        return self._check("fmi2CancelStep", self.slave.cancel_step())
+
+    def getStatus(self, kind):
+        status, value = self.slave.get_xxx_status(kind)
+        self._check("fmi2GetStatus", status)
+        return value
+
+    getRealStatus = getStatus
+    getIntegerStatus = getStatus
+    getBooleanStatus = getStatus
+    getStringStatus = getStatus
+
+    def getDirectionalDerivative(self, vUnknown_ref, vKnown_ref, dvKnown):
+        return list(self.slave.get_directional_derivative(list(vUnknown_ref), list(vKnown_ref), list(dvKnown)))
+
+    # --------- FMU state --------------
+    # the state handle is the serialized model itself, so (de)serialization is free
+    def getFMUstate(self):
+        status, state = self.slave.serialize()
+        self._check("fmi2GetFMUstate", status)
+        return state
+
+    def setFMUstate(self, state):
+        return self._check("fmi2SetFMUstate", self.slave.deserialize(state))
+
+    def freeFMUstate(self, state):
+        pass
+
+    def serializeFMUstate(self, state):
+        return bytes(state)
+
+    def deSerializeFMUstate(self, serializedState, state=None):
+        return bytes(serializedState)
+
+    getFMUState = getFMUstate
+    setFMUState = setFMUstate
+    freeFMUState = freeFMUstate
+    serializeFMUState = serializeFMUstate
+    deserializeFMUState = deSerializeFMUstate
+
+
+def open_fmu_slave(model_description, unzipdir, instance_name="instance1", in_process=False):
+    """Create the co-simulation slave for an extracted FMU.
+
+    With in_process=True a UniFMU Python FMU is executed by InProcessFMU2Slave, any other FMU
+    falls back to FMPy's FMU2Slave.
+    """
+    kwargs = dict(
+        guid=model_description.guid,
+        unzipDirectory=unzipdir,
+        modelIdentifier=model_description.coSimulation.modelIdentifier,
+        instanceName=instance_name,
+    )
+    if in_process:
+        if is_unifmu_python_fmu(unzipdir):
+            logger.info("Running UniFMU Python model in-process")
+            return InProcessFMU2Slave(**kwargs)
+        logger.warning(f"{unzipdir} is not a UniFMU Python FMU, falling back to FMU2Slave")
+    return FMU2Slave(**kwargs)
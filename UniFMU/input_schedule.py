@@ -0,0 +1,209 @@
+"""Input schedules read from memory-mapped binary files.
+
+A historian CSV is converted once into <csv>.npy (float64 rows [time, signals...], sorted
+by time) plus a <csv>.npy.json sidecar with the signal names. Later runs memory-map the
+.npy, so only the pages around the current simulation time are ever read, whatever the
+size of the history:
+
+    python UniFMU/input_schedule.py compile historian.csv
+
+During the run a cursor moves forward through the rows instead of searching them on every
+step, and all inputs are written with one setReal() call. Per signal the interpolation is
+
+    linear  straight line between the samples around t (default)
+    hold    value of the last sample at or before t
+    step    value of the first sample at or after t
+
+Before the first and after the last sample the first and last values are held.
+"""
+import os
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+INTERPOLATIONS = ("linear", "hold", "step")
+
+
+def _count_lines(path) -> int:
+    with open(path, "rb") as f:
+        return sum(block.count(b"\n") for block in iter(lambda: f.read(2**24), b""))
+
+
+def compile_csv(csv_path, npy_path=None, time_column="time", chunk_rows=1_000_000, sep=",") -> Path:
+    """Convert a CSV with a time column into a memory-mappable .npy, chunk by chunk.
+
+    The result is reused as long as it is newer than the CSV. Rows must be sorted by time.
+    """
+    csv_path = Path(csv_path)
+    npy_path = Path(npy_path) if npy_path else csv_path.with_name(csv_path.name + ".npy")
+    sidecar = npy_path.with_name(npy_path.name + ".json")
+    if npy_path.is_file() and sidecar.is_file() and npy_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        return npy_path
+
+    t0 = time.perf_counter()
+    names = pd.read_csv(csv_path, nrows=0, sep=sep).columns.tolist()
+    if time_column not in names:
+        raise ValueError(f"'{csv_path}' has no time column '{time_column}'")
+    signals = [name for name in names if name != time_column]
+    columns = [time_column] + signals
+
+    # upper bound of the row count, so the .npy can be created before parsing
+    capacity = _count_lines(csv_path)
+    tmp = npy_path.with_name(f".{npy_path.name}.{os.getpid()}.tmp")
+    data = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float64, shape=(capacity, len(columns)))
+    n_rows = 0
+    last_time = -np.inf
+    for chunk in pd.read_csv(csv_path, usecols=columns, sep=sep, chunksize=chunk_rows):
+        block = chunk[columns].to_numpy(dtype=np.float64)
+        if len(block) and (block[0, 0] < last_time or np.any(np.diff(block[:, 0]) < 0)):
+            raise ValueError(f"'{csv_path}' is not sorted by '{time_column}' around row {n_rows}")
+        data[n_rows:n_rows + len(block)] = block
+        n_rows += len(block)
+        last_time = block[-1, 0] if len(block) else last_time
+    data.flush()
+    del data
+
+    os.replace(tmp, npy_path)
+    sidecar.write_text(json.dumps({"columns": columns, "rows": n_rows, "source": str(csv_path)}))
+    logger.info(f"Compiled {csv_path} ({n_rows} rows, {len(signals)} signals) to {npy_path} in {time.perf_counter() - t0:.2f} s")
+    return npy_path
+
+
+def load_schedule_file(path, time_column="time"):
+    """(times, values, names) of a compiled .npy (memory-mapped) or of a CSV, compiling it first."""
+    path = Path(path)
+    if path.suffix != ".npy":
+        path = compile_csv(path, time_column=time_column)
+    meta = json.loads(path.with_name(path.name + ".json").read_text())
+    data = np.load(path, mmap_mode="r")[:meta["rows"]]
+    return data[:, 0], data[:, 1:], meta["columns"][1:]
+
+
+class InputSchedule:
+    """Values of a set of signals over time, applied to an FMU step by step.
+
+    times is a sorted array of sample times, values a (len(times), n_signals) array (both
+    may be memory-mapped) and names the signal names. interpolation is one method for all
+    signals or a {name: method} dict, unlisted signals are linear.
+
+    It can stand in for FMPy's Input in simulateCS_custom() once it is bound to an FMU.
+    """
+
+    def __init__(self, times, values, names, interpolation="linear"):
+        self.times = times
+        self.values = values
+        self.names = list(names)
+        if values.shape != (len(times), len(self.names)):
+            raise ValueError(f"Expected values of shape {(len(times), len(self.names))}, got {values.shape}")
+        if len(times) == 0:
+            raise ValueError("An input schedule needs at least one sample")
+
+        if isinstance(interpolation, str):
+            interpolation = dict.fromkeys(self.names, interpolation)
+        unknown = {method for method in interpolation.values() if method not in INTERPOLATIONS}
+        if unknown:
+            raise ValueError(f"Unknown interpolation {sorted(unknown)}, expected one of {INTERPOLATIONS}")
+        methods = np.array([interpolation.get(name, "linear") for name in self.names])
+        self._linear = methods == "linear"
+        self._step = methods == "step"
+
+        self._cursor = 0
+        self._out = np.empty(len(self.names))
+        self.fmu = None
+        self.vrs = None
+        self._applied = None
+
+    @classmethod
+    def from_file(cls, path, interpolation="linear", time_column="time"):
+        """Schedule of a compiled .npy or a CSV (compiled on first use)."""
+        return cls(*load_schedule_file(path, time_column), interpolation=interpolation)
+
+    def bind(self, fmu, model_description, ignore_unknown=True):
+        """Apply to fmu the signals whose names are variables of the model; the others are dropped."""
+        vrs = {v.name: v.valueReference for v in model_description.modelVariables}
+        unknown = [name for name in self.names if name not in vrs]
+        if unknown and not ignore_unknown:
+            raise ValueError(f"Input schedule signals are no model variables: {unknown}")
+        if unknown:
+            logger.warning(f"Ignoring input schedule signals that are no model variables: {unknown}")
+        self._columns = np.array([j for j, name in enumerate(self.names) if name in vrs], dtype=np.int64)
+        self.vrs = [vrs[self.names[j]] for j in self._columns]
+        self.fmu = fmu
+        self._applied = None
+        return self
+
+    def _seek(self, t):
+        """Index i with times[i] <= t < times[i + 1], moving forward from the previous call."""
+        times = self.times
+        i = self._cursor
+        if t < times[i]:
+            # time went backwards (a new run): search once, then continue moving forward
+            i = max(int(np.searchsorted(times, t, side="right")) - 1, 0)
+        last = len(times) - 1
+        if i < last and times[i + 1] <= t:
+            if i + 2 > last or times[i + 2] > t:
+                i += 1
+            else:
+                # several samples per step: binary search in the rest instead of walking
+                i += int(np.searchsorted(times[i:], t, side="right")) - 1
+        self._cursor = i
+        return i
+
+    def at(self, t) -> np.ndarray:
+        """Values of all signals at time t; the returned array is reused by the next call."""
+        i = self._seek(t)
+        out = self._out
+        v0 = self.values[i]
+        if i == len(self.times) - 1 or t <= self.times[0]:
+            out[:] = v0
+            return out
+        t0, t1 = self.times[i], self.times[i + 1]
+        v1 = self.values[i + 1]
+        out[:] = v0
+        if t > t0:
+            np.copyto(out, v1, where=self._step)
+            w = (t - t0) / (t1 - t0)
+            np.copyto(out, v0 + w * (v1 - v0), where=self._linear)
+        return out
+
+    def apply(self, time, after_event=False):
+        """Set all bound inputs for time with one setReal() call and return the values (the signature of FMPy's Input.apply)."""
+        values = self.at(time)[self._columns]
+        self.fmu.setReal(self.vrs, values.tolist())
+        self._applied = values
+        return values
+
+    def apply_if_changed(self, time):
+        """(values, changed): like apply(), but setReal() is only called if a value differs from the last call."""
+        values = self.at(time)[self._columns]
+        if self._applied is not None and np.array_equal(values, self._applied):
+            return values, False
+        self.fmu.setReal(self.vrs, values.tolist())
+        self._applied = values
+        return values, True
+
+    def nextEvent(self, time):
+        """No events are scheduled; part of FMPy's Input interface for FMI 3 loops."""
+        return float("inf")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Convert input histories to memory-mappable schedules")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compile_parser = sub.add_parser("compile", help="convert a CSV to <csv>.npy")
+    compile_parser.add_argument("csv_path", type=Path)
+    compile_parser.add_argument("npy_path", type=Path, nargs="?")
+    compile_parser.add_argument("--time-column", default="time")
+    compile_parser.add_argument("--sep", default=",")
+    args = parser.parse_args()
+
+    npy_path = compile_csv(args.csv_path, args.npy_path, time_column=args.time_column, sep=args.sep)
+    times, values, names = load_schedule_file(npy_path)
+    print(f"✅ {npy_path}: {len(times)} samples of {len(names)} signals, t = {times[0]} … {times[-1]}")
@@ -0,0 +1,198 @@
+"""Pool of instantiated FMUs that are reused for back-to-back runs.
+
+Instantiating a UniFMU FMU starts a Python backend process, so a sweep or a service that
+runs many scenarios should not pay that for every run. A run checks an instance out of the
+pool, gets it reset and initialized with fresh start values, and returns it afterwards:
+
+    pool = FMUInstancePool(model_description, unzipdir, max_instances=2)
+    with pool.checkout({"regen_target_temp": 70.0}, start_time=0.0) as fmu:
+        ...  # fmu is in step mode
+    pool.close()
+
+An instance is dropped instead of being returned when the run raised, when it fails the
+health check after reset, after max_uses runs, or after max_idle seconds without use.
+"""
+import time
+import logging
+import threading
+import contextlib
+
+from inprocess_fmu import open_fmu_slave
+from variable_index import load_variable_index
+
+logger = logging.getLogger(__name__)
+
+
+class PooledInstance:
+    """One instantiated FMU and its bookkeeping."""
+
+    def __init__(self, fmu, instance_id):
+        self.fmu = fmu
+        self.id = instance_id
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+
+class FMUInstancePool:
+    """Keeps up to max_instances instantiated FMUs of one model warm.
+
+    checkout() blocks while all instances are checked out. The pool is thread-safe; an
+    instance is only ever used by the thread that checked it out.
+    """
+
+    def __init__(self, model_description, unzipdir, max_instances=1, in_process=False,
+                 max_uses=None, max_idle=None, instance_name="pooled"):
+        self.model_description = model_description
+        self.unzipdir = unzipdir
+        self.max_instances = max_instances
+        self.in_process = in_process
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self.instance_name = instance_name
+
+        self.variables = load_variable_index(unzipdir)
+        self.vrs = self.variables.vrs
+        # reset() of UniFMU Python models does not restore values, so every checkout sets all start values
+        self.default_start_values = self.variables.start_values(("input", "parameter"), "Real")
+        outputs = self.variables.select("output")[1]
+        self._probe_vrs = outputs[:1] or [next(iter(self.vrs.values()))]
+
+        self._idle = []
+        self._n_instances = 0
+        self._n_created = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self.stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    # --------- instances --------------
+    def _create(self):
+        with self._condition:
+            self._n_created += 1
+            instance_id = self._n_created
+        fmu = open_fmu_slave(self.model_description, self.unzipdir,
+                             instance_name=f"{self.instance_name}{instance_id}", in_process=self.in_process)
+        fmu.instantiate()
+        self.stats["created"] += 1
+        logger.debug(f"Instantiated pooled FMU {instance_id}")
+        return PooledInstance(fmu, instance_id)
+
+    def _new_instance(self):
+        """Create an instance for a slot already counted in _n_instances, releasing the slot on failure."""
+        try:
+            return self._create()
+        except Exception:
+            with self._condition:
+                self._n_instances -= 1
+                self._condition.notify()
+            raise
+
+    def _discard(self, instance, reason):
+        logger.info(f"Dropping pooled FMU {instance.id} after {instance.uses} runs: {reason}")
+        try:
+            instance.fmu.freeInstance()
+        except Exception as e:
+            logger.warning(f"freeInstance of pooled FMU {instance.id} failed: {e}")
+        self.stats["discarded"] += 1
+        with self._condition:
+            self._n_instances -= 1
+            self._condition.notify()
+
+    def _healthy(self, instance) -> bool:
+        """Reset the instance and check that it still answers."""
+        try:
+            instance.fmu.reset()
+            instance.fmu.getReal(self._probe_vrs)
+            return True
+        except Exception as e:
+            self._discard(instance, f"health check failed ({e})")
+            return False
+
+    def _acquire(self):
+        """An idle instance, or None if the caller may create a new one."""
+        self.evict_idle()
+        with self._condition:
+            while not self._idle and self._n_instances >= self.max_instances:
+                self._condition.wait()
+            if self._idle:
+                # most recently used first, the others can age out through max_idle
+                return self._idle.pop()
+            self._n_instances += 1
+            return None
+
+    # --------- public API --------------
+    def warm(self, n=None):
+        """Instantiate instances up front so the first runs do not pay for it."""
+        n = self.max_instances if n is None else min(n, self.max_instances)
+        while True:
+            with self._condition:
+                if self._n_instances >= n:
+                    return
+                self._n_instances += 1
+            instance = self._new_instance()
+            with self._condition:
+                self._idle.append(instance)
+                self._condition.notify()
+
+    @contextlib.contextmanager
+    def checkout(self, start_values=None, start_time=0.0, stop_time=None, tolerance=None):
+        """Yield an instance that is initialized with the default start values updated by start_values."""
+        values = {**self.default_start_values, **(start_values or {})}
+
+        while True:
+            instance = self._acquire()
+            if instance is None:
+                instance = self._new_instance()
+            elif self._healthy(instance):
+                self.stats["reused"] += 1
+            else:
+                continue
+            break
+
+        fmu = instance.fmu
+        try:
+            fmu.setupExperiment(tolerance=tolerance, startTime=start_time, stopTime=stop_time)
+            fmu.enterInitializationMode()
+            if values:
+                fmu.setReal([self.vrs[name] for name in values], list(values.values()))
+            fmu.exitInitializationMode()
+            yield fmu
+            fmu.terminate()
+        except BaseException as e:
+            self._discard(instance, f"run failed ({type(e).__name__})")
+            raise
+
+        instance.uses += 1
+        instance.last_used = time.monotonic()
+        if self._closed:
+            self._discard(instance, "pool closed")
+        elif self.max_uses is not None and instance.uses >= self.max_uses:
+            self._discard(instance, f"reached max_uses={self.max_uses}")
+        else:
+            with self._condition:
+                self._idle.append(instance)
+                self._condition.notify()
+
+    def evict_idle(self):
+        """Free instances that have been idle for more than max_idle seconds."""
+        if self.max_idle is None:
+            return
+        now = time.monotonic()
+        with self._condition:
+            expired = [instance for instance in self._idle if now - instance.last_used > self.max_idle]
+            self._idle = [instance for instance in self._idle if instance not in expired]
+        for instance in expired:
+            self._discard(instance, f"idle for more than {self.max_idle} s")
+
+    def close(self):
+        """Free every idle instance; instances still checked out are freed when they are returned."""
+        self._closed = True
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for instance in idle:
+            self._discard(instance, "pool closed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,152 @@
+"""Run K instances of one FMU through the same time grid in lockstep, one thread per instance.
+
+FMU2Slave calls go through ctypes, which releases the GIL while the UniFMU binary waits for
+its backend process. K threads can therefore keep K backend processes busy from a single
+host process, without pickling designs and results between processes as a process pool
+does:
+
+    results = run_lockstep(model_description, unzipdir, [{"temp_1": 20.0}, {"temp_1": 30.0}],
+                           start_time=0.0, stop_time=3600.0, step_size=1.0)
+    results.shape  # (K, rows, 1 + inputs + outputs)
+
+All instances wait for each other at every communication point (a threading.Barrier), so a
+callback sees the rows of all instances for the same time. In-process FMUs hold the GIL and
+do not run concurrently; use the RPC path (in_process=False) to scale.
+
+    python UniFMU/lockstep_runner.py --table scenarios.csv --stop 3600
+"""
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+import numpy as np
+
+from instance_pool import FMUInstancePool
+from fmu_cache import open_cached_fmu
+from simulate_fmu import n_communication_points
+from variable_index import load_variable_index
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_NAMES = ["mass_balance", "energy_balance", "mdot_air_in", "mdot_air_out", "Q_in", "Q_out"]
+
+
+def run_lockstep(model_description, unzipdir, scenarios, start_time=0.0, stop_time=10.0, step_size=1.0,
+                 schedules=None, output_names=OUTPUT_NAMES, in_process=False, on_point=None, pool=None) -> np.ndarray:
+    """Simulate one instance per scenario ({name: start value}) and return the stacked float64 rows.
+
+    The result has shape (len(scenarios), rows, 1 + inputs + outputs) with the columns
+    [time, Real inputs..., outputs...] of simulate_fmu.simulate_loop. schedules is an
+    optional list with an InputSchedule (or None) per scenario.
+
+    on_point(i, time, rows) is called once per communication point after all instances
+    have finished the step, rows being the (K, columns) view of row i; returning False
+    stops all instances. An existing FMUInstancePool with max_instances >= K can be passed
+    in to reuse its instances.
+    """
+    k = len(scenarios)
+    schedules = schedules or [None] * k
+    variables = load_variable_index(unzipdir)
+    input_vrs = variables.select("input", "Real")[1]
+    output_vrs = [variables.vrs[name] for name in output_names]
+    n_inputs = len(input_vrs)
+    n_rows = n_communication_points(start_time, stop_time, step_size)
+    times = start_time + step_size * np.arange(n_rows)
+
+    data = np.full((k, n_rows, 1 + n_inputs + len(output_vrs)), np.nan)
+    data[:, :, 0] = times
+
+    stop = threading.Event()
+    errors = []
+    rows_done = [n_rows]
+
+    def barrier_action():
+        # runs in one thread once all instances finished the step of the current row
+        i = barrier_action.row
+        barrier_action.row += 1
+        if on_point is not None and on_point(i, times[i], data[:, i]) is False:
+            stop.set()
+            rows_done[0] = i + 1
+
+    barrier_action.row = 0
+    barrier = threading.Barrier(k, action=barrier_action)
+
+    own_pool = pool is None
+    if not own_pool and pool.max_instances < k:
+        # the threads would wait for instances at the checkout while the others wait at the barrier
+        raise ValueError(f"The pool holds at most {pool.max_instances} instances, {k} are needed")
+    if own_pool:
+        pool = FMUInstancePool(model_description, unzipdir, max_instances=k, in_process=in_process,
+                               instance_name="lockstep")
+
+    def run(j):
+        schedule = schedules[j]
+        try:
+            with pool.checkout(scenarios[j], start_time=start_time) as fmu:
+                rows = data[j]
+                rows[:, 1:1 + n_inputs] = fmu.getReal(input_vrs)
+                if schedule is not None:
+                    schedule.bind(fmu, model_description)
+                    scheduled = [(s, 1 + input_vrs.index(vr)) for s, vr in enumerate(schedule.vrs) if vr in input_vrs]
+                    src, dst = [s for s, _ in scheduled], [c for _, c in scheduled]
+
+                for i, sim_time in enumerate(times.tolist()):
+                    if schedule is not None:
+                        rows[i, dst] = schedule.apply(sim_time)[src]
+                    fmu.doStep(currentCommunicationPoint=sim_time, communicationStepSize=step_size)
+                    rows[i, 1 + n_inputs:] = fmu.getReal(output_vrs)
+                    barrier.wait()
+                    if stop.is_set():
+                        break
+        except threading.BrokenBarrierError:
+            pass  # another instance failed, its error is reported
+        except BaseException as e:
+            errors.append((j, e))
+            barrier.abort()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(j,), name=f"lockstep-{j}", daemon=True) for j in range(k)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if own_pool:
+            pool.close()
+
+    if errors:
+        j, error = errors[0]
+        raise RuntimeError(f"Lockstep instance {j} failed at row {barrier_action.row}") from error
+
+    elapsed = time.perf_counter() - t0
+    logger.info(f"Lockstep run of {k} instances x {rows_done[0]} steps in {elapsed:.2f} s "
+                f"({k * rows_done[0] / elapsed:.0f} instance-steps/s)")
+    return data[:, :rows_done[0]]
+
+
+if __name__ == "__main__":
+    from parameter_sweep import table_design
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run the scenarios of a table in lockstep, one FMU instance per scenario")
+    parser.add_argument("--fmu", type=Path, default=Path("FMUs/ORIGINAL_modified_auto.fmu"))
+    parser.add_argument("--table", type=Path, required=True, help="CSV file with one scenario per row")
+    parser.add_argument("--out", type=Path, default=Path("results/lockstep.npz"))
+    parser.add_argument("--start", type=float, default=0.0)
+    parser.add_argument("--stop", type=float, default=10.0)
+    parser.add_argument("--step", type=float, default=1.0)
+    parser.add_argument("--in-process", action="store_true", help="run UniFMU Python FMUs in this process (no concurrency)")
+    args = parser.parse_args()
+
+    model_description, unzipdir = open_cached_fmu(args.fmu.resolve())
+    design = table_design(args.table)
+    data = run_lockstep(model_description, unzipdir, design.to_dict("records"), args.start, args.stop, args.step,
+                        in_process=args.in_process)
+
+    input_names = load_variable_index(unzipdir).select("input", "Real")[0]
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(args.out, data=data, scenario_id=design.index.to_numpy(),
+                        columns=np.array(["time"] + input_names + OUTPUT_NAMES))
+    print(f"✅ {data.shape[0]} scenarios x {data.shape[1]} rows saved to: {args.out}")
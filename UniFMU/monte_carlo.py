@@ -0,0 +1,206 @@
+"""Monte Carlo propagation of sensor uncertainty to the balance outputs of the FMU.
+
+Every sensor input (temp_*, RH_*, vfr_*) is drawn around its nominal value with the
+accuracy of the sensor (SENSOR_ACCURACY), the model is evaluated for all draws of a batch
+at once (batch_evaluator.py: vectorized compute_balances_simplified, or FMU instances)
+and the statistics of the outputs are updated after every batch. The run stops early when
+the percentile interval and the confidence interval of the mean of every output have
+stopped moving, relative to the interval width, for `patience` batches:
+
+    python UniFMU/monte_carlo.py --fmu FMUs/ORIGINAL_modified_auto.fmu --n 1000000
+    python UniFMU/monte_carlo.py --normal temp_1=22:0.3 --uniform vfr_5=0.08:0.12 --out results/mc
+
+Results: summary.csv (mean, std, confidence interval of the mean, percentile interval),
+convergence.csv (the statistics after every batch) and monte_carlo.pdf (histograms and
+convergence plots).
+"""
+import time
+import logging
+import argparse
+from pathlib import Path
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+
+from batch_evaluator import make_evaluator
+
+logger = logging.getLogger(__name__)
+
+# === SENSOR ACCURACY ===
+# prefix: (kind, value), kind "abs" is a standard deviation in the unit of the signal,
+# "rel" a standard deviation relative to the nominal value
+SENSOR_ACCURACY = {
+    "temp_": ("abs", 0.5),   # K
+    "RH_": ("abs", 0.02),    # relative humidity as a fraction
+    "vfr_": ("rel", 0.03),   # 3 % of reading
+}
+BALANCE_OUTPUTS = ("energy_balance", "mass_balance")
+
+
+# --------- input distributions --------------
+def sensor_distributions(nominal: dict, accuracy=SENSOR_ACCURACY) -> dict:
+    """{name: ("normal", mean, sd)} for every nominal value whose name starts with a sensor prefix."""
+    distributions = {}
+    for name, value in nominal.items():
+        for prefix, (kind, sd) in accuracy.items():
+            if name.startswith(prefix):
+                distributions[name] = ("normal", value, sd * abs(value) if kind == "rel" else sd)
+                break
+    return distributions
+
+
+def draw(distributions: dict, n: int, rng) -> dict:
+    """n draws of every variable: ("normal", mean, sd) or ("uniform", low, high)."""
+    samples = {}
+    for name, (kind, a, b) in distributions.items():
+        if kind == "normal":
+            samples[name] = rng.normal(a, b, n)
+        elif kind == "uniform":
+            samples[name] = rng.uniform(a, b, n)
+        else:
+            raise ValueError(f"Unknown distribution '{kind}' of {name}")
+    return samples
+
+
+# --------- statistics --------------
+def summarize(values: np.ndarray, confidence=0.95) -> dict:
+    """Mean with its confidence interval and the central percentile interval of the values."""
+    n = len(values)
+    mean = float(np.mean(values))
+    std = float(np.std(values, ddof=1)) if n > 1 else 0.0
+    half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * std / np.sqrt(n)
+    alpha = 100 * (1 - confidence) / 2
+    p_low, median, p_high = np.percentile(values, [alpha, 50.0, 100 - alpha]).tolist()
+    return {"n": n, "mean": mean, "std": std, "mean_ci_low": mean - half_width, "mean_ci_high": mean + half_width,
+            "p_low": p_low, "median": median, "p_high": p_high}
+
+
+def _stable(previous: dict, current: dict, rtol) -> bool:
+    """Whether the interval bounds moved by less than rtol of the percentile interval width."""
+    scale = max(current["p_high"] - current["p_low"], 1e-12 * max(abs(current["mean"]), 1.0))
+    return all(abs(current[key] - previous[key]) <= rtol * scale
+               for key in ("mean_ci_low", "mean_ci_high", "p_low", "p_high"))
+
+
+def run_monte_carlo(evaluator, distributions: dict, n_max=1_000_000, batch_size=50_000, outputs=BALANCE_OUTPUTS,
+                    confidence=0.95, rtol=1e-3, patience=3, min_draws=100_000, seed=0) -> dict:
+    """Draw batches until n_max draws or until the intervals of all outputs are stable.
+
+    Returns {"values": {output: array of all evaluated draws}, "summary": DataFrame with one
+    row per output, "history": DataFrame with the statistics after every batch,
+    "converged": bool}.
+    """
+    rng = np.random.default_rng(seed)
+    values = {name: np.empty(n_max) for name in outputs}
+    history = []
+    previous = {}
+    stable_batches = 0
+    converged = False
+    n = 0
+    t0 = time.perf_counter()
+    while n < n_max:
+        size = min(batch_size, n_max - n)
+        results = evaluator(draw(distributions, size, rng))
+        for name in outputs:
+            values[name][n:n + size] = results[name]
+        n += size
+
+        current = {name: summarize(values[name][:n], confidence) for name in outputs}
+        history.extend({"output": name, **stats} for name, stats in current.items())
+        stable = bool(previous) and all(_stable(previous[name], current[name], rtol) for name in outputs)
+        stable_batches = stable_batches + 1 if stable else 0
+        previous = current
+        logger.debug(f"{n} draws, {stable_batches} stable batch(es)")
+        if n >= min_draws and stable_batches >= patience:
+            converged = True
+            break
+
+    elapsed = time.perf_counter() - t0
+    logger.info(f"{n} draws in {elapsed:.1f} s ({n / elapsed:.0f} draws/s), "
+                f"{'converged' if converged else f'not converged within {n_max} draws'}")
+    summary = pd.DataFrame([{"output": name, **stats} for name, stats in previous.items()]).set_index("output")
+    return {"values": {name: values[name][:n] for name in outputs}, "summary": summary,
+            "history": pd.DataFrame(history), "converged": converged}
+
+
+# --------- report --------------
+def plot_report(result: dict, pdf_path, bins=100):
+    """One page per output: histogram with the intervals, and the interval bounds over the draws."""
+    with PdfPages(pdf_path) as pdf:
+        for name, values in result["values"].items():
+            stats = result["summary"].loc[name]
+            history = result["history"][result["history"]["output"] == name]
+            fig, (ax_hist, ax_conv) = plt.subplots(2, 1, figsize=(10, 8))
+
+            ax_hist.hist(values, bins=bins, density=True, color="tab:blue", alpha=0.7)
+            ax_hist.axvline(stats["mean"], color="black", label=f"mean {stats['mean']:.4g}")
+            ax_hist.axvspan(stats["p_low"], stats["p_high"], color="tab:orange", alpha=0.2,
+                            label=f"percentile interval [{stats['p_low']:.4g}, {stats['p_high']:.4g}]")
+            ax_hist.set_title(f"{name}: {int(stats['n'])} draws")
+            ax_hist.set_ylabel("density")
+            ax_hist.legend()
+
+            for key, style in (("p_low", "--"), ("p_high", "--"), ("mean_ci_low", "-"), ("mean_ci_high", "-")):
+                ax_conv.plot(history["n"], history[key], style, label=key)
+            ax_conv.set_xscale("log")
+            ax_conv.set_xlabel("draws")
+            ax_conv.set_title("Convergence")
+            ax_conv.legend()
+            ax_conv.grid(True)
+
+            fig.tight_layout()
+            pdf.savefig(fig)
+            plt.close(fig)
+
+
+# --------- command line --------------
+def _parse_distribution(spec, kind):
+    """name=a:b, mean:sd for normal or low:high for uniform"""
+    name, values = spec.split("=", 1)
+    a, b = values.split(":")
+    return name, (kind, float(a), float(b))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Propagate sensor uncertainty through the FMU by Monte Carlo sampling")
+    parser.add_argument("--fmu", type=Path, default=Path("FMUs/ORIGINAL_modified_auto.fmu"))
+    parser.add_argument("--out", type=Path, default=Path("results/monte_carlo"))
+    parser.add_argument("--n", type=int, default=1_000_000, help="maximum number of draws")
+    parser.add_argument("--batch", type=int, default=50_000, help="draws per batch")
+    parser.add_argument("--min-draws", type=int, default=100_000, help="draws before an early stop is allowed")
+    parser.add_argument("--normal", action="append", default=[], help="name=mean:sd, replaces the sensor accuracy of name")
+    parser.add_argument("--uniform", action="append", default=[], help="name=low:high")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--rtol", type=float, default=1e-3, help="stable when the bounds move less than rtol x interval width")
+    parser.add_argument("--patience", type=int, default=3, help="consecutive stable batches before stopping")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["auto", "vectorized", "fmu", "surrogate"], default="auto")
+    parser.add_argument("--surrogate", type=Path, help="surrogate file for --mode surrogate (default next to the FMU)")
+    parser.add_argument("--instances", type=int, default=1, help="FMU instances in fmu mode")
+    parser.add_argument("--in-process", action="store_true", help="run UniFMU Python FMUs in this process")
+    args = parser.parse_args()
+
+    evaluator = make_evaluator(args.fmu.resolve(), args.mode, instances=args.instances, in_process=args.in_process,
+                               surrogate=args.surrogate)
+    try:
+        distributions = sensor_distributions(evaluator.defaults)
+        distributions.update(_parse_distribution(spec, "normal") for spec in args.normal)
+        distributions.update(_parse_distribution(spec, "uniform") for spec in args.uniform)
+        logger.info(f"Sampling {len(distributions)} inputs: {', '.join(distributions)}")
+
+        result = run_monte_carlo(evaluator, distributions, args.n, args.batch, confidence=args.confidence,
+                                 rtol=args.rtol, patience=args.patience, min_draws=args.min_draws, seed=args.seed)
+    finally:
+        evaluator.close()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    result["summary"].to_csv(args.out / "summary.csv")
+    result["history"].to_csv(args.out / "convergence.csv", index=False)
+    plot_report(result, args.out / "monte_carlo.pdf")
+    print(result["summary"].to_string())
+    print(f"✅ Monte Carlo results saved to: {args.out}")
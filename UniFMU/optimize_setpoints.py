@@ -0,0 +1,315 @@
+"""Offline optimization of the regenerator setpoints.
+
+Minimizes the heater power needed for the setpoints while the mass and energy balances
+stay within their bands:
+
+    objective = heater_power + PENALTY_WEIGHT * sum(max(|balance| - band, 0) / band)^2
+    heater_power = rho_air * Cp_air * regen_vfr_setpoint * max(regen_target_temp - temp_1, 0)
+
+The heater power is a proxy computed from the inputs, the FMU does not output it; rho_air
+and Cp_air are the parameters of the FMU (calibrated ones included, see calibrate.py), or
+the values given with --fixed, which are then passed to the FMU as well. The balances
+come from the FMU through batch_evaluator.py. The search runs in normalized
+coordinates within the bounds of the decision variables:
+
+    L-BFGS-B (scipy, if installed) or a projected gradient method with backtracking
+    gradients from fmi2GetDirectionalDerivative if the FMU declares
+    providesDirectionalDerivative, otherwise forward differences evaluated as one batch
+
+Several starts (warm starts from --x0 or an earlier best.json, then Latin hypercube
+points) run in parallel worker processes, each with its own evaluator:
+
+    python UniFMU/optimize_setpoints.py --fmu FMUs/ORIGINAL_modified_auto.fmu --starts 8
+    python UniFMU/optimize_setpoints.py --warm-start results/optimize/best.json --fixed temp_1=30
+"""
+import os
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from batch_evaluator import make_evaluator
+from parameter_sweep import latin_hypercube, parse_bounds
+from simulate_fmu import FMU_PATH
+
+try:
+    from scipy.optimize import minimize
+except ImportError:
+    minimize = None
+
+logger = logging.getLogger(__name__)
+
+# === PROBLEM ===
+DECISION_BOUNDS = {
+    "regen_target_temp": (40.0, 90.0),    # °C
+    "regen_vfr_setpoint": (0.05, 0.3),    # m³/s
+}
+BALANCE_BANDS = {
+    "mass_balance": 0.01,      # kg/s
+    "energy_balance": 500.0,   # W
+}
+PENALTY_WEIGHT = 1e4  # W per squared relative band violation
+AIR_PROPERTIES = ("rho_air", "Cp_air")  # FMU parameters used by the heater power, kg/m³ and J/(kg·K)
+FD_STEP = 1e-6        # forward difference step, as a fraction of the bound range
+
+
+def heater_power(samples: dict, rho_air: float, Cp_air: float) -> np.ndarray:
+    """Power to heat the regeneration air flow from temp_1 to regen_target_temp, in W.
+
+    rho_air and Cp_air are taken from samples when they are sampled.
+    """
+    lift = np.maximum(samples["regen_target_temp"] - samples["temp_1"], 0.0)
+    return samples.get("rho_air", rho_air) * samples.get("Cp_air", Cp_air) * samples["regen_vfr_setpoint"] * lift
+
+
+class SetpointProblem:
+    """Penalized objective over the decision variables, in coordinates u in [0, 1] per variable."""
+
+    def __init__(self, evaluator, bounds=DECISION_BOUNDS, fixed=None, bands=BALANCE_BANDS, penalty=PENALTY_WEIGHT,
+                 fd_step=FD_STEP, gradient="auto"):
+        self.evaluator = evaluator
+        self.names = list(bounds)
+        self.low = np.array([bounds[name][0] for name in self.names], dtype=np.float64)
+        self.span = np.array([bounds[name][1] for name in self.names], dtype=np.float64) - self.low
+        inputs = evaluator.input_names
+        fixed = fixed or {}
+        self.fixed = {name: value for name, value in {**evaluator.defaults, **fixed}.items()
+                      if name in inputs and name not in bounds}
+        # fixed parameters are passed to the FMU too, so both sides of the objective use them
+        parameters = getattr(evaluator, "parameter_names", ())
+        self.fixed.update({name: value for name, value in fixed.items() if name in parameters})
+        missing = [name for name in AIR_PROPERTIES if name not in fixed and name not in evaluator.defaults]
+        if missing:
+            raise ValueError(f"The FMU has no parameters {missing} for the heater power, "
+                             f"regenerate it with update_and_packege_fmu.py or pass them with --fixed")
+        self.air = {name: float(fixed.get(name, evaluator.defaults.get(name))) for name in AIR_PROPERTIES}
+        self.bands = dict(bands)
+        self.penalty = penalty
+        self.fd_step = fd_step
+        self.analytic = gradient != "fd" and getattr(evaluator, "provides_derivatives", False)
+        if gradient == "analytic" and not self.analytic:
+            raise ValueError("The FMU does not provide directional derivatives")
+        self.evaluations = 0
+
+    def to_x(self, u):
+        return self.low + np.asarray(u) * self.span
+
+    def _samples(self, U: np.ndarray) -> dict:
+        X = self.to_x(U)
+        samples = {name: np.full(len(X), value) for name, value in self.fixed.items()}
+        samples.update({name: X[:, j] for j, name in enumerate(self.names)})
+        return samples
+
+    def _objective(self, samples, outputs) -> tuple:
+        power = heater_power(samples, **self.air)
+        violations = {name: np.maximum(np.abs(outputs[name]) - band, 0.0) / band for name, band in self.bands.items()}
+        return power + self.penalty * sum(v ** 2 for v in violations.values()), power, violations
+
+    def evaluate(self, U: np.ndarray) -> tuple:
+        """(objective, heater power, outputs) of the rows of U, one batch call to the evaluator."""
+        U = np.atleast_2d(U)
+        samples = self._samples(U)
+        outputs = self.evaluator(samples)
+        self.evaluations += len(U)
+        objective, power, _ = self._objective(samples, outputs)
+        return objective, power, outputs
+
+    def value(self, u) -> float:
+        return float(self.evaluate(u)[0][0])
+
+    def value_and_gradient(self, u) -> tuple:
+        """Objective and its gradient with respect to u."""
+        u = np.asarray(u, dtype=np.float64)
+        d = len(u)
+        # forward steps, backward where a step would leave [0, 1]
+        h = np.where(u + self.fd_step <= 1.0, self.fd_step, -self.fd_step)
+        U = np.vstack([u, u + np.diag(h)])
+        if not self.analytic:
+            f = self.evaluate(U)[0]
+            return float(f[0]), (f[1:] - f[0]) / h
+
+        # chain rule: the terms computed here are differenced for free, the FMU outputs by their Jacobian
+        samples = self._samples(U)
+        point = {name: float(values[0]) for name, values in samples.items()}
+        base = self.evaluator({name: values[:1] for name, values in samples.items()})
+        self.evaluations += 1
+        # the outputs are held at u, so f varies over the rows only through the terms computed here
+        f, _, violations = self._objective(samples, {name: np.full(d + 1, base[name][0]) for name in self.bands})
+        direct = (f[1:] - f[0]) / h
+        jacobian = self.evaluator.jacobian(point, self.names) * self.span  # per unit of u
+        gradient = direct.copy()
+        for name, band in self.bands.items():
+            row = self.evaluator.output_names.index(name)
+            gradient += self.penalty * 2 * violations[name][0] / band * np.sign(base[name][0]) * jacobian[row]
+        return float(f[0]), gradient
+
+
+# --------- optimizers --------------
+def projected_gradient(problem, u0, max_iter=200, ftol=1e-10) -> dict:
+    """Projected gradient descent on [0, 1]^d with an Armijo backtracking line search."""
+    u = np.clip(np.asarray(u0, dtype=np.float64), 0.0, 1.0)
+    f, g = problem.value_and_gradient(u)
+    step = 1.0 / max(np.abs(g).max(), 1e-12)
+    iterations = 0
+    message = "maximum number of iterations reached"
+    for iterations in range(1, max_iter + 1):
+        while True:
+            u_new = np.clip(u - step * g, 0.0, 1.0)
+            f_new = problem.value(u_new)
+            if f_new <= f - 1e-4 * g @ (u - u_new) or step < 1e-14:
+                break
+            step *= 0.5
+        converged = f_new > f or np.allclose(u_new, u, rtol=0.0, atol=1e-12) or abs(f - f_new) <= ftol * max(1.0, abs(f))
+        if f_new <= f:
+            u, f = u_new, f_new
+        if converged:
+            message = "converged"
+            break
+        f, g = problem.value_and_gradient(u)
+        step *= 2.0
+    return {"u": u, "objective": f, "iterations": iterations, "success": message == "converged", "message": message}
+
+
+def lbfgsb(problem, u0, max_iter=200) -> dict:
+    result = minimize(problem.value_and_gradient, np.clip(u0, 0.0, 1.0), jac=True, method="L-BFGS-B",
+                      bounds=[(0.0, 1.0)] * len(u0), options={"maxiter": max_iter})
+    return {"u": result.x, "objective": float(result.fun), "iterations": int(result.nit), "success": bool(result.success),
+            "message": str(result.message)}
+
+
+# --------- workers --------------
+_worker = {}
+
+
+def _init_worker(fmu_path, mode, in_process, surrogate, problem_kwargs):
+    """Build the evaluator and the problem once per worker process."""
+    logging.getLogger("inprocess_fmu").setLevel(logging.WARNING)
+    logging.getLogger("batch_evaluator").setLevel(logging.WARNING)
+    logging.getLogger("surrogate").setLevel(logging.ERROR)
+    _worker["evaluator"] = make_evaluator(fmu_path, mode, in_process=in_process, surrogate=surrogate)
+    _worker["problem"] = SetpointProblem(_worker["evaluator"], **problem_kwargs)
+
+
+def _run_start(task):
+    start_id, u0, method, max_iter = task
+    problem = _worker["problem"]
+    evaluations = problem.evaluations
+    t0 = time.perf_counter()
+    result = lbfgsb(problem, u0, max_iter) if method == "lbfgsb" else projected_gradient(problem, u0, max_iter)
+    elapsed = time.perf_counter() - t0
+
+    objective, power, outputs = problem.evaluate(result["u"])
+    row = {"start_id": start_id, "method": method}
+    row.update({f"{name}_start": value for name, value in zip(problem.names, problem.to_x(u0).tolist())})
+    row.update(dict(zip(problem.names, problem.to_x(result["u"]).tolist())))
+    row.update(objective=float(objective[0]), heater_power=float(power[0]))
+    row.update({name: float(outputs[name][0]) for name in problem.bands})
+    row.update(in_band=all(abs(outputs[name][0]) <= band for name, band in problem.bands.items()),
+               success=result["success"], message=result["message"], iterations=result["iterations"],
+               evaluations=problem.evaluations - evaluations, seconds=elapsed, pid=os.getpid())
+    return row
+
+
+# --------- engine --------------
+def optimize_setpoints(fmu_path, starts=4, x0=None, bounds=DECISION_BOUNDS, fixed=None, bands=BALANCE_BANDS,
+                       penalty=PENALTY_WEIGHT, method=None, gradient="auto", max_iter=200, workers=None, mode="auto",
+                       in_process=False, seed=0, surrogate=None) -> pd.DataFrame:
+    """Run a multi-start search and return one row per start, best first.
+
+    x0 is a list of warm starts ({name: value}, missing names start in the middle of their
+    bounds); Latin hypercube points fill up to `starts`. method is "lbfgsb" or
+    "projected-gradient", by default L-BFGS-B if scipy is installed. mode="surrogate"
+    searches on the surrogate of surrogate.py (file surrogate, default next to the FMU).
+    """
+    method = method or ("lbfgsb" if minimize is not None else "projected-gradient")
+    if method == "lbfgsb" and minimize is None:
+        raise ImportError("L-BFGS-B needs scipy, use method='projected-gradient'")
+    names = list(bounds)
+    low = np.array([bounds[name][0] for name in names])
+    span = np.array([bounds[name][1] for name in names]) - low
+
+    u_starts = [np.clip((np.array([x.get(name, low[j] + span[j] / 2) for j, name in enumerate(names)]) - low) / span, 0, 1)
+                for x in (x0 or [])]
+    if len(u_starts) < starts:
+        design = latin_hypercube(dict.fromkeys(names, (0.0, 1.0)), starts - len(u_starts), seed)
+        u_starts.extend(design[names].to_numpy())
+    tasks = [(i, u, method, max_iter) for i, u in enumerate(u_starts)]
+
+    problem_kwargs = dict(bounds=bounds, fixed=fixed, bands=bands, penalty=penalty, gradient=gradient)
+    init_args = (fmu_path, mode, in_process, surrogate, problem_kwargs)
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    logger.info(f"{len(tasks)} starts with {method} on {workers} worker(s)")
+
+    t0 = time.perf_counter()
+    if workers == 1:
+        _init_worker(*init_args)
+        try:
+            rows = [_run_start(task) for task in tasks]
+        finally:
+            _worker.pop("evaluator").close()
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init_args) as executor:
+            rows = list(executor.map(_run_start, tasks))
+    elapsed = time.perf_counter() - t0
+
+    results = pd.DataFrame(rows).sort_values(["in_band", "objective"], ascending=[False, True]).reset_index(drop=True)
+    evaluations = int(results["evaluations"].sum())
+    logger.info(f"{evaluations} model evaluations in {elapsed:.2f} s ({evaluations / elapsed:.0f} evaluations/s)")
+    return results
+
+
+# --------- command line --------------
+def _parse_value(spec):
+    """name=value"""
+    name, value = spec.split("=", 1)
+    return name, float(value)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Find regenerator setpoints with minimal heater power within the balance bands")
+    parser.add_argument("--fmu", type=Path, default=FMU_PATH)
+    parser.add_argument("--out", type=Path, default=Path("results/optimize"))
+    parser.add_argument("--starts", type=int, default=4, help="number of starts, warm starts included")
+    parser.add_argument("--x0", action="append", default=[], help="name=value of a warm start")
+    parser.add_argument("--warm-start", type=Path, help="best.json of an earlier run")
+    parser.add_argument("--bounds", action="append", default=[], help="name=low:high of a decision variable (replaces the defaults)")
+    parser.add_argument("--fixed", action="append", default=[], help="name=value of an input that is not optimized, or of a parameter such as rho_air")
+    parser.add_argument("--band", action="append", default=[], help="output=band, |output| <= band")
+    parser.add_argument("--penalty", type=float, default=PENALTY_WEIGHT)
+    parser.add_argument("--method", choices=["lbfgsb", "projected-gradient"], default=None)
+    parser.add_argument("--gradient", choices=["auto", "analytic", "fd"], default="auto")
+    parser.add_argument("--max-iter", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["auto", "vectorized", "fmu", "surrogate"], default="auto")
+    parser.add_argument("--surrogate", type=Path, help="surrogate file for --mode surrogate (default next to the FMU)")
+    parser.add_argument("--in-process", action="store_true", help="run UniFMU Python FMUs in the workers")
+    args = parser.parse_args()
+
+    bounds = dict(parse_bounds(spec) for spec in args.bounds) or DECISION_BOUNDS
+    x0 = []
+    if args.warm_start:
+        x0.append(json.loads(args.warm_start.read_text())["setpoints"])
+    if args.x0:
+        x0.append(dict(_parse_value(spec) for spec in args.x0))
+
+    results = optimize_setpoints(args.fmu.resolve(), args.starts, x0, bounds, dict(_parse_value(spec) for spec in args.fixed),
+                                 {**BALANCE_BANDS, **dict(_parse_value(spec) for spec in args.band)}, args.penalty,
+                                 args.method, args.gradient, args.max_iter, args.workers, args.mode, args.in_process, args.seed,
+                                 args.surrogate)
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    results.to_csv(args.out / "starts.csv", index=False)
+    best = results.iloc[0]
+    (args.out / "best.json").write_text(json.dumps({
+        "setpoints": {name: float(best[name]) for name in bounds},
+        "objective": float(best["objective"]), "heater_power": float(best["heater_power"]), "in_band": bool(best["in_band"]),
+    }, indent=2))
+    print(results.drop(columns=["message", "pid"]).to_string(index=False))
+    print(f"✅ Best setpoints {', '.join(f'{name}={best[name]:.4g}' for name in bounds)} "
+          f"({best['heater_power']:.1f} W{'' if best['in_band'] else ', balances out of band'}) saved to: {args.out}")
@@ -0,0 +1,315 @@
+"""Parameter sweeps of an FMU over its inputs with a process pool.
+
+A design is a DataFrame with one row per scenario and one column per swept variable. The FMU
+is extracted once (fmu_cache.py) and every worker process keeps one instance warm in an
+FMUInstancePool, reused for all of its scenarios. Every completed scenario is recorded in a
+SweepStore directory; running the same sweep again into the same directory skips the
+scenarios that are already stored.
+
+    python UniFMU/parameter_sweep.py --fmu FMUs/ORIGINAL_modified_auto.fmu --out results/sweep \\
+        --grid regen_target_temp=40:80:9 --grid vfr_5=0.05,0.1,0.2
+    python UniFMU/parameter_sweep.py --lhs regen_target_temp=40:80 --lhs temp_1=15:35 --samples 1000
+    python UniFMU/parameter_sweep.py --table scenarios.csv
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import itertools
+import multiprocessing
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from instance_pool import FMUInstancePool
+from fmu_cache import open_cached_fmu
+from result_sinks import open_result_sink, read_part
+from simulate_fmu import simulate_loop
+from inprocess_fmu import declares_step_skipping
+from variable_index import load_variable_index
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_NAMES = ["mass_balance", "energy_balance", "mdot_air_in", "mdot_air_out", "Q_in", "Q_out"]
+
+
+# --------- designs --------------
+def full_grid(levels: dict) -> pd.DataFrame:
+    """Every combination of the given levels, e.g. {"regen_target_temp": [40, 60, 80], "vfr_5": [0.1, 0.2]}."""
+    names = list(levels)
+    rows = list(itertools.product(*(levels[name] for name in names)))
+    return pd.DataFrame(rows, columns=names, dtype=np.float64).rename_axis("scenario_id")
+
+
+def parse_bounds(spec: str) -> tuple:
+    """(name, (low, high)) of a command line bound name=low:high, shared by the design tools."""
+    name, values = spec.split("=", 1)
+    low, high = values.split(":")
+    return name, (float(low), float(high))
+
+
+def latin_hypercube(bounds: dict, n_samples: int, seed=None) -> pd.DataFrame:
+    """Latin hypercube sample of n_samples scenarios within {name: (low, high)}."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, (low, high) in bounds.items():
+        # one point in each of the n_samples strata, strata shuffled independently per variable
+        u = (rng.permutation(n_samples) + rng.random(n_samples)) / n_samples
+        columns[name] = low + u * (high - low)
+    return pd.DataFrame(columns).rename_axis("scenario_id")
+
+
+def table_design(path) -> pd.DataFrame:
+    """Explicit design from a CSV file with one column per variable (an optional scenario_id column is kept)."""
+    design = pd.read_csv(path, float_precision="round_trip")
+    if "scenario_id" in design.columns:
+        design = design.set_index("scenario_id")
+    return design.astype(np.float64).rename_axis("scenario_id")
+
+
+# --------- store --------------
+class SweepStore:
+    """Directory holding the results of one sweep.
+
+        manifest.json     FMU, time grid, swept and recorded columns
+        design.csv        every scenario of the design
+        index.csv         one line per completed scenario: scenario_id, part, elapsed_s, worker
+        results.parquet/  rows [scenario_id, time, inputs..., outputs...] (results.chunks/ without pyarrow)
+
+    A part file is written before the index lines that reference it, so after a crash the
+    index only lists scenarios whose rows are on disk; unreferenced parts are removed on reopen.
+    """
+
+    def __init__(self, directory, manifest: dict, design: pd.DataFrame, fmt=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.directory / "manifest.json"
+        design_path = self.directory / "design.csv"
+        self.index_path = self.directory / "index.csv"
+
+        resume = manifest_path.exists() and self.index_path.exists()
+        if resume:
+            stored = json.loads(manifest_path.read_text())
+            # the default parser of pandas is not exact for float64, round_trip reads back what to_csv wrote
+            stored_design = pd.read_csv(design_path, index_col="scenario_id", float_precision="round_trip")
+            if stored != manifest or not np.array_equal(stored_design.to_numpy(), design.to_numpy()) \
+                    or list(stored_design.columns) != list(design.columns):
+                raise ValueError(f"'{self.directory}' holds a different sweep, choose another output directory")
+        else:
+            manifest_path.write_text(json.dumps(manifest, indent=2))
+            design.to_csv(design_path)
+            self.index_path.write_text("scenario_id,part,elapsed_s,worker\n")
+
+        self.manifest = manifest
+        self.design = design
+        self.index = pd.read_csv(self.index_path)
+        self.sink = open_result_sink(self.directory / "results", ["scenario_id"] + manifest["columns"],
+                                     fmt=fmt or manifest.get("format"), append=resume)
+        if not hasattr(self.sink, "part_path"):
+            raise ValueError(f"A sweep store needs a part directory format (parquet or npz), not {self.sink.format}")
+        if resume:
+            self._remove_orphan_parts()
+
+    def _remove_orphan_parts(self):
+        referenced = set(self.index["part"])
+        for part in range(self.sink.n_parts):
+            if part not in referenced and self.sink.part_path(part).exists():
+                logger.warning(f"Removing part {part} of an interrupted sweep, its scenarios will be run again")
+                self.sink.part_path(part).unlink()
+
+    def completed_ids(self) -> set:
+        return set(self.index["scenario_id"])
+
+    def write(self, runs):
+        """Store runs given as (scenario_id, data, elapsed_s, worker) in one part file."""
+        if not runs:
+            return
+        part = self.sink.n_parts
+        self.sink.write(np.concatenate([np.column_stack([np.full(len(data), sid), data]) for sid, data, _, _ in runs]))
+        lines = [(sid, part, round(elapsed, 6), worker) for sid, _, elapsed, worker in runs]
+        with open(self.index_path, "a") as f:
+            f.writelines(",".join(map(str, line)) + "\n" for line in lines)
+        self.index = pd.concat([self.index, pd.DataFrame(lines, columns=self.index.columns)], ignore_index=True)
+
+    def summary(self) -> pd.DataFrame:
+        """The design with the run metadata of every completed scenario (NaN if not run yet)."""
+        return self.design.join(self.index.set_index("scenario_id"))
+
+    def load(self, scenario_id) -> pd.DataFrame:
+        """Time series [time, inputs..., outputs...] of one scenario."""
+        part = self.index.loc[self.index["scenario_id"] == scenario_id, "part"]
+        if part.empty:
+            raise KeyError(f"Scenario {scenario_id} has not been run")
+        df = read_part(self.sink.part_path(int(part.iloc[0])))
+        return df[df["scenario_id"] == scenario_id].drop(columns="scenario_id").reset_index(drop=True)
+
+    def close(self):
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sweep_store(directory):
+    """Open an existing sweep for reading."""
+    directory = Path(directory)
+    manifest = json.loads((directory / "manifest.json").read_text())
+    design = pd.read_csv(directory / "design.csv", index_col="scenario_id", float_precision="round_trip")
+    return SweepStore(directory, manifest, design)
+
+
+# --------- workers --------------
+_worker = {}
+
+
+def _init_worker(model_description, unzipdir, start_time, stop_time, step_size, in_process, max_uses, skip_unchanged):
+    """Instantiate the FMU once per worker process."""
+    logging.getLogger("inprocess_fmu").setLevel(logging.WARNING)
+    variables = load_variable_index(unzipdir)
+    pool = FMUInstancePool(model_description, unzipdir, max_instances=1, in_process=in_process,
+                           max_uses=max_uses, instance_name=f"sweep{os.getpid()}_")
+    _worker.update(
+        pool=pool,
+        input_vrs=variables.select("input", "Real")[1],
+        output_vrs=[variables.vrs[name] for name in OUTPUT_NAMES],
+        grid=(start_time, stop_time, step_size),
+        skip_unchanged=skip_unchanged,
+    )
+    try:
+        pool.warm()
+    except Exception as e:
+        # a failing initializer makes the pool respawn workers forever, report it from the first task instead
+        _worker["error"] = e
+
+
+def _run_scenario(task):
+    scenario_id, values = task
+    if "error" in _worker:
+        raise RuntimeError(f"FMU could not be instantiated in worker {os.getpid()}") from _worker["error"]
+    grid = _worker["grid"]
+    t0 = time.perf_counter()
+
+    # the pooled instance is reset and initialized with the default start values updated by the scenario
+    with _worker["pool"].checkout(values, start_time=grid[0]) as fmu:
+        data = simulate_loop(fmu, _worker["input_vrs"], _worker["output_vrs"], *grid,
+                             skip_unchanged=_worker["skip_unchanged"])
+    return scenario_id, data, time.perf_counter() - t0, os.getpid()
+
+
+# --------- engine --------------
+def run_sweep(fmu_path, design: pd.DataFrame, out_dir, start_time=0.0, stop_time=10.0, step_size=1.0,
+              workers=None, in_process=False, flush_every=256, progress_interval=5.0, fmt=None,
+              max_uses=None, skip_unchanged=None) -> SweepStore:
+    """Run every scenario of design that is not yet stored in out_dir and return the store.
+
+    Each worker reuses one FMU instance; max_uses replaces it after that many scenarios.
+    The inputs of a scenario are constant, so an FMU that declares step skipping runs only
+    its first step (skip_unchanged=None follows the declaration).
+    """
+    fmu_path = Path(fmu_path).resolve()
+    # extracted once, shared by every worker and by later sweeps of the same FMU
+    model_description, unzipdir = open_cached_fmu(fmu_path)
+    if skip_unchanged is None:
+        skip_unchanged = declares_step_skipping(unzipdir)
+    variables = load_variable_index(unzipdir)
+    input_names = variables.select("input", "Real")[0]
+    unknown = [name for name in design.columns if name not in variables]
+    if unknown:
+        raise ValueError(f"Design variables not found in the FMU: {unknown}")
+
+    manifest = {
+        "fmu": str(fmu_path),
+        "guid": model_description.guid,
+        "start_time": start_time,
+        "stop_time": stop_time,
+        "step_size": step_size,
+        "swept": list(design.columns),
+        "columns": ["time"] + input_names + OUTPUT_NAMES,
+        "format": fmt,
+    }
+    store = SweepStore(out_dir, manifest, design, fmt=fmt)
+
+    done = store.completed_ids()
+    tasks = [(sid, row) for sid, row in zip(design.index.tolist(), design.to_dict("records")) if sid not in done]
+    if done:
+        logger.info(f"Resuming sweep: {len(done)} of {len(design)} scenarios already stored")
+    if not tasks:
+        logger.info("Nothing to do, every scenario is stored")
+        return store
+
+    workers = workers or os.cpu_count()
+    # several scenarios per task amortize the IPC, small enough that all workers stay busy to the end
+    chunksize = max(1, min(64, len(tasks) // (workers * 8)))
+    logger.info(f"Running {len(tasks)} scenarios on {workers} workers (chunksize {chunksize})")
+
+    t0 = last_report = time.perf_counter()
+    pending = []
+    n_done = 0
+    try:
+        with multiprocessing.Pool(workers, _init_worker,
+                                  (model_description, str(unzipdir), start_time, stop_time, step_size, in_process, max_uses,
+                                   skip_unchanged)) as pool:
+            for run in pool.imap_unordered(_run_scenario, tasks, chunksize=chunksize):
+                pending.append(run)
+                n_done += 1
+                if len(pending) >= flush_every:
+                    store.write(pending)
+                    pending = []
+
+                now = time.perf_counter()
+                if now - last_report >= progress_interval or n_done == len(tasks):
+                    rate = n_done / (now - t0)
+                    eta = (len(tasks) - n_done) / rate
+                    logger.info(f"⏳ {n_done}/{len(tasks)} scenarios  {rate:.1f} scenarios/s  ETA {eta:.0f} s")
+                    last_report = now
+    finally:
+        # whatever finished before an interruption is kept and skipped when the sweep is resumed
+        store.write(pending)
+
+    logger.info(f"Sweep finished in {time.perf_counter() - t0:.1f} s, results in {store.directory}")
+    return store
+
+
+# --------- command line --------------
+def _parse_levels(spec):
+    """name=low:high:n (n evenly spaced levels) or name=v1,v2,..."""
+    name, values = spec.split("=", 1)
+    if ":" in values:
+        low, high, n = values.split(":")
+        return name, np.linspace(float(low), float(high), int(n)).tolist()
+    return name, [float(v) for v in values.split(",")]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of an FMU on a process pool")
+    parser.add_argument("--fmu", type=Path, default=Path("FMUs/ORIGINAL_modified_auto.fmu"))
+    parser.add_argument("--out", type=Path, default=Path("results/sweep"))
+    design_group = parser.add_mutually_exclusive_group(required=True)
+    design_group.add_argument("--grid", action="append", help="name=low:high:n or name=v1,v2,... (full grid)")
+    design_group.add_argument("--lhs", action="append", help="name=low:high (Latin hypercube)")
+    design_group.add_argument("--table", type=Path, help="CSV file with one scenario per row")
+    parser.add_argument("--samples", type=int, default=100, help="number of Latin hypercube samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", type=float, default=0.0)
+    parser.add_argument("--stop", type=float, default=10.0)
+    parser.add_argument("--step", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--in-process", action="store_true", help="run UniFMU Python FMUs inside the workers")
+    parser.add_argument("--recycle-after", type=int, default=None, help="replace a worker's FMU instance after N scenarios")
+    args = parser.parse_args()
+
+    if args.grid:
+        design = full_grid(dict(_parse_levels(spec) for spec in args.grid))
+    elif args.lhs:
+        design = latin_hypercube(dict(parse_bounds(spec) for spec in args.lhs), args.samples, args.seed)
+    else:
+        design = table_design(args.table)
+
+    with run_sweep(args.fmu, design, args.out, args.start, args.stop, args.step,
+                   workers=args.workers, in_process=args.in_process, max_uses=args.recycle_after) as store:
+        print(f"✅ {len(store.index)} of {len(design)} scenarios stored in {store.directory}")
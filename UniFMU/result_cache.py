@@ -0,0 +1,151 @@
+"""Persistent cache of simulation results.
+
+A run is identified by the content hash of the .fmu, the start values, the time grid, the
+content hash of the input schedule and the result columns and format. The result of a
+run is stored under <cache>/<sha256 of that key>/ and re-running the same scenario copies
+it back instead of simulating:
+
+    key = result_key(FMU_PATH, start_values, (0.0, 3600.0, 1.0), columns=columns, fmt="parquet")
+    cached = lookup(key)         # path of the stored result or None
+    ...                          # simulate on a miss, then
+    store(key, sink.path, meta)
+
+Entries are written to a private temporary directory and renamed into place, so they are
+always complete. Like the FMU cache (fmu_cache.py, whose eviction it shares) the cache is
+bounded in size and drops its least recently used entries.
+
+    python UniFMU/result_cache.py info
+    python UniFMU/result_cache.py clear
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+
+from fmu_cache import fmu_hash, evict, list_entries
+from result_sinks import SUFFIXES, detect_format
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("UNIFMU_RESULT_CACHE_DIR", Path.home() / ".cache" / "unifmu" / "results"))
+MAX_CACHE_BYTES = int(float(os.getenv("UNIFMU_RESULT_CACHE_MAX_MB", 4096)) * 2**20)
+META_FILE = "meta.json"
+KEY_VERSION = 1  # bump when the meaning of stored results changes
+
+
+def result_key(fmu_path, start_values: dict, grid, inputs=None, interpolation=None, columns=None, fmt=None) -> str:
+    """Cache key of a run, or None if the FMU is an extracted directory (its content is not hashed).
+
+    grid is (start_time, stop_time, step_size) and inputs the path of an input schedule
+    (CSV or .npy), whose content is hashed together with its interpolation.
+    """
+    fmu_path = Path(fmu_path)
+    if not fmu_path.is_file():
+        return None
+    key = {
+        "version": KEY_VERSION,
+        "fmu": fmu_hash(fmu_path),
+        "start_values": {name: float(value) for name, value in sorted(start_values.items())},
+        "grid": [float(value) for value in grid],
+        "inputs": fmu_hash(inputs) if inputs else None,
+        "interpolation": interpolation if inputs else None,
+        "columns": list(columns) if columns else None,
+        "format": fmt,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _stored_result(entry):
+    return next((p for p in entry.iterdir() if p.name.startswith("result")), None)
+
+
+def lookup(key, cache_dir=None):
+    """Path of the stored result for key (a file or a part directory), or None on a miss."""
+    if key is None:
+        return None
+    entry = Path(cache_dir or CACHE_DIR) / key
+    result = _stored_result(entry) if entry.is_dir() else None
+    if result is None:
+        logger.info(f"Result cache miss: {key[:12]}")
+        return None
+    # the modification time of the entry is its last use, for the LRU eviction
+    os.utime(entry)
+    logger.info(f"Result cache hit: {key[:12]} -> {result}")
+    return result
+
+
+def store(key, result_path, meta=None, cache_dir=None, max_bytes=None):
+    """Copy a finished result (file or part directory) into the cache under key."""
+    if key is None:
+        return None
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    result_path = Path(result_path)
+    entry = cache_dir / key
+    if entry.is_dir():
+        return entry
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_dir / f".{key}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    # keep the suffix, the readers of result_sinks.py detect the format from it
+    target = tmp / ("result" + SUFFIXES[detect_format(result_path)])
+    if result_path.is_dir():
+        shutil.copytree(result_path, target)
+    else:
+        shutil.copy2(result_path, target)
+    (tmp / META_FILE).write_text(json.dumps({**(meta or {}), "stored": time.time()}, indent=2, default=str))
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # another process stored the same run meanwhile, both results are identical
+        shutil.rmtree(tmp, ignore_errors=True)
+    logger.info(f"Result cache: stored {key[:12]}")
+
+    evict(cache_dir, MAX_CACHE_BYTES if max_bytes is None else max_bytes, keep=(key,), label="Result cache")
+    return entry
+
+
+def restore(cached_path, result_path):
+    """Copy a cached result to result_path, replacing whatever is there."""
+    result_path = Path(result_path)
+    if result_path.is_dir():
+        shutil.rmtree(result_path)
+    elif result_path.exists():
+        result_path.unlink()
+    if Path(cached_path).is_dir():
+        shutil.copytree(cached_path, result_path)
+    else:
+        shutil.copy2(cached_path, result_path)
+    return result_path
+
+
+def clear(cache_dir=None):
+    """Remove every stored result."""
+    evict(cache_dir or CACHE_DIR, max_bytes=0, grace=0.0, label="Result cache")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Inspect or clean the cache of simulation results")
+    parser.add_argument("command", choices=["info", "clear", "prune"])
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "clear":
+        clear(args.cache_dir)
+    elif args.command == "prune":
+        evict(args.cache_dir, MAX_CACHE_BYTES, label="Result cache")
+
+    entries = list_entries(args.cache_dir)
+    total = sum(size for _, size, _ in entries)
+    print(f"📦 {args.cache_dir}: {len(entries)} results, {total / 2**20:.1f} MiB (limit {MAX_CACHE_BYTES / 2**20:.0f} MiB)")
+    for entry, size, mtime in entries:
+        meta_file = entry / META_FILE
+        meta = json.loads(meta_file.read_text()) if meta_file.is_file() else {}
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime))
+        print(f"   {entry.name[:12]}  {size / 2**20:8.1f} MiB  last used {last_used}  {meta.get('fmu', '')} {meta.get('grid', '')}")
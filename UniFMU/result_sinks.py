@@ -0,0 +1,382 @@
+"""Chunked result sinks for simulation outputs.
+
+Simulation loops hand blocks of float64 rows ([time, variables...]) to a sink instead of
+keeping the whole run in memory. Every block is persisted as soon as it is written:
+
+    parquet  directory of Parquet part files   <stem>.parquet/part-000000.parquet, ...
+    arrow    Arrow IPC stream                  <stem>.arrows
+    npz      directory of compressed NPZ parts <stem>.chunks/part-000000.npz, ...
+    csv      plain text                        <stem>.csv
+
+Part files are written to a temporary name and renamed, so a crash never leaves a
+half-written part behind and readers only ever see complete chunks. Parquet and Arrow
+need pyarrow; without it the NPZ format is used.
+
+    python UniFMU/result_sinks.py export results/simulation_inputs_outputs.parquet
+"""
+import os
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = {"parquet": ".parquet", "arrow": ".arrows", "npz": ".chunks", "csv": ".csv"}
+COLUMNS_FILE = "columns.json"
+
+
+def default_format() -> str:
+    return "parquet" if pa is not None else "npz"
+
+
+def result_path(stem, fmt: str) -> Path:
+    """Path of the result for a stem such as results/simulation_outputs in the given format."""
+    stem = Path(stem)
+    return stem.parent / (stem.name + SUFFIXES[fmt])
+
+
+def detect_format(path) -> str:
+    path = Path(path)
+    for fmt, suffix in SUFFIXES.items():
+        if path.name.endswith(suffix):
+            return fmt
+    raise ValueError(f"Cannot infer the result format of '{path}', expected one of {list(SUFFIXES.values())}")
+
+
+def find_results(stem):
+    """Return the existing result for a stem (any format), or None."""
+    candidates = [result_path(stem, fmt) for fmt in SUFFIXES]
+    existing = [p for p in candidates if p.exists()]
+    return max(existing, key=lambda p: p.stat().st_mtime) if existing else None
+
+
+class ResultSink:
+    """Receives blocks of float64 rows with a fixed list of columns.
+
+    With append=True an existing result with the same columns is continued instead of replaced.
+    """
+
+    format = None
+
+    def __init__(self, path, columns, append=False):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.append = append
+        self.n_rows = 0
+
+    def write(self, block: np.ndarray):
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim != 2 or block.shape[1] != len(self.columns):
+            raise ValueError(f"Expected a block with {len(self.columns)} columns, got shape {block.shape}")
+        if len(block):
+            self._write(block)
+            self.n_rows += len(block)
+
+    def _write(self, block):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _PartDirectorySink(ResultSink):
+    """Every block becomes one immutable part file inside a directory."""
+
+    part_suffix = None
+
+    def __init__(self, path, columns, append=False):
+        super().__init__(path, columns, append)
+        self.path.mkdir(parents=True, exist_ok=True)
+        for tmp in self.path.glob(".part-*.tmp"):
+            tmp.unlink()
+        parts = _part_files(self.path, self.part_suffix)
+        if append and parts:
+            stored = json.loads((self.path / COLUMNS_FILE).read_text())
+            if stored != self.columns:
+                raise ValueError(f"Cannot append to '{self.path}': it holds columns {stored}")
+            self.n_parts = int(parts[-1].name[len("part-"):-len(self.part_suffix)]) + 1
+        else:
+            for stale in parts:
+                stale.unlink()
+            (self.path / COLUMNS_FILE).write_text(json.dumps(self.columns))
+            self.n_parts = 0
+
+    def part_path(self, part: int) -> Path:
+        return self.path / f"part-{part:06d}{self.part_suffix}"
+
+    def _write(self, block):
+        part = self.part_path(self.n_parts)
+        tmp = self.path / f".{part.name}.tmp"
+        self._write_part(tmp, block)
+        os.replace(tmp, part)
+        self.n_parts += 1
+
+    def _write_part(self, path, block):
+        raise NotImplementedError()
+
+
+class ParquetSink(_PartDirectorySink):
+    format = "parquet"
+    part_suffix = ".parquet"
+
+    def __init__(self, path, columns, append=False):
+        if pa is None:
+            raise ImportError("pyarrow is required for the parquet result format")
+        super().__init__(path, columns, append)
+
+    def _write_part(self, path, block):
+        table = pa.Table.from_arrays([pa.array(block[:, j]) for j in range(block.shape[1])], names=self.columns)
+        pq.write_table(table, path, compression="zstd")
+
+
+class NpzChunkSink(_PartDirectorySink):
+    format = "npz"
+    part_suffix = ".npz"
+
+    def _write_part(self, path, block):
+        with open(path, "wb") as f:
+            np.savez_compressed(f, data=block)
+
+
+class ArrowSink(ResultSink):
+    format = "arrow"
+
+    def __init__(self, path, columns, append=False):
+        if pa is None:
+            raise ImportError("pyarrow is required for the arrow result format")
+        if append:
+            raise ValueError("An Arrow IPC stream cannot be appended to, use the parquet or npz format")
+        super().__init__(path, columns)
+        self.schema = pa.schema([(name, pa.float64()) for name in self.columns])
+        self._file = pa.OSFile(str(self.path), "wb")
+        self._writer = pa.ipc.new_stream(self._file, self.schema)
+
+    def _write(self, block):
+        batch = pa.RecordBatch.from_arrays([pa.array(block[:, j]) for j in range(block.shape[1])], schema=self.schema)
+        self._writer.write_batch(batch)
+        self._file.flush()
+
+    def close(self):
+        self._writer.close()
+        self._file.close()
+
+
+class CsvSink(ResultSink):
+    format = "csv"
+
+    def __init__(self, path, columns, append=False):
+        super().__init__(path, columns, append)
+        if append and self.path.exists():
+            stored = pd.read_csv(self.path, nrows=0).columns.tolist()
+            if stored != self.columns:
+                raise ValueError(f"Cannot append to '{self.path}': it holds columns {stored}")
+            self._file = open(self.path, "a", newline="")
+        else:
+            self._file = open(self.path, "w", newline="")
+            self._file.write(",".join(self.columns) + "\n")
+
+    def _write(self, block):
+        pd.DataFrame(block).to_csv(self._file, header=False, index=False)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+SINK_TYPES = {"parquet": ParquetSink, "arrow": ArrowSink, "npz": NpzChunkSink, "csv": CsvSink}
+
+
+def open_result_sink(stem, columns, fmt: str = None, append: bool = False) -> ResultSink:
+    """Open a sink for stem (a path without suffix) in fmt, or the best available columnar format."""
+    fmt = fmt or default_format()
+    if fmt in ("parquet", "arrow") and pa is None:
+        logger.warning(f"pyarrow is not installed, writing results as npz chunks instead of {fmt}")
+        fmt = "npz"
+    return SINK_TYPES[fmt](result_path(stem, fmt), columns, append=append)
+
+
+class ChunkedResultWriter:
+    """Buffers rows in a preallocated chunk and hands full chunks to a sink, so memory stays bounded.
+
+    With flush_interval (seconds) the chunk is also flushed once its oldest row has waited that
+    long, which bounds what a killed run loses when rows arrive slowly (real-time loops).
+    """
+
+    def __init__(self, sink: ResultSink, chunk_rows: int = 65536, flush_interval: float = None):
+        self.sink = sink
+        self.columns = sink.columns
+        self.flush_interval = flush_interval
+        self._index = {name: j for j, name in enumerate(self.columns)}
+        self._buffer = np.full((chunk_rows, len(self.columns)), np.nan)
+        self._n = 0
+        self._oldest = None
+
+    def next_row(self) -> np.ndarray:
+        """Return the buffer row to fill in place; it is committed right away."""
+        if self._n == len(self._buffer) or self._due():
+            self.flush()
+        if self._n == 0:
+            self._oldest = time.monotonic()
+        row = self._buffer[self._n]
+        row[:] = np.nan
+        self._n += 1
+        return row
+
+    def _due(self) -> bool:
+        return self._n > 0 and self.flush_interval is not None \
+            and time.monotonic() - self._oldest >= self.flush_interval
+
+    def append(self, values):
+        self.next_row()[:] = values
+        if self._due():
+            self.flush()
+
+    def append_dict(self, values: dict):
+        """Append a row given as {column: value}; missing columns are stored as NaN."""
+        row = self.next_row()
+        for name, value in values.items():
+            row[self._index[name]] = value
+        if self._due():
+            self.flush()
+
+    def flush(self):
+        if self._n:
+            self.sink.write(self._buffer[:self._n])
+            self._n = 0
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --------- readers --------------
+def _part_files(path, suffix):
+    return sorted(p for p in Path(path).glob(f"part-*{suffix}"))
+
+
+def read_part(part_path, columns=None) -> pd.DataFrame:
+    """Read a single part file of a parquet or npz result directory."""
+    part_path = Path(part_path)
+    if part_path.suffix == ".parquet":
+        return pq.read_table(part_path, columns=columns).to_pandas()
+    with np.load(part_path) as f:
+        df = pd.DataFrame(f["data"], columns=json.loads((part_path.parent / COLUMNS_FILE).read_text()))
+    return df if columns is None else df[columns]
+
+
+def iter_result_chunks(path, csv_chunk_rows: int = 65536):
+    """Yield the stored result as DataFrames, one per chunk, in any supported format."""
+    path = Path(path)
+    fmt = detect_format(path)
+
+    if fmt in ("parquet", "npz"):
+        for part in _part_files(path, "." + fmt):
+            yield read_part(part)
+    elif fmt == "arrow":
+        with pa.OSFile(str(path), "rb") as f:
+            reader = pa.ipc.open_stream(f)
+            while True:
+                try:
+                    batch = reader.read_next_batch()
+                except StopIteration:
+                    break
+                except pa.ArrowInvalid:
+                    # the writer is still running (or crashed) in the middle of a batch
+                    break
+                yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=csv_chunk_rows)
+
+
+def read_results(path) -> pd.DataFrame:
+    chunks = list(iter_result_chunks(path))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+
+def tail_results(path, n_rows: int) -> pd.DataFrame:
+    """The last n_rows of a stored result, reading only the newest parts of a parquet or npz result.
+
+    Safe while the writer is running: only complete parts (or Arrow batches) are read.
+    """
+    path = Path(path)
+    fmt = detect_format(path)
+    if fmt not in ("parquet", "npz"):
+        return read_results(path).tail(n_rows).reset_index(drop=True)
+
+    chunks = []
+    n = 0
+    for part in reversed(_part_files(path, "." + fmt)):
+        if n >= n_rows:
+            break
+        try:
+            chunk = read_part(part)
+        except FileNotFoundError:
+            continue  # replaced by a new run in the meantime
+        chunks.append(chunk)
+        n += len(chunk)
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks[::-1], ignore_index=True).tail(n_rows).reset_index(drop=True)
+
+
+def export_csv(path, csv_path=None) -> Path:
+    """Convert a stored result to CSV chunk by chunk, without loading the whole run.
+
+    A result that already is csv_path is returned as is, opening it for writing would truncate it.
+    """
+    path = Path(path)
+    csv_path = Path(csv_path) if csv_path else path.parent / (path.name[:-len(SUFFIXES[detect_format(path)])] + ".csv")
+    if csv_path.resolve() == path.resolve():
+        logger.info(f"{path} is already a CSV, nothing to export")
+        return csv_path
+    t0 = time.perf_counter()
+    with open(csv_path, "w", newline="") as f:
+        for i, chunk in enumerate(iter_result_chunks(path)):
+            chunk.to_csv(f, header=(i == 0), index=False)
+    logger.info(f"Exported {path} to {csv_path} in {time.perf_counter() - t0:.2f} s")
+    return csv_path
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Inspect or convert chunked simulation results")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write a CSV copy of a result")
+    export.add_argument("path", type=Path)
+    export.add_argument("csv_path", type=Path, nargs="?")
+    info = sub.add_parser("info", help="print rows, columns and size of a result")
+    info.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"✅ CSV written to: {export_csv(args.path, args.csv_path)}")
+    else:
+        df = read_results(args.path)
+        size = sum(p.stat().st_size for p in args.path.rglob("*")) if args.path.is_dir() else args.path.stat().st_size
+        print(f"{args.path}: {len(df)} rows, {len(df.columns)} columns, {size / 2**20:.2f} MiB on disk")
+        print(df.describe().T.to_string())
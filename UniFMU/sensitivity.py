@@ -0,0 +1,253 @@
+"""Global sensitivity of the FMU outputs to its inputs (Morris screening and Sobol indices).
+
+Every input varies over a range (by default its start value +- DEFAULT_RELATIVE_RANGE, or
+--bounds name=low:high); inputs whose start value is 0 stay fixed unless bounds are given.
+The whole design is evaluated in batches by batch_evaluator.py, so a 10 000 sample Sobol
+study of the 18 inputs (200 000 model evaluations) takes seconds with the vectorized model.
+
+    morris  r one-at-a-time trajectories on a p-level grid; mu_star (mean absolute
+            elementary effect) ranks the inputs, sigma shows interactions/non-linearity
+    sobol   Saltelli design with matrices A, B and A_B^(i); first-order indices with the
+            Saltelli (2010) estimator, total indices with the Jansen estimator
+
+Confidence intervals are bootstrapped over trajectories (Morris) or sample rows (Sobol).
+The base samples use scipy's scrambled Sobol sequence when scipy is installed, otherwise
+plain random numbers.
+
+    python UniFMU/sensitivity.py --fmu FMUs/ORIGINAL_modified_auto.fmu --method sobol --n 10000
+    python UniFMU/sensitivity.py --method morris --trajectories 200 --output energy_balance --output mass_balance
+"""
+import time
+import logging
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+
+from batch_evaluator import make_evaluator
+from parameter_sweep import parse_bounds
+
+try:
+    from scipy.stats import qmc
+except ImportError:
+    qmc = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RELATIVE_RANGE = 0.1
+BATCH_SIZE = 100_000
+
+
+# --------- design --------------
+def default_bounds(nominal: dict, relative_range=DEFAULT_RELATIVE_RANGE) -> dict:
+    """{name: (low, high)} of nominal +- relative_range, for the inputs with a non-zero nominal value."""
+    return {name: (value - relative_range * abs(value), value + relative_range * abs(value))
+            for name, value in nominal.items() if value != 0}
+
+
+def unit_samples(n: int, dimensions: int, rng) -> np.ndarray:
+    """(n, dimensions) points in the unit cube, a scrambled Sobol sequence if scipy is available."""
+    if qmc is None:
+        return rng.random((n, dimensions))
+    sampler = qmc.Sobol(dimensions, scramble=True, seed=rng)
+    # balance properties of the Sobol sequence need a power of two, drop the surplus
+    return sampler.random(2 ** int(np.ceil(np.log2(n))))[:n]
+
+
+def evaluate(evaluator, names, bounds, unit: np.ndarray, output_names, batch_size=BATCH_SIZE) -> dict:
+    """Outputs for the rows of unit (points in the unit cube, one column per name), in batches."""
+    low = np.array([bounds[name][0] for name in names])
+    span = np.array([bounds[name][1] for name in names]) - low
+    results = {name: np.empty(len(unit)) for name in output_names}
+    for start in range(0, len(unit), batch_size):
+        block = low + unit[start:start + batch_size] * span
+        outputs = evaluator({name: block[:, j] for j, name in enumerate(names)})
+        for name in output_names:
+            results[name][start:start + len(block)] = outputs[name]
+    return results
+
+
+def _bootstrap_ci(statistic, n: int, n_bootstrap, confidence, rng) -> tuple:
+    """Percentile interval of statistic(indices) over n_bootstrap resamples of range(n)."""
+    indices = rng.integers(0, n, (n_bootstrap, n))
+    values = statistic(indices)
+    alpha = 100 * (1 - confidence) / 2
+    return np.percentile(values, alpha, axis=0), np.percentile(values, 100 - alpha, axis=0)
+
+
+# --------- Morris --------------
+def morris_trajectories(r: int, k: int, levels: int, rng) -> tuple:
+    """(r, k + 1, k) unit-cube points of r trajectories and the (r, k) index of the input changed at each step.
+
+    Each trajectory starts on a random grid point and changes the inputs one at a time in
+    random order by delta = levels / (2 (levels - 1)), upwards where it stays in [0, 1].
+    """
+    delta = levels / (2 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    points = np.empty((r, k + 1, k))
+    points[:, 0] = rng.choice(grid, (r, k))
+    order = np.argsort(rng.random((r, k)), axis=1)
+    rows = np.arange(r)
+    for step in range(k):
+        points[:, step + 1] = points[:, step]
+        current = points[rows, step, order[:, step]]
+        points[rows, step + 1, order[:, step]] = np.where(current + delta <= 1.0, current + delta, current - delta)
+    return points, order
+
+
+def morris(evaluator, bounds: dict, output_names, trajectories=100, levels=4, n_bootstrap=1000, confidence=0.95,
+           seed=0) -> pd.DataFrame:
+    """mu, mu_star (with a bootstrap interval) and sigma of the elementary effects per output and input."""
+    rng = np.random.default_rng(seed)
+    names = list(bounds)
+    k = len(names)
+    points, order = morris_trajectories(trajectories, k, levels, rng)
+    results = evaluate(evaluator, names, bounds, points.reshape(-1, k), output_names)
+
+    rows = np.arange(trajectories)[:, None]
+    steps = np.arange(k)[None, :]
+    # change of the changed input per step, scaled to the input range
+    dx = points[rows, steps + 1, order] - points[rows, steps, order]
+    span = np.array([bounds[name][1] - bounds[name][0] for name in names])
+    frames = []
+    for output in output_names:
+        y = results[output].reshape(trajectories, k + 1)
+        effects = np.empty((trajectories, k))
+        effects[rows, order] = (y[:, 1:] - y[:, :-1]) / dx  # per unit of the normalized input
+        ci_low, ci_high = _bootstrap_ci(lambda idx: np.abs(effects[idx]).mean(axis=1), trajectories, n_bootstrap,
+                                        confidence, rng)
+        frames.append(pd.DataFrame({
+            "output": output, "input": names,
+            "mu": effects.mean(axis=0), "mu_star": np.abs(effects).mean(axis=0),
+            "mu_star_ci_low": ci_low, "mu_star_ci_high": ci_high,
+            "sigma": effects.std(axis=0, ddof=1),
+            "mu_star_per_unit": np.abs(effects).mean(axis=0) / span,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+# --------- Sobol --------------
+def _first_order(f_a, f_b, f_ab, variance):
+    return np.mean(f_b * (f_ab - f_a), axis=-1) / variance
+
+
+def _total(f_a, f_ab, variance):
+    return 0.5 * np.mean((f_a - f_ab) ** 2, axis=-1) / variance
+
+
+def sobol(evaluator, bounds: dict, output_names, n=10_000, n_bootstrap=200, confidence=0.95, seed=0) -> pd.DataFrame:
+    """First-order (S1) and total (ST) Sobol indices with bootstrap intervals, n (k + 2) evaluations."""
+    rng = np.random.default_rng(seed)
+    names = list(bounds)
+    k = len(names)
+    base = unit_samples(n, 2 * k, rng)
+    a, b = base[:, :k], base[:, k:]
+    design = np.empty((k + 2, n, k))
+    design[0], design[1] = a, b
+    for i in range(k):
+        design[2 + i] = a
+        design[2 + i, :, i] = b[:, i]
+
+    t0 = time.perf_counter()
+    results = evaluate(evaluator, names, bounds, design.reshape(-1, k), output_names)
+    logger.info(f"{(k + 2) * n} evaluations in {time.perf_counter() - t0:.2f} s")
+
+    frames = []
+    for output in output_names:
+        y = results[output].reshape(k + 2, n)
+        f_a, f_b, f_ab = y[0], y[1], y[2:]
+        variance = np.var(np.concatenate([f_a, f_b]))
+        if variance == 0:
+            logger.warning(f"{output} does not vary over the input ranges, its indices are undefined")
+
+        def bootstrap(estimator):
+            def statistic(idx):
+                v = np.var(np.concatenate([f_a[idx], f_b[idx]], axis=1), axis=1)
+                return np.stack([estimator(i, idx) / v for i in range(k)], axis=1)
+            return _bootstrap_ci(statistic, n, n_bootstrap, confidence, rng)
+
+        s1_low, s1_high = bootstrap(lambda i, idx: _first_order(f_a[idx], f_b[idx], f_ab[i][idx], 1.0))
+        st_low, st_high = bootstrap(lambda i, idx: _total(f_a[idx], f_ab[i][idx], 1.0))
+        frames.append(pd.DataFrame({
+            "output": output, "input": names,
+            "S1": _first_order(f_a, f_b, f_ab, variance), "S1_ci_low": s1_low, "S1_ci_high": s1_high,
+            "ST": _total(f_a, f_ab, variance), "ST_ci_low": st_low, "ST_ci_high": st_high,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+# --------- report --------------
+def plot_indices(indices: pd.DataFrame, pdf_path):
+    """One page per output with the indices of every input as bars with their intervals, largest first."""
+    keys = ["S1", "ST"] if "ST" in indices else ["mu_star"]
+    with PdfPages(pdf_path) as pdf:
+        for output, frame in indices.groupby("output", sort=False):
+            frame = frame.sort_values(keys[-1], ascending=False)
+            fig, ax = plt.subplots(figsize=(10, 6))
+            x = np.arange(len(frame))
+            width = 0.8 / len(keys)
+            for j, key in enumerate(keys):
+                err = [frame[key] - frame[f"{key}_ci_low"], frame[f"{key}_ci_high"] - frame[key]]
+                ax.bar(x + j * width, frame[key], width, yerr=np.clip(err, 0, None), capsize=2, label=key)
+            ax.set_xticks(x + width * (len(keys) - 1) / 2)
+            ax.set_xticklabels(frame["input"], rotation=45, ha="right")
+            ax.set_title(f"Sensitivity of {output}")
+            ax.legend()
+            ax.grid(True, axis="y")
+            fig.tight_layout()
+            pdf.savefig(fig)
+            plt.close(fig)
+
+
+# --------- command line --------------
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Global sensitivity analysis of the FMU outputs over its inputs")
+    parser.add_argument("--fmu", type=Path, default=Path("FMUs/ORIGINAL_modified_auto.fmu"))
+    parser.add_argument("--out", type=Path, default=Path("results/sensitivity"))
+    parser.add_argument("--method", choices=["sobol", "morris"], default="sobol")
+    parser.add_argument("--output", action="append", help="output to analyse (default energy_balance)")
+    parser.add_argument("--bounds", action="append", default=[], help="name=low:high, replaces the default range of name")
+    parser.add_argument("--relative-range", type=float, default=DEFAULT_RELATIVE_RANGE,
+                        help="default range: start value +- this fraction of it")
+    parser.add_argument("--n", type=int, default=10_000, help="Sobol base samples, n (inputs + 2) evaluations")
+    parser.add_argument("--trajectories", type=int, default=100, help="Morris trajectories")
+    parser.add_argument("--levels", type=int, default=4, help="Morris grid levels")
+    parser.add_argument("--bootstrap", type=int, default=None, help="bootstrap resamples (default 200 Sobol, 1000 Morris)")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["auto", "vectorized", "fmu", "surrogate"], default="auto")
+    parser.add_argument("--surrogate", type=Path, help="surrogate file for --mode surrogate (default next to the FMU)")
+    parser.add_argument("--instances", type=int, default=1, help="FMU instances in fmu mode")
+    parser.add_argument("--in-process", action="store_true", help="run UniFMU Python FMUs in this process")
+    args = parser.parse_args()
+
+    outputs = args.output or ["energy_balance"]
+    evaluator = make_evaluator(args.fmu.resolve(), args.mode, instances=args.instances, in_process=args.in_process,
+                               surrogate=args.surrogate)
+    try:
+        nominal = {name: evaluator.defaults[name] for name in evaluator.input_names}
+        bounds = default_bounds(nominal, args.relative_range)
+        bounds.update(parse_bounds(spec) for spec in args.bounds)
+        fixed = [name for name in evaluator.input_names if name not in bounds]
+        logger.info(f"Varying {len(bounds)} inputs" + (f", fixed at their start value: {', '.join(fixed)}" if fixed else ""))
+
+        t0 = time.perf_counter()
+        if args.method == "sobol":
+            indices = sobol(evaluator, bounds, outputs, args.n, args.bootstrap or 200, args.confidence, args.seed)
+        else:
+            indices = morris(evaluator, bounds, outputs, args.trajectories, args.levels, args.bootstrap or 1000,
+                             args.confidence, args.seed)
+        logger.info(f"{args.method} study finished in {time.perf_counter() - t0:.1f} s")
+    finally:
+        evaluator.close()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    indices.to_csv(args.out / f"{args.method}_indices.csv", index=False)
+    plot_indices(indices, args.out / f"{args.method}_indices.pdf")
+    print(indices.round(4).to_string(index=False))
+    print(f"✅ Sensitivity indices saved to: {args.out}")
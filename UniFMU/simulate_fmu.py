@@ -1,108 +1,243 @@
 import time
-import shutil
 import logging
-import pandas as pd
-from fmpy import read_model_description, extract
-from fmpy.fmi2 import FMU2Slave
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from downsampling import downsample
+from instance_pool import FMUInstancePool
+from result_sinks import open_result_sink, read_results, export_csv, default_format, result_path
+from fmu_cache import open_cached_fmu
+from inprocess_fmu import declares_step_skipping
+from variable_index import load_variable_index
+import result_cache
+from input_schedule import InputSchedule
+
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None  # figures are then rendered one after the other into a single PdfPages
 
 # === CONFIGURATION ===
 FMU_PATH = Path("FMUs/ORIGINAL_modified_auto.fmu").resolve()
-RESULTS_DIR = Path("results")
-RESULTS_DIR.mkdir(exist_ok=True)
+RESULTS_DIR = Path("results")  # created by simulate_fmu(), importing this module has no side effects
 
+RESULTS_STEM = RESULTS_DIR / "simulation_inputs_outputs"
+RESULTS_FORMAT = None  # "parquet", "arrow", "npz" or "csv"; None: parquet if pyarrow is installed, else npz
+CHUNK_ROWS = 65536     # rows kept in memory before they are flushed to the result file
+EXPORT_CSV = False     # also export the results to OUTPUT_CSV
 OUTPUT_CSV = RESULTS_DIR / "simulation_inputs_outputs.csv"
 PLOT_PDF = RESULTS_DIR / "simulation_plots.pdf"
+PLOT_MAX_POINTS = 2000     # samples drawn per trace after downsampling; None draws every sample
+PLOT_DOWNSAMPLING = "lttb"  # "lttb" (keeps the shape) or "minmax" (keeps the envelope)
+PLOT_WORKERS = 2           # figures rendered in parallel processes, pages merged with pypdf
+PLOT_RASTERIZE = False     # draw the lines as an image inside the PDF, for very dense traces
 START_TIME = 0.0
 STOP_TIME = 10.0
 STEP_SIZE = 1.0
+IN_PROCESS = False  # run UniFMU Python FMUs in this process instead of through the UniFMU backend
+INPUT_SCHEDULE = None          # CSV (compiled to a memory-mapped .npy on first use) or .npy with input histories
+INPUT_INTERPOLATION = "linear"  # "linear", "hold", "step" or a {signal: method} dict
+SKIP_UNCHANGED_STEPS = None     # skip doStep while the inputs are unchanged; None: if the FMU declares it algebraic
+RESULT_CACHE = True             # reuse the stored result of an identical earlier run, see result_cache.py
 
 # === LOGGING ===
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def n_communication_points(start_time, stop_time, step_size):
+    """Number of rows recorded for a run that steps while time <= stop_time (both ends included)."""
+    # the small tolerance keeps stop_time in the grid despite rounding, e.g. 0.3 / 0.1
+    return int(np.floor((stop_time - start_time) / step_size + 1e-9)) + 1
+
+
+def simulate_loop(fmu, input_vrs, output_vrs, start_time, stop_time, step_size, sink=None, chunk_rows=CHUNK_ROWS,
+                  schedule=None, skip_unchanged=False, stats=None):
+    """Step an initialized FMU over the time grid, producing float64 rows [time, inputs..., outputs...].
+
+    Rows are written in place into a preallocated array. Without a sink the array covers the
+    whole run and is returned; with a sink it holds chunk_rows rows and every full chunk is
+    handed to sink.write(), so memory stays bounded however long the run is.
+    Without a schedule inputs are never set during the run, so they can only change during
+    initialization: they are read once and broadcast to all rows instead of being fetched
+    every step. A bound InputSchedule sets its signals before every step instead.
+
+    skip_unchanged is only valid for FMUs whose outputs are an algebraic function of their
+    inputs (see inprocess_fmu.declares_step_skipping): a step whose inputs equal those of
+    the last executed step is not sent to the FMU and its outputs are held. The number of
+    steps and skipped steps is added to the stats dict, if given.
+    """
+    n_rows = n_communication_points(start_time, stop_time, step_size)
+    n_inputs = len(input_vrs)
+    chunk_rows = n_rows if sink is None else min(chunk_rows, n_rows)
+
+    data = np.empty((chunk_rows, 1 + n_inputs + len(output_vrs)), dtype=np.float64)
+    data[:, 1:1 + n_inputs] = fmu.getReal(input_vrs)
+    outputs = data[:, 1 + n_inputs:]
+
+    if schedule is not None:
+        # schedule signals that are recorded inputs: position in the schedule -> column in data
+        scheduled = [(k, 1 + input_vrs.index(vr)) for k, vr in enumerate(schedule.vrs) if vr in input_vrs]
+        src, dst = [k for k, _ in scheduled], [j for _, j in scheduled]
+
+    last_outputs = None
+    skipped = 0
+
+    for first in range(0, n_rows, chunk_rows):
+        n = min(chunk_rows, n_rows - first)
+        data[:n, 0] = start_time + step_size * np.arange(first, first + n)
+
+        for i, sim_time in enumerate(data[:n, 0].tolist()):
+            if schedule is None:
+                changed = last_outputs is None
+            elif skip_unchanged:
+                values, changed = schedule.apply_if_changed(sim_time)
+                data[i, dst] = values[src]
+            else:
+                data[i, dst] = schedule.apply(sim_time)[src]
+
+            if skip_unchanged and not changed:
+                outputs[i] = last_outputs
+                skipped += 1
+                continue
+            fmu.doStep(currentCommunicationPoint=sim_time, communicationStepSize=step_size)
+            outputs[i] = last_outputs = fmu.getReal(output_vrs)
+
+        if sink is not None:
+            sink.write(data[:n])
+
+    if stats is not None:
+        stats["steps"] = stats.get("steps", 0) + n_rows
+        stats["skipped"] = stats.get("skipped", 0) + skipped
+    return data if sink is None else None
+
+
 def simulate_fmu():
-    model_description = read_model_description(FMU_PATH)
-    unzipdir = extract(FMU_PATH)
+    RESULTS_DIR.mkdir(exist_ok=True)
+
+    # extracted once per FMU content and reused by later runs, see fmu_cache.py
+    model_description, unzipdir = open_cached_fmu(FMU_PATH)
     logger.info(f"FMU extracted to: {unzipdir}")
 
-    vrs = {v.name: v.valueReference for v in model_description.modelVariables}
+    variables = load_variable_index(unzipdir)
+    vrs = variables.vrs
 
-    input_names = [v.name for v in model_description.modelVariables if v.causality == "input" and v.type == "Real"]
+    input_names, input_vrs = variables.select("input", "Real")
     output_names = ["mass_balance", "energy_balance", "mdot_air_in", "mdot_air_out", "Q_in", "Q_out"]
-    results = []
-
-    try:
-        fmu = FMU2Slave(
-            guid=model_description.guid,
-            unzipDirectory=unzipdir,
-            modelIdentifier=model_description.coSimulation.modelIdentifier,
-            instanceName='instance1'
-        )
-
-        fmu.instantiate()
-        fmu.setupExperiment(startTime=START_TIME)
-        fmu.enterInitializationMode()
-        fmu.exitInitializationMode()
-
-        logger.info("Simulation started")
-        sim_time = START_TIME
-        while sim_time <= STOP_TIME:
-            input_vals = fmu.getReal([vrs[name] for name in input_names])
-            fmu.doStep(currentCommunicationPoint=sim_time, communicationStepSize=STEP_SIZE)
-            output_vals = fmu.getReal([vrs[name] for name in output_names])
-
-            row = {"time": sim_time}
-            row.update(dict(zip(input_names, input_vals)))
-            row.update(dict(zip(output_names, output_vals)))
-            results.append(row)
-
-            sim_time += STEP_SIZE
-
-        fmu.terminate()
-        fmu.freeInstance()
-        logger.info("Simulation completed.")
 
-        df = pd.DataFrame(results)
-        df.to_csv(OUTPUT_CSV, index=False)
-        print(f"✅ Simulation complete. Results saved to: {OUTPUT_CSV}")
+    pool = FMUInstancePool(model_description, unzipdir, instance_name='instance', in_process=IN_PROCESS)
+    schedule = InputSchedule.from_file(INPUT_SCHEDULE, INPUT_INTERPOLATION) if INPUT_SCHEDULE else None
+    skip_unchanged = declares_step_skipping(unzipdir) if SKIP_UNCHANGED_STEPS is None else SKIP_UNCHANGED_STEPS
+    stats = {}
+
+    columns = ["time"] + input_names + output_names
+    results_format = RESULTS_FORMAT or default_format()
+    grid = (START_TIME, STOP_TIME, STEP_SIZE)
+    key = None
+    if RESULT_CACHE:
+        key = result_cache.result_key(FMU_PATH, pool.default_start_values, grid, INPUT_SCHEDULE, INPUT_INTERPOLATION,
+                                      columns, results_format)
+        if key is None:
+            logger.info("Result cache not used: the FMU is an extracted directory")
+    cached = result_cache.lookup(key)
+
+    if cached is not None:
+        results_path = result_cache.restore(cached, result_path(RESULTS_STEM, results_format))
+        pool.close()
+        print(f"✅ Results of an identical earlier run restored from the result cache to: {results_path}")
+    else:
+        # the instance is reset and initialized with the model's start values; call simulate_loop
+        # inside further checkouts to run more scenarios without instantiating the FMU again
+        t0 = time.perf_counter()
+        with pool, pool.checkout(start_time=START_TIME) as fmu:
+            logger.info("Simulation started")
+            with open_result_sink(RESULTS_STEM, columns, RESULTS_FORMAT) as sink:
+                simulate_loop(
+                    fmu,
+                    input_vrs,
+                    [vrs[name] for name in output_names],
+                    START_TIME, STOP_TIME, STEP_SIZE,
+                    sink=sink,
+                    schedule=schedule.bind(fmu, model_description) if schedule else None,
+                    skip_unchanged=skip_unchanged,
+                    stats=stats,
+                )
 
-        plot_results(df, input_names, output_names)
+        logger.info("Simulation completed.")
+        if skip_unchanged:
+            logger.info(f"Skipped {stats['skipped']} of {stats['steps']} steps with unchanged inputs")
+        results_path = sink.path
+        result_cache.store(key, results_path, meta={
+            "fmu": FMU_PATH.name, "grid": grid, "inputs": INPUT_SCHEDULE,
+            "rows": sink.n_rows, "elapsed_s": round(time.perf_counter() - t0, 3),
+        })
+        print(f"✅ Simulation complete. Results saved to: {results_path}")
+
+    # with RESULTS_FORMAT = "csv" the result may already be OUTPUT_CSV
+    if EXPORT_CSV and Path(results_path).resolve() != OUTPUT_CSV.resolve():
+        export_csv(results_path, OUTPUT_CSV)
+        print(f"✅ CSV export saved to: {OUTPUT_CSV}")
+
+    df = read_results(results_path)
+    plot_results(df, input_names, output_names)
+
+def build_figure(title, traces, color=None, rasterize=False):
+    """One subplot per trace, traces is {name: (time, values)}."""
+    fig, axs = plt.subplots(len(traces), 1, figsize=(10, 2 * len(traces)), sharex=True, squeeze=False)
+
+    for ax, (name, (x, y)) in zip(axs[:, 0], traces.items()):
+        ax.plot(x, y, label=name, color=color, rasterized=rasterize)
+        ax.set_ylabel(name)
+        ax.grid(True)
+
+    axs[-1, 0].set_xlabel("Time [s]")
+    fig.suptitle(title)
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    return fig
+
+
+def render_figure(pdf_path, title, traces, color=None, rasterize=False):
+    """Render one figure to a single-page PDF, runs in a worker process."""
+    fig = build_figure(title, traces, color, rasterize)
+    fig.savefig(pdf_path, format="pdf", dpi=150)
+    plt.close(fig)
+    return pdf_path
 
-    finally:
-        shutil.rmtree(unzipdir, ignore_errors=True)
-        logger.info("Temporary files removed.")
 
 def plot_results(df, input_names, output_names):
-    with plt.rc_context({'figure.max_open_warning': 0}):
-        fig_inputs, axs_in = plt.subplots(len(input_names), 1, figsize=(10, 2 * len(input_names)), sharex=True)
-        fig_outputs, axs_out = plt.subplots(len(output_names), 1, figsize=(10, 2 * len(output_names)), sharex=True)
-
-        for i, name in enumerate(input_names):
-            axs_in[i].plot(df["time"], df[name], label=name)
-            axs_in[i].set_ylabel(name)
-            axs_in[i].grid(True)
-
-        axs_in[-1].set_xlabel("Time [s]")
-        fig_inputs.suptitle("Input Variables")
-        fig_inputs.tight_layout(rect=[0, 0.03, 1, 0.95])
-
-        for i, name in enumerate(output_names):
-            axs_out[i].plot(df["time"], df[name], label=name, color="tab:blue")
-            axs_out[i].set_ylabel(name)
-            axs_out[i].grid(True)
-
-        axs_out[-1].set_xlabel("Time [s]")
-        fig_outputs.suptitle("Output Variables")
-        fig_outputs.tight_layout(rect=[0, 0.03, 1, 0.95])
-
-        from matplotlib.backends.backend_pdf import PdfPages
-        with PdfPages(PLOT_PDF) as pdf:
-            pdf.savefig(fig_inputs)
-            pdf.savefig(fig_outputs)
-
-        print(f"📊 Plots saved to: {PLOT_PDF}")
+    time_values = df["time"].to_numpy()
+
+    def traces(names):
+        return {name: downsample(time_values, df[name].to_numpy(), PLOT_MAX_POINTS, PLOT_DOWNSAMPLING) for name in names}
+
+    figures = [
+        ("Input Variables", traces(input_names), None),
+        ("Output Variables", traces(output_names), "tab:blue"),
+    ]
+
+    if PLOT_WORKERS > 1 and PdfWriter is not None:
+        with tempfile.TemporaryDirectory() as tmp, ProcessPoolExecutor(min(PLOT_WORKERS, len(figures))) as executor:
+            pages = executor.map(
+                render_figure,
+                [Path(tmp) / f"page{i}.pdf" for i in range(len(figures))],
+                *zip(*figures),
+                [PLOT_RASTERIZE] * len(figures),
+            )
+            writer = PdfWriter()
+            for page in pages:
+                writer.append(str(page))
+            with open(PLOT_PDF, "wb") as f:
+                writer.write(f)
+    else:
+        with plt.rc_context({'figure.max_open_warning': 0}), PdfPages(PLOT_PDF) as pdf:
+            for title, figure_traces, color in figures:
+                fig = build_figure(title, figure_traces, color, PLOT_RASTERIZE)
+                pdf.savefig(fig)
+                plt.close(fig)
+
+    print(f"📊 Plots saved to: {PLOT_PDF}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     simulate_fmu()
@@ -0,0 +1,230 @@
+"""Polynomial surrogate of the FMU outputs for fast interactive evaluation.
+
+The FMU is sampled over a declared input domain (a Latin hypercube within --bounds, by
+default the start values +- 10 %) with the exact evaluator of batch_evaluator.py, and a
+ridge regression on all monomials of the inputs up to --degree is fitted. A part of the
+samples is held out and never used for fitting; its error is reported per output and
+stored with the surrogate:
+
+    python UniFMU/surrogate.py train --fmu FMUs/ORIGINAL_modified_auto.fmu --samples 20000 --degree 2
+    python UniFMU/surrogate.py info FMUs/ORIGINAL_modified_auto.surrogate.npz
+
+The surrogate is saved as a .npz next to the FMU. SurrogateEvaluator has the batch API of
+the other evaluators and the list API of compute_balances_simplified; the studies opt in
+with --mode surrogate (make_evaluator(..., mode="surrogate")).
+"""
+import time
+import logging
+import argparse
+import itertools
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from batch_evaluator import VectorizedEvaluator, make_evaluator
+from fmu_cache import fmu_hash
+from parameter_sweep import latin_hypercube, parse_bounds
+from sensitivity import DEFAULT_RELATIVE_RANGE, default_bounds
+from simulate_fmu import FMU_PATH
+
+logger = logging.getLogger(__name__)
+
+RIDGE_ALPHAS = (1e-10, 1e-8, 1e-6, 1e-4, 1e-2, 1.0)
+HOLDOUT_FRACTION = 0.2
+
+
+def surrogate_path(fmu_path) -> Path:
+    """Default location of the surrogate of an FMU: FMUs/x.fmu -> FMUs/x.surrogate.npz."""
+    fmu_path = Path(fmu_path)
+    return fmu_path.with_name(fmu_path.stem + ".surrogate.npz")
+
+
+def monomials(k: int, degree: int) -> list:
+    """Index tuples of all monomials of k variables up to degree, () being the constant."""
+    return [term for d in range(degree + 1) for term in itertools.combinations_with_replacement(range(k), d)]
+
+
+def features(z: np.ndarray, terms) -> np.ndarray:
+    """(n, len(terms)) monomials of the scaled inputs z."""
+    out = np.empty((len(z), len(terms)))
+    for j, term in enumerate(terms):
+        column = out[:, j]
+        column[:] = 1.0
+        for i in term:
+            column *= z[:, i]
+    return out
+
+
+def _ridge(X, Y, alpha):
+    """Ridge weights of Y ~ X (the constant column is not penalized)."""
+    penalty = alpha * np.eye(X.shape[1])
+    penalty[0, 0] = 0.0
+    return np.linalg.solve(X.T @ X + penalty, X.T @ Y)
+
+
+def _errors(predicted, exact, output_names) -> pd.DataFrame:
+    residual = predicted - exact
+    variance = exact.var(axis=0)
+    return pd.DataFrame({
+        "rmse": np.sqrt(np.mean(residual ** 2, axis=0)),
+        "max_abs_error": np.abs(residual).max(axis=0),
+        "r2": 1 - np.mean(residual ** 2, axis=0) / np.where(variance > 0, variance, np.nan),
+    }, index=pd.Index(output_names, name="output"))
+
+
+class SurrogateEvaluator(VectorizedEvaluator):
+    """A fitted polynomial surrogate with the API of the vectorized model function.
+
+    evaluator({name: array}) -> {output: array} like the other evaluators, and
+    evaluator.function(inputs) -> list of outputs like compute_balances_simplified.
+    Variables outside the trained domain are held at the values they had in training.
+    """
+
+    def __init__(self, names, low, high, terms, weights, input_names, output_names, defaults, parameter_names=(),
+                 holdout_errors=None, meta=None):
+        super().__init__(self._predict_list, input_names, output_names, defaults, parameter_names)
+        self.names = list(names)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.terms = [tuple(term) for term in terms]
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.holdout_errors = holdout_errors
+        self.meta = meta or {}
+        self._warned = set()
+
+    def _predict_list(self, inputs, **parameters):
+        values = dict(zip(self.input_names, inputs), **parameters)
+        n = max(np.size(value) for value in values.values())
+        x = np.column_stack([np.broadcast_to(np.asarray(values[name], dtype=np.float64), (n,)) for name in self.names])
+        for name, value in values.items():
+            if name not in self.names and name not in self._warned and np.any(np.asarray(value) != self.defaults[name]):
+                logger.warning(f"{name} was fixed at {self.defaults[name]} in training, the surrogate ignores its value")
+                self._warned.add(name)
+        outside = np.any((x < self.low) | (x > self.high), axis=1)
+        if outside.any() and "extrapolation" not in self._warned:
+            logger.warning(f"{int(outside.sum())} of {n} draws lie outside the trained domain, the surrogate extrapolates")
+            self._warned.add("extrapolation")
+        return list(self.predict(x).T)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """(n, outputs) predictions for (n, len(names)) inputs in the order of self.names."""
+        return features(2 * (x - self.low) / (self.high - self.low) - 1, self.terms) @ self.weights
+
+    def save(self, path):
+        term_array = np.full((len(self.terms), max(map(len, self.terms), default=0) or 1), -1, dtype=np.int64)
+        for j, term in enumerate(self.terms):
+            term_array[j, :len(term)] = term
+        errors = self.holdout_errors if self.holdout_errors is not None else pd.DataFrame()
+        np.savez(path, names=np.array(self.names), low=self.low, high=self.high, terms=term_array, weights=self.weights,
+                 input_names=np.array(self.input_names), output_names=np.array(self.output_names),
+                 parameter_names=np.array(self.parameter_names, dtype=str),
+                 default_names=np.array(list(self.defaults), dtype=str), default_values=np.array(list(self.defaults.values())),
+                 error_columns=np.array(errors.columns, dtype=str), errors=errors.to_numpy(dtype=np.float64),
+                 meta_keys=np.array(list(self.meta), dtype=str), meta_values=np.array([str(v) for v in self.meta.values()], dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            terms = [tuple(int(i) for i in row if i >= 0) for row in f["terms"]]
+            output_names = f["output_names"].tolist()
+            errors = pd.DataFrame(f["errors"], columns=f["error_columns"].tolist(),
+                                  index=pd.Index(output_names, name="output")) if f["errors"].size else None
+            return cls(f["names"].tolist(), f["low"], f["high"], terms, f["weights"], f["input_names"].tolist(),
+                       output_names, dict(zip(f["default_names"].tolist(), f["default_values"].tolist())),
+                       f["parameter_names"].tolist(), errors, dict(zip(f["meta_keys"].tolist(), f["meta_values"].tolist())))
+
+
+def train_surrogate(evaluator, bounds: dict, n_samples=20_000, degree=2, alphas=RIDGE_ALPHAS,
+                    holdout=HOLDOUT_FRACTION, seed=0, meta=None) -> SurrogateEvaluator:
+    """Sample bounds with evaluator and fit the surrogate; the ridge alpha is chosen on a validation split.
+
+    The held-out samples are only used for the reported error (surrogate.holdout_errors).
+    """
+    names = list(bounds)
+    low = np.array([bounds[name][0] for name in names], dtype=np.float64)
+    high = np.array([bounds[name][1] for name in names], dtype=np.float64)
+    if np.any(high <= low):
+        raise ValueError("Every bound needs low < high")
+    terms = monomials(len(names), degree)
+    if len(terms) > n_samples * (1 - holdout) / 2:
+        logger.warning(f"{len(terms)} monomials for {n_samples} samples, consider more samples or a lower degree")
+
+    t0 = time.perf_counter()
+    design = latin_hypercube(bounds, n_samples, seed)
+    outputs = evaluator({name: design[name].to_numpy() for name in names})
+    x = design[names].to_numpy()
+    y = np.column_stack([outputs[name] for name in evaluator.output_names])
+    logger.info(f"Sampled {n_samples} points of {len(names)} inputs in {time.perf_counter() - t0:.2f} s")
+
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(n_samples)
+    n_test = int(n_samples * holdout)
+    test, train = order[:n_test], order[n_test:]
+    n_valid = len(train) // 5
+    valid, fit = train[:n_valid], train[n_valid:]
+
+    X = features(2 * (x - low) / (high - low) - 1, terms)
+    scores = {alpha: np.mean((X[valid] @ _ridge(X[fit], y[fit], alpha) - y[valid]) ** 2 / y[valid].var(axis=0).clip(1e-300))
+              for alpha in alphas}
+    alpha = min(scores, key=scores.get)
+    weights = _ridge(X[train], y[train], alpha)
+
+    errors = _errors(X[test] @ weights, y[test], evaluator.output_names)
+    logger.info(f"Fitted {len(terms)} monomials (degree {degree}, alpha {alpha:g}) in {time.perf_counter() - t0:.2f} s")
+    meta = {**(meta or {}), "degree": degree, "alpha": alpha, "samples": n_samples, "holdout": n_test}
+    return SurrogateEvaluator(names, low, high, terms, weights, evaluator.input_names, evaluator.output_names,
+                              dict(evaluator.defaults), getattr(evaluator, "parameter_names", ()), errors, meta)
+
+
+def load_surrogate(path, fmu_path=None) -> SurrogateEvaluator:
+    """Load a surrogate, warning if it was trained on a different version of fmu_path."""
+    surrogate = SurrogateEvaluator.load(path)
+    trained_on = surrogate.meta.get("fmu_sha256")
+    if fmu_path is not None and trained_on and Path(fmu_path).is_file() and fmu_hash(fmu_path) != trained_on:
+        logger.warning(f"{path} was trained on a different version of {fmu_path}, retrain it")
+    return surrogate
+
+
+# --------- command line --------------
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Train or inspect a polynomial surrogate of the FMU")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_parser = sub.add_parser("train", help="sample the FMU and fit a surrogate")
+    train_parser.add_argument("--fmu", type=Path, default=FMU_PATH)
+    train_parser.add_argument("--out", type=Path, help="surrogate file (default next to the FMU)")
+    train_parser.add_argument("--bounds", action="append", default=[], help="name=low:high, replaces the default range of name")
+    train_parser.add_argument("--relative-range", type=float, default=DEFAULT_RELATIVE_RANGE,
+                              help="default domain: start value +- this fraction of it (inputs with start value 0 stay fixed)")
+    train_parser.add_argument("--samples", type=int, default=20_000)
+    train_parser.add_argument("--degree", type=int, default=2)
+    train_parser.add_argument("--seed", type=int, default=0)
+    train_parser.add_argument("--mode", choices=["auto", "vectorized", "fmu"], default="auto", help="exact evaluator to sample")
+    train_parser.add_argument("--instances", type=int, default=1, help="FMU instances in fmu mode")
+    train_parser.add_argument("--in-process", action="store_true", help="run UniFMU Python FMUs in this process")
+    info_parser = sub.add_parser("info", help="print the domain and held-out error of a surrogate")
+    info_parser.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        surrogate = load_surrogate(args.path)
+        print(pd.DataFrame({"low": surrogate.low, "high": surrogate.high}, index=surrogate.names).to_string())
+        print(f"📐 {len(surrogate.terms)} monomials, {surrogate.meta}")
+        print(surrogate.holdout_errors.to_string() if surrogate.holdout_errors is not None else "no held-out error stored")
+        raise SystemExit
+
+    fmu_path = args.fmu.resolve()
+    evaluator = make_evaluator(fmu_path, args.mode, instances=args.instances, in_process=args.in_process)
+    try:
+        nominal = {name: evaluator.defaults[name] for name in evaluator.input_names}
+        bounds = default_bounds(nominal, args.relative_range)
+        bounds.update(parse_bounds(spec) for spec in args.bounds)
+        meta = {"fmu": str(args.fmu), "fmu_sha256": fmu_hash(fmu_path) if fmu_path.is_file() else ""}
+        surrogate = train_surrogate(evaluator, bounds, args.samples, args.degree, seed=args.seed, meta=meta)
+    finally:
+        evaluator.close()
+
+    out = args.out or surrogate_path(args.fmu)
+    surrogate.save(out)
+    print(surrogate.holdout_errors.to_string())
+    print(f"✅ Surrogate saved to: {out}")
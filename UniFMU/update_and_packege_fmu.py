@@ -1,5 +1,6 @@
 import os
 import sys
+import json
 import shutil
 import pickle
 import zipfile
@@ -9,6 +10,7 @@ from pathlib import Path
 SOURCE_FMU = Path("FMUs/ORIGINAL.fmu")              # Original FMU
 MODIFIED_DIR = Path("FMUs/ORIGINAL_modified.fmu")   # Modified FMU folder
 RESOURCE_DIR = MODIFIED_DIR / "resources"
+CALIBRATION_FILE = Path("FMUs/calibrated_parameters.json")  # written by calibrate.py, overrides the parameter defaults
 
 # === Copy original folder ===
 if MODIFIED_DIR.exists():
@@ -35,16 +37,23 @@ initial_values = [
 ]
 outputs = ["mass_balance", "energy_balance", "mdot_air_in", "mdot_air_out", "Q_in", "Q_out"]
 
+# === Parameters (fitted by calibrate.py) ===
+parameters = {"rho_air": 1.2, "Cp_air": 1010.0}
+if CALIBRATION_FILE.is_file():
+    calibrated = json.loads(CALIBRATION_FILE.read_text())["parameters"]
+    parameters.update({name: float(calibrated[name]) for name in parameters if name in calibrated})
+    print(f"📐 Calibrated parameters from {CALIBRATION_FILE}: {parameters}")
+
 # === Generate model.py ===
-assignment_block = "\n        ".join([f"self.{n} = {v}" for n, v in zip(inputs, initial_values)] + [f"self.{n} = 0.0" for n in outputs])
+assignment_block = "\n        ".join([f"self.{n} = {v}" for n, v in zip(inputs, initial_values)] +
+                                   [f"self.{n} = {v}" for n, v in parameters.items()] + [f"self.{n} = 0.0" for n in outputs])
+state_names = inputs + list(parameters) + outputs
 result_block = "\n        ".join([f"self.{n} = results[{i}]" for i, n in enumerate(outputs)])
 
 model_py = f"""from fmi2 import Fmi2FMU, Fmi2Status
 import pickle
 
-def compute_balances_simplified(inputs):
-    rho_air = 1.2
-    Cp_air = 1010
+def compute_balances_simplified(inputs, rho_air={parameters["rho_air"]}, Cp_air={parameters["Cp_air"]}):
     vfr_5 = inputs[8]
     vfr_8 = inputs[11]
     vfr_13 = inputs[17]
@@ -68,19 +77,19 @@ class Model(Fmi2FMU):
         self._update_outputs()
 
     def serialize(self):
-        state = tuple([getattr(self, name) for name in {inputs + outputs}])
+        state = tuple([getattr(self, name) for name in {state_names}])
         return Fmi2Status.ok, pickle.dumps(state)
 
     def deserialize(self, data):
         values = pickle.loads(data)
-        for name, val in zip({inputs + outputs}, values):
+        for name, val in zip({state_names}, values):
             setattr(self, name, val)
         self._update_outputs()
         return Fmi2Status.ok
 
     def _update_outputs(self):
         input_values = [{", ".join(f"self.{n}" for n in inputs)}]
-        results = compute_balances_simplified(input_values)
+        results = compute_balances_simplified(input_values, rho_air=self.rho_air, Cp_air=self.Cp_air)
         {result_block}
 
     def do_step(self, current_time, step_size, no_step_prior):
@@ -103,6 +112,11 @@ xml = '''<?xml version='1.0' encoding='utf-8'?>
     <Category name="logStatusPending" />
     <Category name="logAll" />
   </LogCategories>
+  <VendorAnnotations>
+    <Tool name="unifmu">
+      <StepSkipping algebraic="true" />
+    </Tool>
+  </VendorAnnotations>
   <ModelVariables>
 '''
 
@@ -115,6 +129,11 @@ for i, n in enumerate(outputs, start=len(inputs)):
       <Real />
     </ScalarVariable>\n'''
 
+for i, (n, v) in enumerate(parameters.items(), start=len(inputs) + len(outputs)):
+    xml += f'''    <ScalarVariable name="{n}" valueReference="{i}" causality="parameter" variability="fixed" initial="exact">
+      <Real start="{v}" />
+    </ScalarVariable>\n'''
+
 xml += '''  </ModelVariables>
   <ModelStructure>
     <Outputs>\n'''
@@ -146,6 +165,12 @@ linux = ["python3", "backend_schemaless_rpc.py"]
 macos = ["python3", "backend_schemaless_rpc.py"]
 serialization_format = "Pickle"
 windows = ["{python_exec}", "backend_schemaless_rpc.py"]
+
+# Uncomment to profile the backend (see resources/profiling.py)
+# [profiling]
+# mode = "cprofile"
+# output_dir = "profiles"
+# tracemalloc = false
 """
 
 (RESOURCE_DIR / "launch.toml").write_text(launch_toml.strip())
@@ -157,6 +182,9 @@ fmu_final_path = Path("FMUs/ORIGINAL_modified_auto.fmu")
 
 with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
     for file in MODIFIED_DIR.rglob("*"):
+        # host-side caches such as the variable index are rebuilt from the extracted FMU
+        if file.name.startswith(".variable_index"):
+            continue
         zipf.write(file, arcname=file.relative_to(MODIFIED_DIR))
 
 zip_path.rename(fmu_final_path)
@@ -0,0 +1,173 @@
+"""Compact index of the variables of an FMU.
+
+Every host tool needs the same lookups: name -> value reference, the inputs and outputs in
+declaration order, the start values. The index is built once per extracted FMU straight
+from modelDescription.xml with column arrays and saved next to it as
+.variable_index.npy (the SHA-256 of the XML it was built from, then one structured array,
+so a copy that no longer matches the XML is rebuilt, whatever the file times say), and
+later runs load it in well under a millisecond instead of parsing XML; within one process
+it is memoized:
+
+    variables = load_variable_index(unzipdir)
+    variables.vrs["temp_1"]                     # 3
+    names, vrs = variables.select("input", "Real")
+    variables.by_causality["output"]            # sorted int64 array of value references
+
+    python UniFMU/variable_index.py FMUs/ORIGINAL_modified.fmu --csv variables.csv
+"""
+import os
+import hashlib
+import logging
+import argparse
+import xml.etree.ElementTree as ET
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = ".variable_index.npy"
+COLUMNS = ("name", "vr", "type", "causality", "variability", "start", "has_start", "description")
+FMI2_TYPES = ("Real", "Integer", "Boolean", "String", "Enumeration")
+
+_indexes = {}
+
+
+class VariableIndex:
+    """Column arrays with one entry per model variable, in declaration order."""
+
+    def __init__(self, columns: dict):
+        self.columns = {name: np.asarray(columns[name]) for name in COLUMNS}
+        self.names = self.columns["name"].tolist()
+        self.vrs = dict(zip(self.names, self.columns["vr"].tolist()))
+        causality = self.columns["causality"]
+        self.by_causality = {c: np.sort(self.columns["vr"][causality == c]) for c in np.unique(causality).tolist()}
+        self._selections = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.vrs
+
+    def _mask(self, causality=None, type=None):
+        mask = np.ones(len(self), dtype=bool)
+        if causality is not None:
+            mask &= np.isin(self.columns["causality"], [causality] if isinstance(causality, str) else list(causality))
+        if type is not None:
+            mask &= self.columns["type"] == type
+        return mask
+
+    def select(self, causality=None, type=None):
+        """(names, vrs) of the variables with that causality (a name or a tuple) and type, in declaration order."""
+        key = (causality if causality is None or isinstance(causality, str) else tuple(causality), type)
+        if key not in self._selections:
+            mask = self._mask(causality, type)
+            self._selections[key] = (self.columns["name"][mask].tolist(), self.columns["vr"][mask].tolist())
+        return self._selections[key]
+
+    def start_values(self, causality=("input", "parameter"), type="Real") -> dict:
+        """{name: start} of the selected variables that declare a numeric start value."""
+        mask = self._mask(causality, type) & self.columns["has_start"]
+        return dict(zip(self.columns["name"][mask].tolist(), self.columns["start"][mask].tolist()))
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({name: self.columns[name] for name in COLUMNS})
+
+    @classmethod
+    def from_xml(cls, xml_path):
+        root = ET.parse(xml_path).getroot()
+        fmi3 = root.get("fmiVersion", "2.0").startswith("3")
+        rows = []
+        for v in root.find("ModelVariables"):
+            if fmi3:
+                type_name, typed = v.tag, v
+            else:
+                typed = next((child for child in v if child.tag in FMI2_TYPES), None)
+                if typed is None:
+                    continue
+                type_name = typed.tag
+            start = typed.get("start")
+            try:
+                start_value = float(start) if start is not None else np.nan
+            except ValueError:
+                start_value = np.nan  # strings, or the space separated starts of FMI 3 arrays
+            rows.append((v.get("name"), int(v.get("valueReference")), type_name, v.get("causality", "local"),
+                         v.get("variability", "continuous"), start_value, start is not None and start_value == start_value,
+                         v.get("description", "")))
+
+        names, vrs, types, causalities, variabilities, starts, has_start, descriptions = zip(*rows) if rows else [()] * 8
+        return cls({
+            "name": np.array(names, dtype=str),
+            "vr": np.array(vrs, dtype=np.int64),
+            "type": np.array(types, dtype=str),
+            "causality": np.array(causalities, dtype=str),
+            "variability": np.array(variabilities, dtype=str),
+            "start": np.array(starts, dtype=np.float64),
+            "has_start": np.array(has_start, dtype=bool),
+            "description": np.array(descriptions, dtype=str),
+        })
+
+    def save(self, path, xml_digest: str):
+        table = np.empty(len(self), dtype=[(name, self.columns[name].dtype) for name in COLUMNS])
+        for name in COLUMNS:
+            table[name] = self.columns[name]
+        tmp = Path(path).with_name(f"{Path(path).name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, np.array(xml_digest))
+            np.save(f, table)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, xml_digest: str):
+        """The saved index, or None if it was built from another modelDescription.xml."""
+        with open(path, "rb") as f:
+            if str(np.load(f, allow_pickle=False)) != xml_digest:
+                return None
+            table = np.load(f, allow_pickle=False)
+        return cls({name: table[name] for name in COLUMNS})
+
+
+def load_variable_index(unzipdir) -> VariableIndex:
+    """Index of an extracted FMU, from memory, from .variable_index.npy or built from modelDescription.xml."""
+    unzipdir = Path(unzipdir)
+    xml_path = unzipdir / "modelDescription.xml"
+    index_path = unzipdir / INDEX_FILE
+    # file times do not survive zipping and extracting, the content does
+    xml_digest = hashlib.sha256(xml_path.read_bytes()).hexdigest()
+    key = (unzipdir.resolve(), xml_digest)
+    if key in _indexes:
+        return _indexes[key]
+
+    index = None
+    if index_path.is_file():
+        try:
+            index = VariableIndex.load(index_path, xml_digest)
+        except Exception as e:
+            logger.warning(f"Rebuilding unreadable variable index {index_path}: {e}")
+
+    if index is None:
+        index = VariableIndex.from_xml(xml_path)
+        try:
+            index.save(index_path, xml_digest)
+        except OSError as e:
+            logger.debug(f"Variable index not saved next to the FMU ({e})")
+
+    _indexes[key] = index
+    return index
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Print or export the variables of an extracted FMU")
+    parser.add_argument("unzipdir", type=Path)
+    parser.add_argument("--csv", type=Path, help="write the index as a ;-separated CSV")
+    args = parser.parse_args()
+
+    variables = load_variable_index(args.unzipdir)
+    df = variables.to_frame()
+    if args.csv:
+        df.to_csv(args.csv, sep=";", index=False)
+        print(f"✅ {len(df)} variables written to: {args.csv}")
+    else:
+        print(df.to_string(index=False))
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+from fmpy import read_model_description, extract
+
+import zmq
+
+logger = logging.getLogger(__name__)
+
+# command kinds understood by resources/backend_schemaless_rpc.py
+SET_DEBUG_LOGGING = 0
+SETUP_EXPERIMENT = 1
+FREE_INSTANCE = 2
+ENTER_INITIALIZATION_MODE = 3
+EXIT_INITIALIZATION_MODE = 4
+TERMINATE = 5
+RESET = 6
+SET_XXX = 7
+GET_XXX = 8
+SERIALIZE = 9
+DESERIALIZE = 10
+DO_STEP = 14
+
+FMI2_WARNING = 1
+
+
+class BackendCommandError(Exception):
+    """Raised when the backend answers a command with a status worse than warning."""
+
+    def __init__(self, kind: int, seq: int, status: int):
+        super().__init__(f"command {kind} (sequence number {seq}) failed with status {status}")
+        self.kind = kind
+        self.seq = seq
+        self.status = status
+
+
+class ZmqBackendClient:
+    """Host side of the schemaless (ZMQ) backend of an extracted UniFMU FMU.
+
+    The client launches resources/backend_schemaless_rpc.py itself and performs the handshake
+    the UniFMU binary would do. With pipelined=True the backend uses a ROUTER socket and this
+    client a DEALER socket: every command carries a sequence number, submit() returns
+    immediately and replies are matched by sequence number, so SetReal, DoStep and GetReal
+    can be queued while the backend is still computing. The backend executes them in order.
+    With pipelined=False the classic blocking REQ/REP protocol is used.
+    """
+
+    def __init__(self, unzipdir, pipelined: bool = True, python: str = sys.executable,
+                 max_in_flight: int = 1024, timeout: float = 30.0):
+        self.resources_dir = Path(unzipdir) / "resources"
+        self.pipelined = pipelined
+        self.python = python
+        self.max_in_flight = max_in_flight
+        self.timeout_ms = int(timeout * 1000)
+        self.context = zmq.Context()
+        self.process = None
+        self.socket = None
+        self._next_seq = 0
+        self._pending = {}   # seq -> command kind, for replies not received yet
+        self._replies = {}   # seq -> result, for replies received but not collected yet
+        self._unclaimed = {}  # seq -> command kind, for fire-and-forget commands
+
+    # --------- lifecycle --------------
+    def start(self):
+        handshake_socket = self.context.socket(zmq.PULL)
+        port = handshake_socket.bind_to_random_port("tcp://127.0.0.1")
+
+        env = dict(os.environ, UNIFMU_ZMQ_PIPELINE="1" if self.pipelined else "0")
+        self.process = subprocess.Popen(
+            [self.python, "backend_schemaless_rpc.py", "--handshake-endpoint", f"tcp://127.0.0.1:{port}"],
+            cwd=self.resources_dir,
+            env=env,
+        )
+
+        if not handshake_socket.poll(self.timeout_ms):
+            self.process.kill()
+            raise TimeoutError("the backend did not perform the handshake in time")
+        handshake = json.loads(handshake_socket.recv_string())
+        handshake_socket.close()
+
+        self.socket = self.context.socket(zmq.DEALER if self.pipelined else zmq.REQ)
+        self.socket.connect(handshake["command_endpoint"])
+        logger.info(f"Connected to backend at {handshake['command_endpoint']} (pipelined={self.pipelined})")
+        return self
+
+    def close(self):
+        if self.socket is not None:
+            self.call(FREE_INSTANCE)
+            self.socket.close()
+            self.socket = None
+        if self.process is not None:
+            self.process.wait(timeout=self.timeout_ms / 1000)
+            self.process = None
+        self.context.term()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --------- command queue --------------
+    def submit(self, kind: int, *args, claim: bool = True) -> int:
+        """Queue a command and return its sequence number.
+
+        Commands submitted with claim=False are fire-and-forget: their status is checked when the
+        reply arrives and a BackendCommandError is raised from the submit/result/drain call that
+        receives it.
+        """
+        seq = self._next_seq
+        self._next_seq += 1
+        payload = pickle.dumps((kind, *args), pickle.DEFAULT_PROTOCOL)
+
+        if not claim:
+            self._unclaimed[seq] = kind
+
+        if self.pipelined:
+            while len(self._pending) >= self.max_in_flight:
+                self._receive_one()
+            self.socket.send_multipart([b"", seq.to_bytes(8, "little"), payload])
+            self._pending[seq] = kind
+        else:
+            self.socket.send(payload)
+            self._pending[seq] = kind
+            self._receive_one(seq)
+
+        return seq
+
+    def result(self, seq: int):
+        """Block until the reply of the command with sequence number seq is available and return it."""
+        while seq not in self._replies:
+            if seq not in self._pending:
+                raise KeyError(f"no command with sequence number {seq} is outstanding")
+            self._receive_one()
+        return self._replies.pop(seq)
+
+    def call(self, kind: int, *args):
+        return self.result(self.submit(kind, *args))
+
+    def drain(self):
+        """Wait until every queued command has been executed."""
+        while self._pending:
+            self._receive_one()
+
+    def _receive_one(self, seq=None):
+        if not self.socket.poll(self.timeout_ms):
+            raise TimeoutError(f"no reply from the backend within {self.timeout_ms / 1000} s")
+        if self.pipelined:
+            _, seq_frame, payload = self.socket.recv_multipart()
+            seq = int.from_bytes(seq_frame, "little")
+        else:
+            payload = self.socket.recv()
+        self._pending.pop(seq)
+        result = pickle.loads(payload)
+
+        if seq in self._unclaimed:
+            kind = self._unclaimed.pop(seq)
+            status = result[0] if isinstance(result, tuple) else result
+            if isinstance(status, int) and status > FMI2_WARNING:
+                raise BackendCommandError(kind, seq, status)
+        else:
+            self._replies[seq] = result
+
+    # --------- FMI helpers --------------
+    def setup_experiment(self, start_time=0.0, stop_time=None, tolerance=None):
+        return self.submit(SETUP_EXPERIMENT, start_time, stop_time, tolerance, claim=False)
+
+    def enter_initialization_mode(self):
+        return self.submit(ENTER_INITIALIZATION_MODE, claim=False)
+
+    def exit_initialization_mode(self):
+        return self.submit(EXIT_INITIALIZATION_MODE, claim=False)
+
+    def set_real(self, vrs, values):
+        return self.submit(SET_XXX, list(vrs), [float(v) for v in values], claim=False)
+
+    def do_step(self, current_time, step_size, no_step_prior=False):
+        return self.submit(DO_STEP, current_time, step_size, no_step_prior, claim=False)
+
+    def get_real(self, vrs) -> int:
+        """Queue a GetReal; collect the (status, values) reply with result()."""
+        return self.submit(GET_XXX, list(vrs))
+
+    def terminate(self):
+        return self.submit(TERMINATE, claim=False)
+
+
+# Demo: compare blocking and pipelined execution of the same step sequence
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    fmu_path = Path("FMUs/ORIGINAL_modified_auto.fmu").resolve()
+    n_steps = 10000
+
+    model_description = read_model_description(fmu_path)
+    vrs = {v.name: v.valueReference for v in model_description.modelVariables}
+    input_vrs = [vrs["temp_1"], vrs["vfr_5"]]
+    output_vrs = [vrs["mass_balance"], vrs["energy_balance"]]
+    unzipdir = extract(fmu_path)
+
+    try:
+        for pipelined in (False, True):
+            with ZmqBackendClient(unzipdir, pipelined=pipelined) as client:
+                client.setup_experiment(0.0)
+                client.enter_initialization_mode()
+                client.exit_initialization_mode()
+
+                t0 = time.perf_counter()
+                tickets = []
+                for i in range(n_steps):
+                    client.set_real(input_vrs, [20.0 + i % 10, 0.1])
+                    client.do_step(float(i), 1.0)
+                    tickets.append(client.get_real(output_vrs))
+                outputs = [client.result(ticket)[1] for ticket in tickets]
+                client.terminate()
+                client.drain()
+                elapsed = time.perf_counter() - t0
+
+            print(f"{'pipelined' if pipelined else 'blocking '}: {n_steps} steps in {elapsed:.2f} s "
+                  f"({n_steps / elapsed:.0f} steps/s), last outputs {outputs[-1]}")
+    finally:
+        shutil.rmtree(unzipdir, ignore_errors=True)
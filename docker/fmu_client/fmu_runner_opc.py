@@ -1,12 +1,12 @@
 
 import os
+import json
 import time
 import logging
-import shutil
-import pandas as pd
-from fmpy import read_model_description, extract
-from fmpy.fmi2 import FMU2Slave
 from opcua import Client as OPCClient, ua
+from instance_pool import FMUInstancePool
+from result_sinks import open_result_sink, ChunkedResultWriter
+from fmu_cache import open_cached_fmu
 
 # =====================================================
 # LOGGING CONFIG
@@ -23,6 +23,15 @@ START_TIME = float(os.getenv("START_TIME", 0.0))
 STOP_TIME = float(os.getenv("STOP_TIME", 10.0))
 STEP_SIZE = float(os.getenv("STEP_SIZE", 1.0))
 OPCUA_ENDPOINT = os.getenv("OPCUA_ENDPOINT", "opc.tcp://opcua-server:4840")
+FMU_IN_PROCESS = os.getenv("FMU_IN_PROCESS", "0").lower() in ("1", "true", "yes")
+RESULTS_FORMAT = os.getenv("RESULTS_FORMAT") or None  # parquet, arrow, npz or csv; default parquet
+RESULTS_CHUNK_ROWS = int(os.getenv("RESULTS_CHUNK_ROWS", 4096))
+RESULTS_FLUSH_INTERVAL = float(os.getenv("RESULTS_FLUSH_INTERVAL", 30.0))  # seconds, 0: only full chunks
+RUNNER_MODE = os.getenv("RUNNER_MODE", "once")  # "once": one run and exit, "service": run on every request
+REQUESTS_DIR = os.getenv("REQUESTS_DIR", os.path.join(RESULTS_DIR, "requests"))
+REQUEST_POLL = float(os.getenv("REQUEST_POLL", 0.5))
+POOL_MAX_USES = int(os.getenv("POOL_MAX_USES", 100))      # runs before a warm FMU instance is replaced
+POOL_MAX_IDLE = float(os.getenv("POOL_MAX_IDLE", 600.0))  # seconds before an unused instance is freed
 
 if not os.path.exists(FMU_PATH):
     raise FileNotFoundError(f"FMU_PATH does not exist: {FMU_PATH}")
@@ -36,12 +45,9 @@ if os.path.isdir(FMU_PATH):
 # MAIN FUNCTION
 # =====================================================
 
-def simulate_and_publish():
+def simulate_and_publish(pool, start_time=START_TIME, stop_time=STOP_TIME, step_size=STEP_SIZE):
     """Run FMU simulation and exchange data via OPC UA"""
 
-    # Small delay to ensure the OPC UA server is ready
-    time.sleep(float(os.getenv("OPC_WAIT", 5)))
-
     # -------------------------------------------------
     # CONNECT TO OPC UA SERVER
     # -------------------------------------------------
@@ -106,86 +112,138 @@ def simulate_and_publish():
     # -------------------------------------------------
     # INITIALIZE FMU
     # -------------------------------------------------
-    model_description = read_model_description(FMU_PATH)
-    unzipdir = extract(FMU_PATH)
-    vrs = {v.name: v.valueReference for v in model_description.modelVariables}
-
-    fmu = FMU2Slave(
-        guid=model_description.guid,
-        unzipDirectory=unzipdir,
-        modelIdentifier=model_description.coSimulation.modelIdentifier,
-        instanceName='instance1'
+    vrs = pool.vrs
+
+    # Rows are buffered in a fixed-size chunk and flushed to the result file when it is full or
+    # RESULTS_FLUSH_INTERVAL seconds old; every flush is a complete part the UI can read mid-run
+    results = ChunkedResultWriter(
+        open_result_sink(
+            os.path.join(RESULTS_DIR, "simulation_outputs"),
+            ["time"] + control_vars + aux_vars + calc_vars,
+            RESULTS_FORMAT,
+        ),
+        chunk_rows=RESULTS_CHUNK_ROWS,
+        flush_interval=RESULTS_FLUSH_INTERVAL or None,
     )
 
-    fmu.instantiate()
-    fmu.setupExperiment(startTime=START_TIME)
-    fmu.enterInitializationMode()
-    fmu.exitInitializationMode()
-
     logger.info("🚀 Starting FMU simulation loop")
-    sim_time = START_TIME
-    results = []
+    sim_time = start_time
 
     # -------------------------------------------------
     # SIMULATION LOOP
     # -------------------------------------------------
     try:
-        while sim_time <= STOP_TIME:
-            # Read setpoints and auxiliaries from OPC UA
-            inputs = {}
-            for name, node in {**control_nodes, **aux_nodes}.items():
-                if node is not None:
-                    try:
-                        val = node.get_value()
-                        inputs[name] = float(val)
-                    except Exception as e:
-                        logger.warning(f"Failed to read {name}: {e}")
-
-            # Apply inputs (if variables exist in FMU)
-            for name, val in inputs.items():
-                if name in vrs:
-                    fmu.setReal([vrs[name]], [val])
-
-            # Step simulation
-            fmu.doStep(currentCommunicationPoint=sim_time, communicationStepSize=STEP_SIZE)
-
-            # Read outputs from FMU
-            outputs = {}
-            for name in calc_vars:
-                if name in vrs:
-                    try:
-                        value = float(fmu.getReal([vrs[name]])[0])
-                        outputs[name] = value
-                        if calc_nodes[name] is not None:
-                            calc_nodes[name].set_value(ua.Variant(value, ua.VariantType.Double))
-                    except Exception as e:
-                        logger.warning(f"Failed to update {name}: {e}")
-
-            # Save step result
-            row = {"time": sim_time}
-            row.update(inputs)
-            row.update(outputs)
-            results.append(row)
-
-            logger.info(f"[t={sim_time:.1f}] Outputs: {outputs}")
-            sim_time += STEP_SIZE
-            time.sleep(0.5)
+        # a warm instance from the pool, reset and initialized with the start values of the model
+        with pool.checkout(start_time=start_time) as fmu:
+            while sim_time <= stop_time:
+                # Read setpoints and auxiliaries from OPC UA
+                inputs = {}
+                for name, node in {**control_nodes, **aux_nodes}.items():
+                    if node is not None:
+                        try:
+                            val = node.get_value()
+                            inputs[name] = float(val)
+                        except Exception as e:
+                            logger.warning(f"Failed to read {name}: {e}")
+
+                # Apply inputs (if variables exist in FMU)
+                for name, val in inputs.items():
+                    if name in vrs:
+                        fmu.setReal([vrs[name]], [val])
+
+                # Step simulation
+                fmu.doStep(currentCommunicationPoint=sim_time, communicationStepSize=step_size)
+
+                # Read outputs from FMU
+                outputs = {}
+                for name in calc_vars:
+                    if name in vrs:
+                        try:
+                            value = float(fmu.getReal([vrs[name]])[0])
+                            outputs[name] = value
+                            if calc_nodes[name] is not None:
+                                calc_nodes[name].set_value(ua.Variant(value, ua.VariantType.Double))
+                        except Exception as e:
+                            logger.warning(f"Failed to update {name}: {e}")
+
+                # Save step result
+                row = {"time": sim_time}
+                row.update(inputs)
+                row.update(outputs)
+                results.append_dict(row)
+
+                logger.info(f"[t={sim_time:.1f}] Outputs: {outputs}")
+                sim_time += step_size
+                time.sleep(0.5)
 
         logger.info("✅ Simulation complete.")
 
     finally:
-        fmu.terminate()
-        fmu.freeInstance()
         opc.disconnect()
-        shutil.rmtree(unzipdir, ignore_errors=True)
 
-        # Save results to CSV
-        df = pd.DataFrame(results)
-        csv_path = os.path.join(RESULTS_DIR, "simulation_outputs.csv")
-        df.to_csv(csv_path, index=False)
-        logger.info(f"📊 Results saved to {csv_path}")
+        # Flush the last partial chunk
+        results.close()
+        logger.info(f"📊 Results saved to {results.sink.path} ({results.sink.n_rows} rows)")
+
+
+def serve(pool):
+    """Run a simulation for every request file the UI drops into REQUESTS_DIR, on warm FMU instances.
+
+    A request is claimed by renaming <name>.json to <name>.running and ends up as <name>.done
+    or <name>.failed, so several runners can share the directory.
+    """
+    os.makedirs(REQUESTS_DIR, exist_ok=True)
+    pool.warm()
+    logger.info(f"🟢 FMU instance ready, waiting for run requests in {REQUESTS_DIR}")
+
+    while True:
+        pool.evict_idle()
+        for name in sorted(os.listdir(REQUESTS_DIR)):
+            if not name.endswith(".json"):
+                continue
+            stem = os.path.join(REQUESTS_DIR, name[:-len(".json")])
+            try:
+                os.rename(stem + ".json", stem + ".running")
+            except FileNotFoundError:
+                continue  # claimed by another runner
+
+            status = "done"
+            try:
+                with open(stem + ".running") as f:
+                    request = json.load(f)
+                logger.info(f"▶️ Run request {name}: {request}")
+                simulate_and_publish(
+                    pool,
+                    start_time=float(request.get("start_time", START_TIME)),
+                    stop_time=float(request.get("stop_time", STOP_TIME)),
+                    step_size=float(request.get("step_size", STEP_SIZE)),
+                )
+            except Exception:
+                logger.exception(f"Run request {name} failed")
+                status = "failed"
+            os.replace(stem + ".running", f"{stem}.{status}")
+            logger.info(f"Pool stats: {pool.stats}")
+        time.sleep(REQUEST_POLL)
 
 
 if __name__ == "__main__":
-    simulate_and_publish()
+    # the extraction is cached in UNIFMU_CACHE_DIR (a volume shared by all runs), keyed on the FMU content
+    model_description, unzipdir = open_cached_fmu(FMU_PATH)
+    pool = FMUInstancePool(
+        model_description, unzipdir,
+        instance_name="instance",
+        in_process=FMU_IN_PROCESS,
+        max_uses=POOL_MAX_USES,
+        max_idle=POOL_MAX_IDLE,
+    )
 
+    # Small delay to ensure the OPC UA server is ready
+    time.sleep(float(os.getenv("OPC_WAIT", 5)))
+
+    try:
+        if RUNNER_MODE == "service":
+            serve(pool)
+        else:
+            simulate_and_publish(pool)
+    finally:
+        pool.close()
@@ -1,11 +1,12 @@
 
 import os
+import json
 import time
 import streamlit as st
 from opcua import Client as OPCClient, ua
 import docker
 from datetime import datetime
-import pandas as pd
+from result_sinks import find_results, tail_results
 
 OPCUA_ENDPOINT = os.getenv("OPCUA_ENDPOINT", "opc.tcp://opcua-server:4840")
 DOCKER_NETWORK = os.getenv("DOCKER_NETWORK", "simnet")
@@ -16,6 +17,11 @@ HOST_MODEL_PATH = os.getenv("HOST_FMU_PATH")
 HOST_RESULTS_PATH = os.getenv("HOST_RESULTS_PATH")
 CONT_MODEL_PATH = "/app/model.fmu"
 CONT_RESULTS_PATH = "/results"
+FMU_CACHE_VOLUME = os.getenv("FMU_CACHE_VOLUME", "fmu-cache")
+# 1: send runs to the fmu-client service (RUNNER_MODE=service), which keeps the FMU instantiated
+FMU_RUNNER_SERVICE = os.getenv("FMU_RUNNER_SERVICE", "0").lower() in ("1", "true", "yes")
+REQUESTS_PATH = os.path.join(CONT_RESULTS_PATH, "requests")
+CONT_CACHE_PATH = "/cache"
 
 SHOW_VARS = [
     "energy_balance","mass_balance","mdot_air_in","mdot_air_out","Q_in","Q_out",
@@ -77,11 +83,14 @@ def run_fmu_container(client, stop_time, step_size, start_time=0.0):
         "STOP_TIME": str(stop_time),
         "STEP_SIZE": str(step_size),
         "OPCUA_ENDPOINT": OPCUA_ENDPOINT,
+        "UNIFMU_CACHE_DIR": CONT_CACHE_PATH,
     }
 
     volumes = {
         HOST_MODEL_PATH:   {"bind": CONT_MODEL_PATH,   "mode": "ro"},
         HOST_RESULTS_PATH: {"bind": CONT_RESULTS_PATH, "mode": "rw"},
+        # named volume: runs of the same FMU reuse its extraction instead of unzipping it again
+        FMU_CACHE_VOLUME:  {"bind": CONT_CACHE_PATH,   "mode": "rw"},
     }
 
     container = client.containers.run(
@@ -94,6 +103,16 @@ def run_fmu_container(client, stop_time, step_size, start_time=0.0):
     )
     return container
 
+def request_service_run(stop_time, step_size, start_time=0.0):
+    """Queue a run for the fmu-client service; it picks up <name>.json from the shared results volume."""
+    os.makedirs(REQUESTS_PATH, exist_ok=True)
+    run_name = f"run-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    tmp = os.path.join(REQUESTS_PATH, f".{run_name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump({"start_time": start_time, "stop_time": stop_time, "step_size": step_size}, f)
+    os.replace(tmp, os.path.join(REQUESTS_PATH, f"{run_name}.json"))
+    return run_name
+
 def stop_container(client: docker.DockerClient, name_or_id: str):
     try:
         ct = client.containers.get(name_or_id)
@@ -160,11 +179,15 @@ st.subheader("Run FMU (docker)")
 c1, c2, c3 = st.columns(3)
 if c1.button("▶️ Run"):
     try:
-        ct = run_fmu_container(dock, stop_time=STOP_TIME, step_size=STEP_SIZE, start_time=START_TIME)
-        st.success(f"Launched: {ct.name}")
-        st.session_state["last_run"] = ct.name
-        time.sleep(0.5)
-        st.rerun()
+        if FMU_RUNNER_SERVICE:
+            run_name = request_service_run(stop_time=STOP_TIME, step_size=STEP_SIZE, start_time=START_TIME)
+            st.success(f"Queued on the fmu-client service: {run_name}")
+        else:
+            ct = run_fmu_container(dock, stop_time=STOP_TIME, step_size=STEP_SIZE, start_time=START_TIME)
+            st.success(f"Launched: {ct.name}")
+            st.session_state["last_run"] = ct.name
+            time.sleep(0.5)
+            st.rerun()
     except Exception as e:
         st.error(f"Run error: {e}")
 
@@ -204,12 +227,15 @@ else:
 st.markdown("---")
 st.subheader("📊 Results of the simulation FMU")
 
-csv_path = "/results/simulation_outputs.csv"
+# parquet/arrow/npz chunks written by fmu_runner_opc.py, or a CSV from older runs
+results_path = find_results(os.path.join(CONT_RESULTS_PATH, "simulation_outputs"))
 
-if os.path.exists(csv_path):
+if results_path is not None:
     try:
-        df = pd.read_csv(csv_path)
-        st.success(f"DAta load correctly from `{csv_path}`")
+        # only the newest parts are read, a long run is never loaded as a whole
+        n_rows = st.number_input("Last rows to show", min_value=100, value=10000, step=1000)
+        df = tail_results(results_path, int(n_rows))
+        st.success(f"DAta load correctly from `{results_path}`")
 
         st.dataframe(df)
 
@@ -225,6 +251,6 @@ if os.path.exists(csv_path):
         else:
             st.info("Select one or more variable to plot in the graph.")
     except Exception as e:
-        st.error(f"Error al cargar el CSV: {e}")
+        st.error(f"Error loading the results: {e}")
 else:
     st.warning("⚠️ The results file is not available yet. Run a simulation first.")